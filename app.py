@@ -1,3 +1,4 @@
+import hashlib
 import html
 import io
 import json
@@ -8,9 +9,10 @@ from string import Template
 from urllib.parse import urlencode
 from contextlib import contextmanager, nullcontext
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from time import perf_counter, sleep
-from typing import Optional, List, Dict, Tuple, Iterable, Callable, Any
+from typing import Optional, List, Dict, Tuple, Iterable, Callable, Any, NamedTuple
 
 import streamlit as st
 import streamlit.components.v1 as components
@@ -35,74 +37,57 @@ from core.i18n import (
     language_name,
     t,
 )
-from core.design_tokens import (
-    darken,
-    get_color,
-    get_color_rgb,
-    get_font_stack,
-    get_layout_token,
-    get_plotly_palette,
-    get_typography,
-    hex_to_rgb_tuple,
-    lighten,
-    mix,
-    rgba,
-)
-
-
-PRIMARY_COLOR = get_color("primary")
-PRIMARY_RGB = get_color_rgb("primary")
-PRIMARY_DARK = darken(PRIMARY_COLOR, 0.25)
-PRIMARY_DEEP = darken(PRIMARY_COLOR, 0.4)
-PRIMARY_LIGHT = lighten(PRIMARY_COLOR, 0.25)
-SECONDARY_COLOR = get_color("secondary")
-SECONDARY_RGB = get_color_rgb("secondary")
-SECONDARY_SOFT = lighten(SECONDARY_COLOR, 0.35)
-ACCENT_COLOR = get_color("accent")
-ACCENT_RGB = get_color_rgb("accent")
-ACCENT_SOFT = get_color("accent", "soft")
-ACCENT_SOFT_RGB = get_color_rgb("accent", "soft")
-ACCENT_EMPHASIS = get_color("accent", "emphasis")
-BACKGROUND_COLOR = get_color("background")
-BACKGROUND_MUTED = mix(BACKGROUND_COLOR, get_color("surface_alt"), 0.45)
-SURFACE_COLOR = get_color("surface")
-SURFACE_ALT_COLOR = get_color("surface_alt")
-TEXT_COLOR = get_color("text")
-MUTED_COLOR = get_color("muted")
-BORDER_COLOR = get_color("border")
-BORDER_STRONG = get_color("border", "strong")
-SUCCESS_COLOR = get_color("success")
-SUCCESS_RGB = get_color_rgb("success")
-WARNING_COLOR = get_color("warning")
-WARNING_RGB = get_color_rgb("warning")
-ERROR_COLOR = get_color("error")
-
-body_typography = get_typography("body")
-heading_typography = get_typography("heading")
-numeric_typography = get_typography("numeric")
-BODY_FONT_SIZE = body_typography.get("size_px", {}).get("base", 15)
-BODY_LINE_HEIGHT = body_typography.get("line_height", 1.5)
-HEADING_LINE_HEIGHT = heading_typography.get("line_height", 1.35)
-FONT_BODY = get_font_stack("body")
-FONT_HEADING = get_font_stack("heading")
-FONT_NUMERIC = get_font_stack("numeric")
-PRIMARY_DEEP_RGB = ",".join(str(c) for c in hex_to_rgb_tuple(PRIMARY_DEEP))
-
-card_tokens = get_layout_token("card")
-card_radius_tokens = card_tokens.get("radius_px", {}) if isinstance(card_tokens, dict) else {}
-CARD_RADIUS = card_radius_tokens.get("base", card_radius_tokens.get("min", 10))
-CARD_SHADOW = card_tokens.get("shadow", "0 12px 24px rgba(11,31,59,0.08)") if isinstance(card_tokens, dict) else "0 12px 24px rgba(11,31,59,0.08)"
-if "rgba(" in CARD_SHADOW:
-    CARD_SHADOW = CARD_SHADOW.replace("rgba(11,31,59", f"rgba({PRIMARY_RGB}")
-SPACING_UNIT = get_layout_token("spacing", "unit_px")
-
-px.defaults.color_discrete_sequence = get_plotly_palette()
+from core.design_tokens import design_snapshot, lighten, rgba
+
+
+# トークンの解決はプロセスで1回だけ行い、再実行時は属性を読むだけにする
+_tokens = design_snapshot()
+PRIMARY_COLOR = _tokens.primary_color
+PRIMARY_RGB = _tokens.primary_rgb
+PRIMARY_DARK = _tokens.primary_dark
+PRIMARY_DEEP = _tokens.primary_deep
+PRIMARY_LIGHT = _tokens.primary_light
+SECONDARY_COLOR = _tokens.secondary_color
+SECONDARY_RGB = _tokens.secondary_rgb
+SECONDARY_SOFT = _tokens.secondary_soft
+ACCENT_COLOR = _tokens.accent_color
+ACCENT_RGB = _tokens.accent_rgb
+ACCENT_SOFT = _tokens.accent_soft
+ACCENT_SOFT_RGB = _tokens.accent_soft_rgb
+ACCENT_EMPHASIS = _tokens.accent_emphasis
+BACKGROUND_COLOR = _tokens.background_color
+BACKGROUND_MUTED = _tokens.background_muted
+SURFACE_COLOR = _tokens.surface_color
+SURFACE_ALT_COLOR = _tokens.surface_alt_color
+TEXT_COLOR = _tokens.text_color
+MUTED_COLOR = _tokens.muted_color
+BORDER_COLOR = _tokens.border_color
+BORDER_STRONG = _tokens.border_strong
+SUCCESS_COLOR = _tokens.success_color
+SUCCESS_RGB = _tokens.success_rgb
+WARNING_COLOR = _tokens.warning_color
+WARNING_RGB = _tokens.warning_rgb
+ERROR_COLOR = _tokens.error_color
+
+BODY_FONT_SIZE = _tokens.body_font_size
+BODY_LINE_HEIGHT = _tokens.body_line_height
+HEADING_LINE_HEIGHT = _tokens.heading_line_height
+FONT_BODY = _tokens.font_body
+FONT_HEADING = _tokens.font_heading
+FONT_NUMERIC = _tokens.font_numeric
+PRIMARY_DEEP_RGB = _tokens.primary_deep_rgb
+
+CARD_RADIUS = _tokens.card_radius
+CARD_SHADOW = _tokens.card_shadow
+SPACING_UNIT = _tokens.spacing_unit
+
+px.defaults.color_discrete_sequence = list(_tokens.plotly_palette)
 
 init_language()
 current_language = get_current_language()
 
 PLOTLY_CONFIG = {
-    "locale": "ja",
+    "locale": "ja" if current_language == "ja" else "en",
     "displaylogo": False,
     "scrollZoom": True,
     "doubleClick": "reset",
@@ -118,7 +103,6 @@ PLOTLY_CONFIG = {
     ],
     "toImageButtonOptions": {"format": "png", "filename": "年計比較"},
 }
-PLOTLY_CONFIG["locale"] = "ja" if current_language == "ja" else "en"
 
 ICON_SVGS: Dict[str, str] = {}
 
@@ -170,6 +154,37 @@ MESSAGE_PRESETS: Dict[str, Dict[str, object]] = {
 SPINNER_MESSAGE = str(MESSAGE_PRESETS["loading"]["text"])
 
 
+class _StatusSpec(NamedTuple):
+    component: str
+    text: str
+    action_kind: Optional[str]
+    action_label: Optional[str]
+    guide: Optional[str]
+
+
+def _status_spec(config: Dict[str, object]) -> _StatusSpec:
+    component = str(config.get("component", "info"))
+    action_cfg = config.get("action") or {}
+    label = action_cfg.get("label")
+    kind = action_cfg.get("kind")
+    has_action = bool(label) and kind in {"retry", "modify"}
+    return _StatusSpec(
+        component=component if component in {"warning", "error", "success"} else "info",
+        text=str(config.get("text", "")),
+        action_kind=kind if has_action else None,
+        action_label=str(label) if has_action else None,
+        guide=config.get("guide"),
+    )
+
+
+# 表示系の状態だけを事前に解決しておく（スピナーは loading_message 側で扱う）
+STATUS_SPECS: Dict[str, _StatusSpec] = {
+    state: _status_spec(config)
+    for state, config in MESSAGE_PRESETS.items()
+    if config.get("component") != "spinner"
+}
+
+
 CATEGORY_LOOKUP: Dict[str, str] = {
     "スタンダードプラン": "サブスクリプション",
     "プレミアムプラン": "サブスクリプション",
@@ -738,45 +753,23 @@ def render_status_message(
 ) -> None:
     """Render status feedback based on the shared message dictionary."""
 
-    config = MESSAGE_PRESETS.get(state)
-    if not config:
-        return
-    component = str(config.get("component", "info"))
-    if component == "spinner":
-        # Use the loading_message context manager for spinners.
+    spec = STATUS_SPECS.get(state)
+    if spec is None:
+        # Unknown states and spinners (see loading_message) render nothing here.
         return
-    message = str(config.get("text", ""))
     container = st.container()
-    if component == "warning":
-        container.warning(message)
-    elif component == "error":
-        container.error(message)
-    elif component == "success":
-        container.success(message)
-    else:
-        container.info(message)
+    getattr(container, spec.component)(spec.text)
 
-    action_cfg = config.get("action") or {}
-    label = action_cfg.get("label")
-    kind = action_cfg.get("kind")
-    if label and kind in {"retry", "modify"}:
-        btn_key = f"{key or state}_action"
-        if kind == "retry":
-            container.button(
-                str(label),
-                key=btn_key,
-                on_click=on_retry,
-                disabled=(on_retry is None) or disable_actions,
-            )
-        elif kind == "modify":
-            container.button(
-                str(label),
-                key=btn_key,
-                on_click=on_modify,
-                disabled=(on_modify is None) or disable_actions,
-            )
-
-    final_guide = guide or config.get("guide")
+    if spec.action_kind is not None:
+        callback = on_retry if spec.action_kind == "retry" else on_modify
+        container.button(
+            spec.action_label,
+            key=f"{key or state}_action",
+            on_click=callback,
+            disabled=(callback is None) or disable_actions,
+        )
+
+    final_guide = guide or spec.guide
     if final_guide:
         container.caption(str(final_guide))
 
@@ -802,6 +795,27 @@ def compat_modal(title: str, *, key: Optional[str] = None, **kwargs):
         yield fallback_container
 
 
+def compat_fragment(func):
+    """Scope widget reruns to ``func`` on Streamlit versions with fragments."""
+
+    fragment_fn = getattr(st, "fragment", None) or getattr(
+        st, "experimental_fragment", None
+    )
+    if callable(fragment_fn):
+        return fragment_fn(func)
+    return func
+
+
+def compat_html(body: str) -> None:
+    """Emit raw HTML without the markdown pass when ``st.html`` is available."""
+
+    html_fn = getattr(st, "html", None)
+    if callable(html_fn):
+        html_fn(body)
+    else:
+        st.markdown(body, unsafe_allow_html=True)
+
+
 def render_icon_label(
     icon_key: str,
     primary: str,
@@ -809,44 +823,7 @@ def render_icon_label(
     *,
     help_text: Optional[str] = None,
 ) -> None:
-    icon_html = icon_svg(icon_key)
-    icon_block = ""
-    if icon_html:
-        icon_block = (
-            "<span class='mck-inline-label__icon' aria-hidden='true'>{}</span>".format(
-                icon_html
-            )
-        )
-    primary_html = html.escape(primary)
-    secondary_html = (
-        f"<span class='mck-inline-label__secondary'>{html.escape(secondary)}</span>"
-        if secondary
-        else ""
-    )
-    help_html = ""
-    if help_text:
-        tooltip = html.escape(help_text).replace("\n", "&#10;")
-        help_html = (
-            "<span class='mck-inline-label__help' tabindex='0' aria-label='ヘルプ' "
-            f"data-tooltip='{tooltip}'>?</span>"
-        )
-    st.markdown(
-        """
-        <div class="mck-inline-label mck-animated">
-          {icon}
-          <div class="mck-inline-label__texts">
-            <span class="mck-inline-label__primary">{primary}</span>
-            {secondary}
-          </div>
-          {help}
-        </div>
-        """.format(icon=icon_block, primary=primary_html, secondary=secondary_html, help=help_html),
-        unsafe_allow_html=True,
-    )
-
-
-def _chunk_list(items: List[Dict[str, object]], size: int) -> List[List[Dict[str, object]]]:
-    return [items[i : i + size] for i in range(0, len(items), size)]
+    compat_html(inline_label_html(primary, secondary, help_text, icon_svg(icon_key)))
 
 
 def detect_metric_icon(name: str) -> str:
@@ -860,129 +837,99 @@ def render_metric_cards(
 ) -> None:
     if not cards:
         return
-    rows = _chunk_list(cards, columns)
-    for row in rows:
-        cols = st.columns(len(row))
-        for col, card in zip(cols, row):
-            icon_html = icon_svg(str(card.get("icon", "")))
-            icon_block = ""
-            if icon_html:
-                icon_block = (
-                    "<span class='mck-metric-card__icon' aria-hidden='true'>{}</span>".format(
-                        icon_html
-                    )
-                )
-            title_text = str(card.get("title", "指標"))
-            title = html.escape(title_text)
-            subtitle = card.get("subtitle")
-            subtitle_html = (
-                f"<span class='mck-metric-card__subtitle'>{html.escape(str(subtitle))}</span>"
-                if subtitle
-                else ""
-            )
-            value = html.escape(str(card.get("value", "—")))
-            footnote = card.get("footnote")
-            footnote_html = (
-                f"<div class='mck-metric-card__footnote'>{html.escape(str(footnote))}</div>"
-                if footnote
-                else ""
-            )
-            tooltip_raw = card.get("tooltip") or footnote
-            tooltip_text = str(tooltip_raw) if tooltip_raw is not None else ""
-            tooltip_attr = ""
-            aria_attr = ""
-            tab_attr = ""
-            info_html = ""
-            classes = ["mck-metric-card", "mck-animated"]
-            if tooltip_text.strip():
-                tooltip_attr = (
-                    " data-tooltip=\""
-                    + html.escape(tooltip_text, quote=True).replace("\n", "&#10;")
-                    + "\""
-                )
-                aria_label = f"{title_text}: {tooltip_text.replace('\n', ' ')}".strip()
-                aria_attr = f" aria-label=\"{html.escape(aria_label, quote=True)}\""
-                tab_attr = " tabindex=\"0\""
-                classes.append("has-tooltip")
-                info_symbol = icon_svg("info") or "ℹ"
-                info_html = (
-                    f"<span class='mck-metric-card__info' aria-hidden='true'>{info_symbol}</span>"
-                )
-            class_attr = " ".join(classes)
-            with col:
-                card_html = textwrap.dedent(
-                    """
-                    <div class="{classes}" role="group"{tooltip}{tab}{aria}>
-                      <div class="mck-metric-card__header">
-                        {icon}
-                        <div class="mck-metric-card__title-group">
-                          <div class="mck-metric-card__title">{title}</div>
-                          {subtitle}
-                        </div>
-                        {info}
-                      </div>
-                      <div class="mck-metric-card__value">{value}</div>
-                      {footnote}
-                    </div>
-                    """
-                ).format(
-                    classes=class_attr,
-                    tooltip=tooltip_attr,
-                    tab=tab_attr,
-                    aria=aria_attr,
-                    icon=icon_block,
-                    title=title,
-                    subtitle=subtitle_html,
-                    info=info_html,
-                    value=value,
-                    footnote=footnote_html,
-                ).strip()
-                st.html(card_html)
-
-
-def render_metric_bar_chart(metrics_list: List[Dict[str, object]]) -> None:
+    info_symbol = icon_svg("info") or "ℹ"
+    card_blocks = []
+    for card in cards:
+        subtitle = card.get("subtitle")
+        footnote = card.get("footnote")
+        tooltip_raw = card.get("tooltip") or footnote
+        card_blocks.append(
+            metric_card_html(
+                str(card.get("title", "指標")),
+                str(card.get("value", "—")),
+                subtitle=str(subtitle) if subtitle else "",
+                footnote=str(footnote) if footnote else "",
+                tooltip=str(tooltip_raw) if tooltip_raw is not None else "",
+                icon_html=icon_svg(str(card.get("icon", ""))),
+                info_symbol=info_symbol,
+            )
+        )
+    # カードごとに st.columns/st.html を使わず、CSS グリッド1要素でまとめて送る
+    compat_html(
+        f"<div class='mck-metric-grid' style='--mck-grid-cols:{max(1, int(columns))}'>"
+        + "".join(card_blocks)
+        + "</div>"
+    )
+
+
+def render_metric_bar_chart(
+    metrics_list: List[Dict[str, object]],
+    displays: Optional[List[str]] = None,
+) -> None:
+    """推奨KPIを正規化した横棒で表示する。
+
+    ``displays`` には ``format_template_metric`` 済みの表示値（``metrics_list``
+    と同順）を渡せる。カード描画で整形した文字列をそのまま棒ラベルに使う。
+    """
     if not metrics_list:
         return
-    chart_records: List[Dict[str, object]] = []
-    for metric in metrics_list:
-        value = metric.get("value")
-        if not isinstance(value, (int, float)):
-            continue
-        unit = metric.get("unit", "")
-        numeric = float(value)
-        if unit == "%":
-            numeric *= 100
-        chart_records.append(
+    if displays is None:
+        displays = [format_template_metric(metric) for metric in metrics_list]
+    numeric_pos = [
+        i
+        for i, metric in enumerate(metrics_list)
+        if isinstance(metric.get("value"), (int, float))
+    ]
+    if not numeric_pos:
+        return
+    numeric_metrics = [metrics_list[i] for i in numeric_pos]
+    theme = ui_theme
+    # テンプレートを選び直さない限り同じ図になるので、値と表示文字列・テーマで使い回す
+    chart_key = (
+        tuple(
+            (metric.get("name", "指標"), metric["value"], metric.get("unit", ""))
+            for metric in numeric_metrics
+        ),
+        tuple(displays[i] for i in numeric_pos),
+        theme,
+        bool(st.session_state.get("elegant_on", True)),
+    )
+
+    def build() -> Optional[go.Figure]:
+        normalized = np.array([metric["value"] for metric in numeric_metrics], dtype=float)
+        is_percent = np.array([metric.get("unit", "") == "%" for metric in numeric_metrics])
+        normalized[is_percent] *= 100
+        max_abs = float(np.abs(normalized).max())
+        if not math.isfinite(max_abs) or max_abs <= 0:
+            return None
+        normalized /= max_abs
+        # 数本の棒だけなので px.bar を介さず、トレースとレイアウトを辞書で一度に渡す
+        fig = go.Figure(
             {
-                "Metric": metric.get("name", "指標"),
-                "Normalized": numeric,
-                "Display": format_template_metric(metric),
+                "data": [
+                    {
+                        "type": "bar",
+                        "orientation": "h",
+                        "y": [metric.get("name", "指標") for metric in numeric_metrics],
+                        "x": normalized.tolist(),
+                        "text": [displays[i] for i in numeric_pos],
+                        "textposition": "outside",
+                    }
+                ],
+                "layout": {
+                    "title": {"text": "推奨KPIプレビュー（単位差を正規化）"},
+                    "xaxis": {"showticklabels": False, "title": {"text": ""}},
+                    "yaxis": {"title": {"text": ""}},
+                    "height": 280,
+                    "margin": {"l": 10, "r": 10, "t": 46, "b": 30},
+                },
             }
         )
-    if not chart_records:
-        return
-    chart_df = pd.DataFrame(chart_records)
-    max_abs = chart_df["Normalized"].abs().max()
-    if not math.isfinite(max_abs) or max_abs <= 0:
+        return apply_elegant_theme(fig, theme=theme)
+
+    fig = session_memo("kpi_preview_chart_memo", chart_key, build)
+    if fig is None:
         return
-    chart_df["Normalized"] = chart_df["Normalized"] / max_abs
-    fig = px.bar(
-        chart_df,
-        y="Metric",
-        x="Normalized",
-        orientation="h",
-        text="Display",
-        title="推奨KPIプレビュー（単位差を正規化）",
-    )
-    fig.update_traces(textposition="outside")
-    fig.update_layout(
-        xaxis_title="",
-        yaxis_title="",
-        xaxis=dict(showticklabels=False),
-        height=280,
-        margin=dict(l=10, r=10, t=46, b=30),
-    )
-    fig = apply_elegant_theme(fig, theme=st.session_state.get("ui_theme", "light"))
     render_plotly_with_spinner(
         fig, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
     )
@@ -1006,42 +953,17 @@ def render_quality_summary_panel(summary: Dict[str, object]) -> None:
         icon_text = "!"
     else:
         icon_text = "!"
-    icon_block = ""
-    if icon_text:
-        icon_block = (
-            "<div class='mck-alert__icon' aria-hidden='true'>{}</div>".format(
-                html.escape(icon_text)
-            )
+    compat_html(
+        quality_summary_html(
+            level,
+            icon_text,
+            completeness * 100,
+            missing,
+            total,
+            sku_count,
+            str(period_start),
+            str(period_end),
         )
-    completeness_pct = completeness * 100
-    st.markdown(
-        """
-        <div class="mck-alert mck-alert--{level} mck-animated">
-          {icon}
-          <div class="mck-alert__content">
-            <strong>データ品質サマリー</strong>
-            <p>欠測セルと期間を自動チェックしました。下記を確認して次のステップへ進んでください。</p>
-            <div class="mck-progress">
-              <div class="mck-progress__bar" style="width:{width:.1f}%;"></div>
-            </div>
-            <div class="mck-progress__meta">完全性 {width:.1f}% ｜ 欠測 {missing:,} / {total:,}</div>
-            <ul class="mck-alert__meta">
-              <li>SKU数 {sku:,}</li>
-              <li>期間 {start} 〜 {end}</li>
-            </ul>
-          </div>
-        </div>
-        """.format(
-            level=level,
-            icon=icon_block,
-            width=completeness_pct,
-            missing=missing,
-            total=total,
-            sku=sku_count,
-            start=html.escape(str(period_start)),
-            end=html.escape(str(period_end)),
-        ),
-        unsafe_allow_html=True,
     )
 
 APP_TITLE = t("header.title", language=current_language)
@@ -1050,7 +972,20 @@ st.set_page_config(
 )
 
 
-@st.cache_data(ttl=600)
+def _frame_digest(df: pd.DataFrame) -> bytes:
+    """AI キャッシュ用に、列名と全セル（インデックス込み）の行ハッシュから要約値を作る。"""
+
+    row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    digest = hashlib.blake2b(row_hashes.tobytes(), digest_size=16)
+    digest.update(repr((tuple(df.columns), tuple(map(str, df.dtypes)))).encode())
+    return digest.digest()
+
+
+# DataFrame 引数はセルを C 実装の行ハッシュ1回で要約し、Streamlit 既定の汎用ハッシュを通さない
+_AI_FRAME_HASH = {pd.DataFrame: _frame_digest}
+
+
+@st.cache_data(ttl=600, hash_funcs=_AI_FRAME_HASH)
 def _ai_sum_df(df: pd.DataFrame) -> str:
     return summarize_dataframe(df)
 
@@ -1075,11 +1010,40 @@ def _ai_answer(question: str, context: str) -> str:
     return answer_question(question, context)
 
 
-@st.cache_data(ttl=600)
+@st.cache_data(ttl=600, hash_funcs=_AI_FRAME_HASH)
 def _ai_anomaly_report(df: pd.DataFrame) -> str:
     return generate_anomaly_brief(df)
 
 
+def render_ai_summary_on_demand(
+    key: str, signature: Tuple[Any, ...], metrics: Optional[Dict[str, float]]
+) -> None:
+    """AIサマリーをボタン押下時だけ生成し、条件が同じ間は結果を表示し続ける。"""
+
+    state_key = f"{key}_result"
+
+    def _generate() -> None:
+        st.session_state[state_key] = (signature, _ai_explain(metrics))
+
+    st.button(
+        "AIサマリーを生成",
+        key=f"{key}_gen",
+        on_click=_generate,
+        disabled=not metrics,
+        help="要約・コメント・自動説明を生成（押したときだけ計算）",
+    )
+    cached = st.session_state.get(state_key)
+    if cached and cached[0] == signature:
+        st.info(cached[1])
+
+
+@st.cache_data(ttl=600)
+def _year_sum_histogram(values: np.ndarray, unit: str) -> go.Figure:
+    fig = px.histogram(x=values)
+    fig.update_xaxes(title_text=f"年計（{unit}）")
+    return fig
+
+
 from services import (
     parse_uploaded_table,
     fill_missing_months,
@@ -1093,12 +1057,16 @@ from services import (
     latest_yearsum_snapshot,
     resolve_band,
     filter_products_by_band,
+    snapshot_arrays,
+    sku_metric_block,
+    top_k_codes,
     get_yearly_series,
     top_growth_codes,
+    year_sum_matrix,
+    YearSumMatrix,
     trend_last6,
     slopes_snapshot,
     shape_flags,
-    detect_linear_anomalies,
     normalize_month_key,
 )
 from sample_data import (
@@ -1109,20 +1077,35 @@ from sample_data import (
     load_sample_dataset,
 )
 from core.chart_card import toolbar_sku_detail, build_chart_card
-from core.plot_utils import apply_elegant_theme, render_plotly_with_spinner
+from core.plot_utils import (
+    apply_elegant_theme,
+    corr_heatmap,
+    render_plotly_with_spinner,
+)
 from core.correlation import (
+    corr_matrix,
     corr_table,
     fisher_ci,
     fit_line,
+    largest_residuals,
     maybe_log1p,
     narrate_top_insights,
     winsorize_frame,
 )
-from core.product_clusters import render_correlation_category_module
+from core.anomaly import rolling_anomaly
+from core.export import to_csv_bytes, to_parquet_bytes
+from core.html_blocks import (
+    inline_label_html,
+    metric_card_html,
+    minify_css,
+    minify_style_blocks,
+    quality_summary_html,
+    section_header_html,
+    tour_banner_html,
+)
 
 # Brand-aligned light theme baseline
-st.markdown(
-    """
+BASE_CSS = """
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@400;500;700&display=swap');
 :root{
@@ -1627,6 +1610,16 @@ small, .text-small{
   width:22px !important;
   height:22px !important;
 }
+.mck-metric-grid{
+  display:grid;
+  grid-template-columns:repeat(var(--mck-grid-cols,3),minmax(0,1fr));
+  gap:1rem;
+}
+@media (max-width: 767px){
+  .mck-metric-grid{
+    grid-template-columns:minmax(0,1fr);
+  }
+}
 .mck-metric-card{
   border-radius:18px;
   border:1px solid var(--border);
@@ -1638,6 +1631,10 @@ small, .text-small{
   gap:0.4rem;
   min-height:150px;
 }
+.mck-metric-card:not(.has-tooltip){
+  content-visibility:auto;
+  contain-intrinsic-size:auto 150px;
+}
 .mck-metric-card__icon{
   width:26px;
   height:26px;
@@ -1702,6 +1699,12 @@ small, .text-small{
   font-size:0.78rem;
   color:var(--muted);
 }
+</style>
+"""
+
+# 初期表示に要らない規則（アラート・進捗バー・ツアー・チャートカード等）。
+# 静的ファイルとして配信し、再実行ごとに数十KBの CSS を送り直さない。
+DEFERRED_CSS = """
 .mck-alert{
   border-radius:18px;
   border:1px solid transparent;
@@ -1800,6 +1803,9 @@ small, .text-small{
   from{ opacity:0; transform:translateY(8px); }
   to{ opacity:1; transform:translateY(0); }
 }
+@media (prefers-reduced-motion: reduce){
+  .mck-animated{ animation:none; }
+}
 .tour-banner{
   background:var(--panel);
   border:1px solid var(--border);
@@ -1818,7 +1824,7 @@ small, .text-small{
   opacity:0.25;
   pointer-events:none;
 }
-.tour-banner > div{ position:relative; z-index:1; }
+.tour-banner > *{ position:relative; z-index:1; }
 .tour-banner--muted{
   background:linear-gradient(135deg, rgba(var(--primary-rgb,11,31,59),0.05), rgba(var(--primary-rgb,11,31,59),0.02));
   border-style:dashed;
@@ -1901,64 +1907,9 @@ small, .text-small{
   display:flex;
   gap:.65rem;
 }
-.tour-banner__nav [data-testid="column"]{
-  flex:1;
-}
-.tour-banner__nav [data-testid="column"] [data-testid="stButton"]>button{
-  width:100%;
-  border-radius:12px;
-  font-weight:700;
-  box-shadow:0 12px 24px rgba(var(--accent-rgb,30,136,229),0.22);
-}
-.tour-banner__nav [data-testid="column"] [data-testid="stButton"]>button:disabled{
-  opacity:.55;
-  cursor:not-allowed;
-  box-shadow:none;
-}
-.tour-banner__nav [data-testid="column"]:first-child [data-testid="stButton"]>button,
-.tour-banner__nav [data-testid="column"]:last-child [data-testid="stButton"]>button{
-  background:#ffffff;
-  color:var(--accent-strong);
-  border:1px solid var(--accent-strong);
-  box-shadow:none;
-}
-.tour-banner__nav [data-testid="column"]:first-child [data-testid="stButton"]>button:hover{
-  background:rgba(var(--accent-rgb,30,136,229),0.08);
-}
-.tour-banner__nav [data-testid="column"]:last-child [data-testid="stButton"]>button{
-  border-color:#b24646;
-  color:#b24646;
-}
-.tour-banner__nav [data-testid="column"]:last-child [data-testid="stButton"]>button:hover{
-  background:rgba(178,70,70,0.1);
-  border-color:#962d2d;
-  color:#962d2d;
-}
 .tour-banner__nav--resume{
   justify-content:flex-start;
 }
-.tour-banner__nav--resume [data-testid="column"]:first-child [data-testid="stButton"]>button{
-  background:var(--accent);
-  color:#ffffff;
-  border-color:var(--accent);
-  box-shadow:0 12px 24px rgba(var(--accent-rgb,30,136,229),0.22);
-}
-.tour-banner__nav--resume [data-testid="column"]:first-child [data-testid="stButton"]>button:hover{
-  background:var(--accent-strong);
-  border-color:var(--accent-strong);
-  color:#ffffff;
-}
-.tour-banner__nav--resume [data-testid="column"]:last-child [data-testid="stButton"]>button{
-  background:#ffffff;
-  color:var(--accent-strong);
-  border:1px solid var(--accent-strong);
-  box-shadow:none;
-}
-.tour-banner__nav--resume [data-testid="column"]:last-child [data-testid="stButton"]>button:hover{
-  background:rgba(var(--accent-rgb,30,136,229),0.08);
-  border-color:var(--accent-strong);
-  color:var(--accent-strong);
-}
 .tour-highlight-heading{
   position:relative;
   border-radius:18px;
@@ -2009,123 +1960,264 @@ section[data-testid="stSidebar"] label.tour-highlight-nav *{
   background:linear-gradient(180deg, rgba(var(--primary-rgb,11,31,59),0.05), rgba(var(--primary-rgb,11,31,59),0.02));
   border-bottom:1px solid rgba(var(--primary-rgb,11,31,59),0.18);
 }
-</style>
-    """,
-    unsafe_allow_html=True,
-)
+"""
 
-brand_override_template = Template(
-    textwrap.dedent(
-        """
-        <style>
-        :root{
-          --font-heading:${font_heading};
-          --font-base:${font_body};
-          --font-body:${font_body};
-          --font-mono:${font_numeric};
-          --primary:${primary};
-          --primary-rgb:${primary_rgb};
-          --primary-dark:${primary_dark};
-          --primary-deep:${primary_deep};
-          --primary-deep-rgb:${primary_deep_rgb};
-          --primary-light:${primary_light};
-          --bg:${background};
-          --bg-muted:${background_muted};
-          --panel:${surface};
-          --panel-alt:${surface_alt};
-          --ink:${text};
-          --ink-subtle:${muted};
-          --muted:${muted};
-          --accent:${accent};
-          --accent-rgb:${accent_rgb};
-          --accent-soft:${accent_soft};
-          --accent-soft-rgb:${accent_soft_rgb};
-          --accent-strong:${accent_emphasis};
-          --border:${border};
-          --border-strong:${border_strong};
-          --metric-positive:${success};
-          --metric-negative:${error};
-          --success:${success};
-          --success-rgb:${success_rgb};
-          --warning:${warning};
-          --warning-rgb:${warning_rgb};
-          --error:${error};
-          --spacing-unit:${spacing_unit}px;
-          --radius-card:${card_radius}px;
-          --card-shadow:${card_shadow};
-          --line-height-body:${body_line_height};
-          --line-height-heading:${heading_line_height};
-        }
+# ナビ操作バー・ヒーロー補足・用語集などの規則（トークン由来の値だけで決まる）
+NAV_ACTION_CSS = f"""
+.nav-action-bar{{
+  margin:0 0 1.2rem;
+  padding:0.85rem 1.1rem;
+  border-radius:16px;
+  background:linear-gradient(135deg, rgba({PRIMARY_RGB},0.08), rgba({PRIMARY_RGB},0.18));
+  border:1px solid rgba({PRIMARY_RGB},0.35);
+  box-shadow:0 12px 28px rgba({PRIMARY_RGB},0.18);
+}}
+.nav-action-bar .stButton>button,
+.nav-action-bar .stLinkButton>button{{
+  min-height:44px;
+  font-size:0.95rem;
+  font-weight:700;
+  border-radius:12px;
+}}
+.nav-action-bar .stButton>button{{
+  background:linear-gradient(135deg, {PRIMARY_LIGHT}, {PRIMARY_COLOR});
+  border:1px solid rgba({PRIMARY_RGB},0.4);
+  color:#0b1f3b;
+  box-shadow:0 16px 32px rgba({PRIMARY_RGB},0.22);
+}}
+.nav-action-bar .stButton>button:disabled{{
+  background:rgba(255,255,255,0.4);
+  color:rgba(11,31,59,0.45);
+  box-shadow:none;
+}}
+.nav-action-bar .stLinkButton>button{{
+  background:rgba(255,255,255,0.12);
+  border:1px solid rgba({PRIMARY_RGB},0.35);
+  color:#ffffff;
+}}
+.mck-hero__usage{{
+  margin-top:1.8rem;
+  padding:1.2rem 1.4rem;
+  border-radius:20px;
+  background:rgba(255,255,255,0.16);
+  border:1px solid rgba(255,255,255,0.26);
+  color:rgba(240,247,255,0.95);
+  box-shadow:0 18px 34px rgba(12,32,58,0.22);
+}}
+.mck-hero__usage h2,
+.mck-hero__usage h3{{
+  color:#ffffff;
+  margin:0 0 0.6rem;
+  letter-spacing:.04em;
+}}
+.mck-hero__usage ol,
+.mck-hero__usage ul{{
+  margin:0 0 0.8rem 1.3rem;
+  padding:0;
+}}
+.mck-hero__usage li{{
+  margin-bottom:0.35rem;
+  line-height:1.65;
+}}
+.mck-hero__assumption{{
+  margin-top:1rem;
+  padding-top:0.85rem;
+  border-top:1px solid rgba(255,255,255,0.28);
+}}
+.mck-hero__hint{{
+  margin:0.6rem 0 0;
+  font-size:0.85rem;
+  color:rgba(240,247,255,0.85);
+}}
+.glossary-cloud{{
+  display:flex;
+  flex-wrap:wrap;
+  gap:0.6rem;
+  margin:0.8rem 0 1rem;
+}}
+.glossary-term{{
+  display:inline-flex;
+  align-items:center;
+  gap:0.35rem;
+  padding:0.2rem 0.65rem;
+  border-radius:999px;
+  border:1px solid rgba({PRIMARY_RGB},0.55);
+  background:rgba({PRIMARY_RGB},0.08);
+  color:{PRIMARY_COLOR};
+  font-weight:700;
+  font-size:0.82rem;
+  letter-spacing:.03em;
+}}
+.glossary-term::before{{
+  content:"i";
+  display:inline-flex;
+  align-items:center;
+  justify-content:center;
+  width:1.1rem;
+  height:1.1rem;
+  border-radius:50%;
+  background:rgba({PRIMARY_RGB},0.15);
+  border:1px solid rgba({PRIMARY_RGB},0.35);
+  font-size:0.72rem;
+}}
+.input-warning{{
+  color:{ERROR_COLOR};
+  font-weight:700;
+  margin-top:0.25rem;
+  line-height:1.55;
+}}
+.input-warning__tip{{
+  display:block;
+  font-weight:400;
+  margin-top:0.15rem;
+  font-size:0.84rem;
+  color:rgba(219,68,55,0.9);
+}}
+"""
+STATIC_DIR = Path(__file__).resolve().parent / "static"
 
-        body, .stApp, [data-testid="stAppViewContainer"]{
-          font-family:${font_body};
-          font-size:${body_font_size}px;
-          line-height:var(--line-height-body);
-          background:${background} !important;
-          color:${text} !important;
-        }
 
-        [data-testid="stHeader"]{
-          background:linear-gradient(90deg, ${primary} 0%, ${primary_light} 100%);
-          border-bottom:1px solid rgba(${primary_rgb},0.45);
-        }
+@st.cache_resource(show_spinner=False)
+def deferred_stylesheet_tag() -> str:
+    """``DEFERRED_CSS`` と ``NAV_ACTION_CSS`` を読み込むタグを返す。
 
-        [data-testid="stHeader"] *{
-          color:${surface} !important;
-          font-family:${font_body};
-        }
+    静的配信（``server.enableStaticServing``）が有効なら内容ハッシュ付きの
+    ファイル名で ``static/`` に書き出し、ブラウザにキャッシュさせる ``<link>`` を
+    返す。無効な場合や書き込めない場合は従来どおり ``<style>`` で埋め込む。
+    """
 
-        [data-testid="stSidebar"]{
-          background:linear-gradient(180deg, ${primary_deep} 0%, ${primary} 100%);
-          color:${surface_alt};
-        }
+    css = minify_css(DEFERRED_CSS + NAV_ACTION_CSS)
+    inline = f"\n<style>{css}</style>\n"
+    if not st.get_option("server.enableStaticServing"):
+        return inline
+    digest = hashlib.blake2b(css.encode("utf-8"), digest_size=8).hexdigest()
+    path = STATIC_DIR / f"app.{digest}.css"
+    try:
+        if not path.exists():
+            STATIC_DIR.mkdir(exist_ok=True)
+            path.write_text(css, encoding="utf-8")
+    except OSError:
+        return inline
+    return f'\n<link rel="stylesheet" href="app/static/{path.name}">\n'
 
-        [data-testid="stSidebar"] *{
-          color:${surface_alt} !important;
-          font-family:${font_body};
-        }
 
-        .mck-inline-label__icon,
-        .mck-inline-label__help{
-          background:rgba(${accent_rgb},0.12);
-          color:${accent_emphasis};
-          border-color:rgba(${accent_rgb},0.22);
-        }
+@st.cache_resource(show_spinner=False)
+def brand_override_css() -> str:
+    """デザイントークンを埋め込んだブランド上書き CSS を返す。
 
-        .stTabs [aria-selected="true"]{
-          background:${accent};
-          color:${surface};
-          border-color:${accent};
-        }
+    トークンは実行中に変わらないため、テンプレートの整形と置換はプロセスで
+    1回だけ行い、再実行時は組み立て済みの文字列をそのまま描画する。
+    """
 
-        .stTabs [data-baseweb="tab"]:focus{
-          box-shadow:0 0 0 3px rgba(${accent_rgb},0.18);
-        }
+    return Template(
+        textwrap.dedent(
+            """
+            <style>
+            :root{
+              --font-heading:${font_heading};
+              --font-base:${font_body};
+              --font-body:${font_body};
+              --font-mono:${font_numeric};
+              --primary:${primary};
+              --primary-rgb:${primary_rgb};
+              --primary-dark:${primary_dark};
+              --primary-deep:${primary_deep};
+              --primary-deep-rgb:${primary_deep_rgb};
+              --primary-light:${primary_light};
+              --bg:${background};
+              --bg-muted:${background_muted};
+              --panel:${surface};
+              --panel-alt:${surface_alt};
+              --ink:${text};
+              --ink-subtle:${muted};
+              --muted:${muted};
+              --accent:${accent};
+              --accent-rgb:${accent_rgb};
+              --accent-soft:${accent_soft};
+              --accent-soft-rgb:${accent_soft_rgb};
+              --accent-strong:${accent_emphasis};
+              --border:${border};
+              --border-strong:${border_strong};
+              --metric-positive:${success};
+              --metric-negative:${error};
+              --success:${success};
+              --success-rgb:${success_rgb};
+              --warning:${warning};
+              --warning-rgb:${warning_rgb};
+              --error:${error};
+              --spacing-unit:${spacing_unit}px;
+              --radius-card:${card_radius}px;
+              --card-shadow:${card_shadow};
+              --line-height-body:${body_line_height};
+              --line-height-heading:${heading_line_height};
+            }
 
-        .stButton>button{
-          font-family:${font_body};
-        }
+            body, .stApp, [data-testid="stAppViewContainer"]{
+              font-family:${font_body};
+              font-size:${body_font_size}px;
+              line-height:var(--line-height-body);
+              background:${background} !important;
+              color:${text} !important;
+            }
 
-        .stButton>button:focus-visible,
-        .stButton>button:hover{
-          border-color:${accent_emphasis};
-        }
+            [data-testid="stHeader"]{
+              background:linear-gradient(90deg, ${primary} 0%, ${primary_light} 100%);
+              border-bottom:1px solid rgba(${primary_rgb},0.45);
+            }
 
-        .stMetric-value{
-          font-family:${font_numeric};
-        }
+            [data-testid="stHeader"] *{
+              color:${surface} !important;
+              font-family:${font_body};
+            }
 
-        .mck-ai-answer strong{
-          color:${accent_emphasis};
-          font-family:${font_heading};
-        }
-        </style>
-        """
-    )
-)
+            [data-testid="stSidebar"]{
+              background:linear-gradient(180deg, ${primary_deep} 0%, ${primary} 100%);
+              color:${surface_alt};
+            }
 
-st.markdown(
-    brand_override_template.substitute(
+            [data-testid="stSidebar"] *{
+              color:${surface_alt} !important;
+              font-family:${font_body};
+            }
+
+            .mck-inline-label__icon,
+            .mck-inline-label__help{
+              background:rgba(${accent_rgb},0.12);
+              color:${accent_emphasis};
+              border-color:rgba(${accent_rgb},0.22);
+            }
+
+            .stTabs [aria-selected="true"]{
+              background:${accent};
+              color:${surface};
+              border-color:${accent};
+            }
+
+            .stTabs [data-baseweb="tab"]:focus{
+              box-shadow:0 0 0 3px rgba(${accent_rgb},0.18);
+            }
+
+            .stButton>button{
+              font-family:${font_body};
+            }
+
+            .stButton>button:focus-visible,
+            .stButton>button:hover{
+              border-color:${accent_emphasis};
+            }
+
+            .stMetric-value{
+              font-family:${font_numeric};
+            }
+
+            .mck-ai-answer strong{
+              color:${accent_emphasis};
+              font-family:${font_heading};
+            }
+            </style>
+            """
+        )
+    ).substitute(
         font_heading=FONT_HEADING,
         font_body=FONT_BODY,
         font_numeric=FONT_NUMERIC,
@@ -2159,17 +2251,13 @@ st.markdown(
         body_line_height=BODY_LINE_HEIGHT,
         heading_line_height=HEADING_LINE_HEIGHT,
         body_font_size=BODY_FONT_SIZE,
-    ),
-    unsafe_allow_html=True,
-)
+    )
+
 
 # ===== Elegant（品格）UI ON/OFF & Language Selector =====
-if "elegant_on" not in st.session_state:
-    st.session_state["elegant_on"] = True
-if "dark_mode" not in st.session_state:
-    st.session_state["dark_mode"] = False
-if "ui_theme" not in st.session_state:
-    st.session_state["ui_theme"] = "light"
+st.session_state.setdefault("elegant_on", True)
+st.session_state.setdefault("dark_mode", False)
+st.session_state.setdefault("ui_theme", "light")
 
 with st.container():
     control_left, control_right = st.columns([3, 1])
@@ -2212,111 +2300,167 @@ with st.container():
 
 elegant_on = st.session_state.get("elegant_on", True)
 dark_mode = st.session_state.get("dark_mode", False)
+# グラフ描画関数はこの再実行で確定したテーマ名を参照する（呼び出しごとに引き直さない）
+ui_theme = st.session_state.get("ui_theme", "light")
 
 # ===== 品格UI CSS（配色/余白/フォント/境界の見直し） =====
-if elegant_on:
-    if dark_mode:
-        st.markdown(
-            """
-            <style>
-              :root{
-                --ink:#e6efff;
-                --ink-subtle:#a9bddc;
-                --bg:#08121f;
-                --bg-muted:#0d1c30;
-                --panel:#0f2138;
-                --panel-alt:#162d4a;
-                --border:#1f3a5d;
-                --border-strong:#2f4c74;
-                --accent:var(--accent,#1E88E5);
-                --accent-strong:var(--accent-soft,#56A5EB);
-                --accent-soft:#8fc2ff;
-                --muted:#9cb1d1;
-                --metric-positive:var(--accent-soft,#56A5EB);
-                --metric-negative:#f18c8c;
-              }
-              body, .stApp, [data-testid="stAppViewContainer"]{ background:var(--bg) !important; color:var(--ink) !important; }
-              [data-testid="stHeader"]{
-                background:linear-gradient(90deg,#050a14 0%,#0d2136 100%);
-                border-bottom:1px solid rgba(var(--accent-soft-rgb,86,165,235),0.28);
-              }
-              [data-testid="stHeader"] *{ color:#e6efff !important; }
-              [data-testid="stSidebar"]{
-                background:linear-gradient(180deg,#050b16 0%,#0d2239 100%);
-                color:#e6efff;
-              }
-              [data-testid="stSidebar"] *{ color:#e6efff !important; }
-              .chart-card, .stDataFrame{
-                box-shadow:0 18px 38px rgba(var(--primary-deep-rgb,8,23,44),0.55) !important;
-                border:1px solid var(--border) !important;
-                background:var(--panel) !important;
-              }
-              [data-testid="stMetric"]{
-                background:var(--panel-alt);
-                box-shadow:0 18px 40px rgba(var(--primary-deep-rgb,8,23,44),0.5);
-                border:1px solid var(--border);
-              }
-              .stTabs [data-baseweb="tab"]{
-                background:var(--panel-alt);
-                border-color:var(--border);
-                color:var(--ink-subtle);
-              }
-              .stTabs [aria-selected="true"]{
-                background:var(--accent);
-                color:#041020;
-                border-color:var(--accent);
-              }
-              .stButton>button{
-                border:1px solid var(--accent-strong);
-                background:var(--accent);
-                color:#041020;
-                box-shadow:0 16px 32px rgba(8,25,46,0.46);
-              }
-              .stButton>button:hover{
-                background:var(--accent-strong);
-                border-color:var(--accent-strong);
-                color:#041020;
-              }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
-    else:
-        st.markdown(
-            """
-            <style>
-              :root{
-                --ink:var(--primary,#0B1F3B);
-                --ink-subtle:#40526d;
-                --bg:#ffffff;
-                --bg-muted:#f4f7fb;
-                --panel:#ffffff;
-                --panel-alt:#f6f8fc;
-                --border:#d4deee;
-                --border-strong:#b7c5da;
-                --accent:var(--accent,#1E88E5);
-                --accent-strong:#0b2f4c;
-                --accent-soft:var(--accent-soft,#56A5EB);
-                --muted:#5a6880;
-                --metric-positive:var(--accent,#1E88E5);
-                --metric-negative:#b24646;
-              }
-              body, .stApp, [data-testid="stAppViewContainer"]{ background:var(--bg) !important; color:var(--ink) !important; }
-              [data-testid="stHeader"]{
-                background:linear-gradient(90deg,var(--primary,#0B1F3B) 0%,var(--primary-light,#153C72) 100%);
-                border-bottom:1px solid rgba(var(--primary-rgb,11,31,59),0.45);
-              }
-              [data-testid="stSidebar"]{
-                background:linear-gradient(180deg,var(--primary-deep,#08172C) 0%,var(--primary,#0B1F3B) 100%);
-              }
-              .chart-card, .stDataFrame{
-                border:1px solid var(--border) !important;
-                box-shadow:0 16px 32px rgba(var(--primary-rgb,11,31,59),0.12) !important;
-              }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
+# 明暗で値だけが違う規則は :root の変数に寄せて ELEGANT_CSS に1回だけ書き、
+# ダーク専用の規則だけを ELEGANT_DARK_CSS に残す
+ELEGANT_CSS = textwrap.dedent(
+    """
+    <style>
+      body, .stApp, [data-testid="stAppViewContainer"]{ background:var(--bg) !important; color:var(--ink) !important; }
+      [data-testid="stHeader"]{
+        background:var(--header-bg);
+        border-bottom:1px solid var(--header-rule);
+      }
+      [data-testid="stSidebar"]{
+        background:var(--sidebar-bg);
+      }
+      .chart-card, .stDataFrame{
+        border:1px solid var(--border) !important;
+        box-shadow:var(--card-shadow) !important;
+      }
+    </style>
+    """
+)
+
+ELEGANT_DARK_CSS = textwrap.dedent(
+    """
+    <style>
+      :root{
+        --ink:#e6efff;
+        --ink-subtle:#a9bddc;
+        --bg:#08121f;
+        --bg-muted:#0d1c30;
+        --panel:#0f2138;
+        --panel-alt:#162d4a;
+        --border:#1f3a5d;
+        --border-strong:#2f4c74;
+        --accent:var(--accent,#1E88E5);
+        --accent-strong:var(--accent-soft,#56A5EB);
+        --accent-soft:#8fc2ff;
+        --muted:#9cb1d1;
+        --metric-positive:var(--accent-soft,#56A5EB);
+        --metric-negative:#f18c8c;
+        --header-bg:linear-gradient(90deg,#050a14 0%,#0d2136 100%);
+        --header-rule:rgba(var(--accent-soft-rgb,86,165,235),0.28);
+        --sidebar-bg:linear-gradient(180deg,#050b16 0%,#0d2239 100%);
+        --card-shadow:0 18px 38px rgba(var(--primary-deep-rgb,8,23,44),0.55);
+      }
+      [data-testid="stHeader"] *{ color:#e6efff !important; }
+      [data-testid="stSidebar"]{ color:#e6efff; }
+      [data-testid="stSidebar"] *{ color:#e6efff !important; }
+      .chart-card, .stDataFrame{ background:var(--panel) !important; }
+      [data-testid="stMetric"]{
+        background:var(--panel-alt);
+        box-shadow:0 18px 40px rgba(var(--primary-deep-rgb,8,23,44),0.5);
+        border:1px solid var(--border);
+      }
+      .stTabs [data-baseweb="tab"]{
+        background:var(--panel-alt);
+        border-color:var(--border);
+        color:var(--ink-subtle);
+      }
+      .stTabs [aria-selected="true"]{
+        background:var(--accent);
+        color:#041020;
+        border-color:var(--accent);
+      }
+      .stButton>button{
+        border:1px solid var(--accent-strong);
+        background:var(--accent);
+        color:#041020;
+        box-shadow:0 16px 32px rgba(8,25,46,0.46);
+      }
+      .stButton>button:hover{
+        background:var(--accent-strong);
+        border-color:var(--accent-strong);
+        color:#041020;
+      }
+    </style>
+    """
+)
+
+ELEGANT_LIGHT_CSS = textwrap.dedent(
+    """
+    <style>
+      :root{
+        --ink:var(--primary,#0B1F3B);
+        --ink-subtle:#40526d;
+        --bg:#ffffff;
+        --bg-muted:#f4f7fb;
+        --panel:#ffffff;
+        --panel-alt:#f6f8fc;
+        --border:#d4deee;
+        --border-strong:#b7c5da;
+        --accent:var(--accent,#1E88E5);
+        --accent-strong:#0b2f4c;
+        --accent-soft:var(--accent-soft,#56A5EB);
+        --muted:#5a6880;
+        --metric-positive:var(--accent,#1E88E5);
+        --metric-negative:#b24646;
+        --header-bg:linear-gradient(90deg,var(--primary,#0B1F3B) 0%,var(--primary-light,#153C72) 100%);
+        --header-rule:rgba(var(--primary-rgb,11,31,59),0.45);
+        --sidebar-bg:linear-gradient(180deg,var(--primary-deep,#08172C) 0%,var(--primary,#0B1F3B) 100%);
+        --card-shadow:0 16px 32px rgba(var(--primary-rgb,11,31,59),0.12);
+      }
+    </style>
+    """
+)
+
+
+# モバイル下部の固定操作バーと狭幅レイアウト（カスケード順を保つため最後に連結する）
+MOBILE_CSS = textwrap.dedent(
+    """
+    <style>
+    .mobile-sticky-actions{
+      position:sticky;
+      bottom:0;
+      padding:0.85rem 1rem;
+      background:linear-gradient(180deg, rgba(243,246,251,0), rgba(243,246,251,0.92) 60%, rgba(243,246,251,1) 100%);
+      border-top:1px solid var(--border);
+      box-shadow:0 -8px 24px rgba(11,44,74,0.12);
+      z-index:90;
+    }
+    .mobile-sticky-actions .mobile-action-caption{
+      margin:0.35rem 0 0;
+      font-size:0.82rem;
+      color:var(--muted);
+      text-align:center;
+    }
+    @media (max-width: 880px){
+      body, .stApp, [data-testid="stAppViewContainer"]{ font-size:15px; }
+      .mck-hero{ padding:1.6rem 1.4rem; border-radius:22px; }
+      .mck-hero__grid{ gap:1.6rem; }
+      .mck-hero__stats{ grid-template-columns:repeat(auto-fit,minmax(140px,1fr)); }
+      .mck-hero__highlights{ grid-template-columns:1fr; }
+      .mobile-sticky-actions{ padding:0.75rem 0.85rem; }
+      .mobile-sticky-actions .stButton>button{ padding:0.85rem 1.1rem; font-size:1rem; }
+      .stTabs [data-baseweb="tab"]{ font-size:0.9rem; padding:0.45rem 0.75rem; }
+    }
+    </style>
+    """
+)
+
+
+@st.cache_resource(show_spinner=False)
+def page_css(elegant: bool, dark: bool) -> str:
+    """ベース・ブランド上書き・品格UI・モバイルの CSS を1つの文字列にまとめて返す。
+
+    組み合わせは (品格UI, ダークモード) の4通りしかないため、連結と圧縮は
+    プロセスで1回だけ行い、再実行ごとの ``st.markdown`` も1要素だけにする。
+    """
+
+    parts = [BASE_CSS, deferred_stylesheet_tag(), brand_override_css()]
+    if elegant:
+        parts.append(ELEGANT_DARK_CSS if dark else ELEGANT_LIGHT_CSS)
+        parts.append(ELEGANT_CSS)
+    parts.append(MOBILE_CSS)
+    return minify_style_blocks("".join(parts))
+
+
+st.markdown(page_css(bool(elegant_on), bool(dark_mode)), unsafe_allow_html=True)
 
 INDUSTRY_TEMPLATES: Dict[str, Dict[str, object]] = {
     "restaurant": {
@@ -2549,161 +2693,47 @@ INDUSTRY_TEMPLATES: Dict[str, Dict[str, object]] = {
 INDUSTRY_TEMPLATE_ORDER = ["restaurant", "retail", "service"]
 DEFAULT_TEMPLATE_KEY = "retail"
 
-st.markdown(
+
+def template_kpi_targets(template: Dict[str, object]) -> List[Dict[str, object]]:
+    """テンプレートの推奨KPI一覧を返す。
+
+    テンプレート定義は読み取り専用として扱い、指標の辞書はコピーせず共有する。
     """
-    <style>
-    .mobile-sticky-actions{
-      position:sticky;
-      bottom:0;
-      padding:0.85rem 1rem;
-      background:linear-gradient(180deg, rgba(243,246,251,0), rgba(243,246,251,0.92) 60%, rgba(243,246,251,1) 100%);
-      border-top:1px solid var(--border);
-      box-shadow:0 -8px 24px rgba(11,44,74,0.12);
-      z-index:90;
-    }
-    .mobile-sticky-actions .mobile-action-caption{
-      margin:0.35rem 0 0;
-      font-size:0.82rem;
-      color:var(--muted);
-      text-align:center;
-    }
-    @media (max-width: 880px){
-      body, .stApp, [data-testid="stAppViewContainer"]{ font-size:15px; }
-      .mck-hero{ padding:1.6rem 1.4rem; border-radius:22px; }
-      .mck-hero__grid{ gap:1.6rem; }
-      .mck-hero__stats{ grid-template-columns:repeat(auto-fit,minmax(140px,1fr)); }
-      .mck-hero__highlights{ grid-template-columns:1fr; }
-      .mobile-sticky-actions{ padding:0.75rem 0.85rem; }
-      .mobile-sticky-actions .stButton>button{ padding:0.85rem 1.1rem; font-size:1rem; }
-      .stTabs [data-baseweb="tab"]{ font-size:0.9rem; padding:0.45rem 0.75rem; }
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
 
-st.markdown(
-    f"""
-    <style>
-    .nav-action-bar{{
-      margin:0 0 1.2rem;
-      padding:0.85rem 1.1rem;
-      border-radius:16px;
-      background:linear-gradient(135deg, rgba({PRIMARY_RGB},0.08), rgba({PRIMARY_RGB},0.18));
-      border:1px solid rgba({PRIMARY_RGB},0.35);
-      box-shadow:0 12px 28px rgba({PRIMARY_RGB},0.18);
-    }}
-    .nav-action-bar .stButton>button,
-    .nav-action-bar .stLinkButton>button{{
-      min-height:44px;
-      font-size:0.95rem;
-      font-weight:700;
-      border-radius:12px;
-    }}
-    .nav-action-bar .stButton>button{{
-      background:linear-gradient(135deg, {PRIMARY_LIGHT}, {PRIMARY_COLOR});
-      border:1px solid rgba({PRIMARY_RGB},0.4);
-      color:#0b1f3b;
-      box-shadow:0 16px 32px rgba({PRIMARY_RGB},0.22);
-    }}
-    .nav-action-bar .stButton>button:disabled{{
-      background:rgba(255,255,255,0.4);
-      color:rgba(11,31,59,0.45);
-      box-shadow:none;
-    }}
-    .nav-action-bar .stLinkButton>button{{
-      background:rgba(255,255,255,0.12);
-      border:1px solid rgba({PRIMARY_RGB},0.35);
-      color:#ffffff;
-    }}
-    .mck-hero__usage{{
-      margin-top:1.8rem;
-      padding:1.2rem 1.4rem;
-      border-radius:20px;
-      background:rgba(255,255,255,0.16);
-      border:1px solid rgba(255,255,255,0.26);
-      color:rgba(240,247,255,0.95);
-      box-shadow:0 18px 34px rgba(12,32,58,0.22);
-    }}
-    .mck-hero__usage h2,
-    .mck-hero__usage h3{{
-      color:#ffffff;
-      margin:0 0 0.6rem;
-      letter-spacing:.04em;
-    }}
-    .mck-hero__usage ol,
-    .mck-hero__usage ul{{
-      margin:0 0 0.8rem 1.3rem;
-      padding:0;
-    }}
-    .mck-hero__usage li{{
-      margin-bottom:0.35rem;
-      line-height:1.65;
-    }}
-    .mck-hero__assumption{{
-      margin-top:1rem;
-      padding-top:0.85rem;
-      border-top:1px solid rgba(255,255,255,0.28);
-    }}
-    .mck-hero__hint{{
-      margin:0.6rem 0 0;
-      font-size:0.85rem;
-      color:rgba(240,247,255,0.85);
-    }}
-    .glossary-cloud{{
-      display:flex;
-      flex-wrap:wrap;
-      gap:0.6rem;
-      margin:0.8rem 0 1rem;
-    }}
-    .glossary-term{{
-      display:inline-flex;
-      align-items:center;
-      gap:0.35rem;
-      padding:0.2rem 0.65rem;
-      border-radius:999px;
-      border:1px solid rgba({PRIMARY_RGB},0.55);
-      background:rgba({PRIMARY_RGB},0.08);
-      color:{PRIMARY_COLOR};
-      font-weight:700;
-      font-size:0.82rem;
-      letter-spacing:.03em;
-    }}
-    .glossary-term::before{{
-      content:"i";
-      display:inline-flex;
-      align-items:center;
-      justify-content:center;
-      width:1.1rem;
-      height:1.1rem;
-      border-radius:50%;
-      background:rgba({PRIMARY_RGB},0.15);
-      border:1px solid rgba({PRIMARY_RGB},0.35);
-      font-size:0.72rem;
-    }}
-    .input-warning{{
-      color:{ERROR_COLOR};
-      font-weight:700;
-      margin-top:0.25rem;
-      line-height:1.55;
-    }}
-    .input-warning__tip{{
-      display:block;
-      font-weight:400;
-      margin-top:0.15rem;
-      font-size:0.84rem;
-      color:rgba(219,68,55,0.9);
-    }}
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+    return list(template.get("recommended_metrics", []))
+
 
 # ---------------- Session State ----------------
-if "data_monthly" not in st.session_state:
-    st.session_state.data_monthly = None  # long-form DF
-if "data_year" not in st.session_state:
-    st.session_state.data_year = None
+# 未設定のキーだけを既定値で埋める（キーごとの if 判定を1回の走査にまとめる）
+SESSION_DEFAULTS: Dict[str, Any] = {
+    "data_monthly": None,  # long-form DF
+    "data_year": None,
+    "code_to_name": {},
+    "notes": {},  # product_code -> str
+    "tags": {},  # product_code -> List[str]
+    "saved_views": {},  # name -> dict
+    "compare_params": {},
+    "compare_results": None,
+    "copilot_answer": "",
+    "copilot_context": "",
+    "copilot_focus": "全体サマリー",
+    "tour_active": True,
+    "tour_step_index": 0,
+    "tour_completed": False,
+    "onboarding_seen": False,
+    "show_onboarding_modal": True,
+    "sample_data_notice": False,
+    "sample_data_message": "",
+    "import_wizard_step": 1,
+    "import_upload_preview": None,
+    "import_upload_diagnostics": None,
+    # track user interactions and global filters
+    "click_log": {},
+    "filters": {},
+}
+for _key, _value in SESSION_DEFAULTS.items():
+    st.session_state.setdefault(_key, _value)
+
 if "settings" not in st.session_state:
     default_template = INDUSTRY_TEMPLATES.get(DEFAULT_TEMPLATE_KEY, {})
     template_defaults = default_template.get("settings", {})
@@ -2716,9 +2746,7 @@ if "settings" not in st.session_state:
         "slope_threshold": template_defaults.get("slope_threshold", -1.0),
         "currency_unit": "円",
         "industry_template": DEFAULT_TEMPLATE_KEY,
-        "template_kpi_targets": [
-            dict(metric) for metric in default_template.get("recommended_metrics", [])
-        ],
+        "template_kpi_targets": template_kpi_targets(default_template),
     }
 else:
     if "industry_template" not in st.session_state.settings:
@@ -2728,51 +2756,7 @@ else:
             st.session_state.settings.get("industry_template", DEFAULT_TEMPLATE_KEY),
             INDUSTRY_TEMPLATES[DEFAULT_TEMPLATE_KEY],
         )
-        st.session_state.settings["template_kpi_targets"] = [
-            dict(metric) for metric in tpl.get("recommended_metrics", [])
-        ]
-if "notes" not in st.session_state:
-    st.session_state.notes = {}  # product_code -> str
-if "tags" not in st.session_state:
-    st.session_state.tags = {}  # product_code -> List[str]
-if "saved_views" not in st.session_state:
-    st.session_state.saved_views = {}  # name -> dict
-if "compare_params" not in st.session_state:
-    st.session_state.compare_params = {}
-if "compare_results" not in st.session_state:
-    st.session_state.compare_results = None
-if "copilot_answer" not in st.session_state:
-    st.session_state.copilot_answer = ""
-if "copilot_context" not in st.session_state:
-    st.session_state.copilot_context = ""
-if "copilot_focus" not in st.session_state:
-    st.session_state.copilot_focus = "全体サマリー"
-if "tour_active" not in st.session_state:
-    st.session_state.tour_active = True
-if "tour_step_index" not in st.session_state:
-    st.session_state.tour_step_index = 0
-if "tour_completed" not in st.session_state:
-    st.session_state.tour_completed = False
-if "onboarding_seen" not in st.session_state:
-    st.session_state.onboarding_seen = False
-if "show_onboarding_modal" not in st.session_state:
-    st.session_state.show_onboarding_modal = True
-if "sample_data_notice" not in st.session_state:
-    st.session_state.sample_data_notice = False
-if "sample_data_message" not in st.session_state:
-    st.session_state.sample_data_message = ""
-if "import_wizard_step" not in st.session_state:
-    st.session_state.import_wizard_step = 1
-if "import_upload_preview" not in st.session_state:
-    st.session_state.import_upload_preview = None
-if "import_upload_diagnostics" not in st.session_state:
-    st.session_state.import_upload_diagnostics = None
-
-# track user interactions and global filters
-if "click_log" not in st.session_state:
-    st.session_state.click_log = {}
-if "filters" not in st.session_state:
-    st.session_state.filters = {}
+        st.session_state.settings["template_kpi_targets"] = template_kpi_targets(tpl)
 
 # currency unit scaling factors
 UNIT_MAP = {"円": 1, "千円": 1_000, "百万円": 1_000_000}
@@ -2805,9 +2789,16 @@ def apply_industry_template(template_key: str) -> None:
     for field, value in template_defaults.items():
         settings[field] = value
     settings["industry_template"] = template_key
-    settings["template_kpi_targets"] = [
-        dict(metric) for metric in template.get("recommended_metrics", [])
-    ]
+    settings["template_kpi_targets"] = template_kpi_targets(template)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def template_month_columns(months: int, current_month: str) -> List[str]:
+    """``current_month`` までの直近 ``months`` ヶ月の月度列名（YYYY-MM）を返す。"""
+
+    end_period = pd.Period(current_month, freq="M")
+    periods = pd.period_range(end_period - (months - 1), end_period, freq="M")
+    return [period.strftime("%Y-%m") for period in periods]
 
 
 def build_industry_template_dataframe(
@@ -2820,24 +2811,35 @@ def build_industry_template_dataframe(
         return pd.DataFrame()
     base_columns = template.get("template_columns", ["品目名"])
     sample_rows = template.get("template_sample_rows") or [{}]
-    end_period = pd.Timestamp.today().to_period("M")
-    periods = pd.period_range(end_period - (months - 1), end_period, freq="M")
-    month_columns = [period.strftime("%Y-%m") for period in periods]
-    rows: List[List[object]] = []
-    for row in sample_rows:
-        base_values = [row.get(col, "") for col in base_columns]
-        month_values = [0 for _ in month_columns]
-        rows.append(base_values + month_values)
-    if not rows:
-        rows.append(["" for _ in base_columns + month_columns])
-    return pd.DataFrame(rows, columns=base_columns + month_columns)
+    month_columns = template_month_columns(
+        months, pd.Timestamp.today().strftime("%Y-%m")
+    )
+    base = pd.DataFrame(
+        [[row.get(col, "") for col in base_columns] for row in sample_rows],
+        columns=base_columns,
+    )
+    # 月度列はすべて 0 なので、行ごとのリストではなくゼロ行列1つで作る
+    zeros = pd.DataFrame(
+        np.zeros((len(base), len(month_columns)), dtype=np.int64),
+        columns=month_columns,
+    )
+    return pd.concat([base, zeros], axis=1)
 
 
 def build_industry_template_csv(template_key: str, months: int = 12) -> bytes:
+    return _industry_template_csv(
+        template_key, months, pd.Timestamp.today().strftime("%Y-%m")
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _industry_template_csv(template_key: str, months: int, current_month: str) -> bytes:
+    """テンプレート CSV のバイト列を保持する（月度列が当月基準なので当月もキーに含める）。"""
+
     df = build_industry_template_dataframe(template_key, months=months)
     if df.empty:
         return b""
-    return df.to_csv(index=False).encode("utf-8-sig")
+    return to_csv_bytes(df)
 
 
 def _convert_numeric_cell(value: object) -> Tuple[float, bool, bool]:
@@ -3150,25 +3152,37 @@ def style_upload_preview(
     return styler
 
 
-def _normalize_statement_items(items: List[Dict[str, float]]) -> List[Dict[str, float]]:
-    normalized: List[Dict[str, float]] = []
-    total = 0.0
-    for item in items:
-        label = item.get("item") or item.get("label") or "項目"
-        ratio_raw = item.get("ratio", 0.0)
+def _ratio_array(items: List[Dict[str, object]]) -> np.ndarray:
+    """各項目の ``ratio`` を float 配列にする（数値化できない値は NaN）。"""
+
+    ratios = np.full(len(items), np.nan)
+    for pos, item in enumerate(items):
+        ratio = item.get("ratio", 0.0)
+        # テンプレートの値はほぼ数値なので、例外処理を通さずそのまま入れる
+        if isinstance(ratio, (int, float)):
+            ratios[pos] = ratio
+            continue
         try:
-            ratio = float(ratio_raw)
+            ratios[pos] = float(ratio)
         except (TypeError, ValueError):
             continue
-        if not math.isfinite(ratio) or ratio == 0:
-            continue
-        normalized.append({"item": label, "ratio": ratio})
-        total += ratio
-    if not normalized or total == 0:
+    return ratios
+
+
+def _normalize_statement_items(items: List[Dict[str, float]]) -> List[Dict[str, float]]:
+    ratios = _ratio_array(items)
+    keep = np.isfinite(ratios) & (ratios != 0)
+    total = float(ratios[keep].sum())
+    if not keep.any() or total == 0:
         return [{"item": "合計", "ratio": 1.0}]
+    labels = [
+        item.get("item") or item.get("label") or "項目"
+        for item, kept in zip(items, keep)
+        if kept
+    ]
     return [
-        {"item": entry["item"], "ratio": entry["ratio"] / total}
-        for entry in normalized
+        {"item": label, "ratio": float(ratio)}
+        for label, ratio in zip(labels, ratios[keep] / total)
     ]
 
 
@@ -3178,7 +3192,6 @@ def build_financial_statements(
     template_key: str,
 ) -> Dict[str, object]:
     template = get_template_config(template_key)
-    profile = template.get("financial_profile", {})
     meta_template = {
         "template_key": template_key,
         "template_label": template.get("label", template_key),
@@ -3193,16 +3206,7 @@ def build_financial_statements(
             "cash": pd.DataFrame(),
             "meta": meta_template,
         }
-    snapshot = year_df[year_df["month"] == month].dropna(subset=["year_sum"])
-    if snapshot.empty:
-        return {
-            "income": pd.DataFrame(),
-            "balance": pd.DataFrame(),
-            "cash": pd.DataFrame(),
-            "meta": meta_template,
-        }
-
-    revenue = float(snapshot["year_sum"].sum())
+    revenue = month_year_sum_total(year_df, month)
     if not math.isfinite(revenue) or revenue <= 0:
         return {
             "income": pd.DataFrame(),
@@ -3210,7 +3214,19 @@ def build_financial_statements(
             "cash": pd.DataFrame(),
             "meta": meta_template,
         }
+    return _financial_statements_for_revenue(template_key, revenue)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _financial_statements_for_revenue(template_key: str, revenue: float) -> Dict[str, object]:
+    """テンプレートと売上高（年計合計）だけで決まる財務3表を組み立てる。
 
+    入力がハッシュ可能な2値だけなので、同じ月・同じテンプレートの再描画では
+    表を作り直さずキャッシュを返す。
+    """
+
+    template = get_template_config(template_key)
+    profile = template.get("financial_profile", {})
     cogs_ratio = profile.get("cogs_ratio", 0.6)
     opex_ratio = profile.get("opex_ratio", 0.25)
     other_income_ratio = profile.get("other_income_ratio", 0.01)
@@ -3228,52 +3244,31 @@ def build_financial_statements(
     taxes_value = -tax_base * tax_ratio
     net_income = ordinary_income + taxes_value
 
-    income_records: List[Dict[str, object]] = [
-        {"項目": "売上高", "金額": revenue, "構成比": 1.0},
-        {
-            "項目": profile.get("cogs_label", "売上原価"),
-            "金額": cogs_value,
-            "構成比": cogs_value / revenue,
-        },
-        {"項目": "売上総利益", "金額": gross_profit, "構成比": gross_profit / revenue},
-        {"項目": "販管費", "金額": opex_value, "構成比": opex_value / revenue},
-        {"項目": "営業利益", "金額": operating_income, "構成比": operating_income / revenue},
+    # 行ごとの dict を作らず、項目名と金額の列を並べてから構成比を一括で割る
+    income_rows: List[Tuple[str, float]] = [
+        ("売上高", revenue),
+        (profile.get("cogs_label", "売上原価"), cogs_value),
+        ("売上総利益", gross_profit),
+        ("販管費", opex_value),
+        ("営業利益", operating_income),
     ]
     if other_income:
-        income_records.append(
-            {
-                "項目": "営業外収益",
-                "金額": other_income,
-                "構成比": other_income / revenue,
-            }
-        )
+        income_rows.append(("営業外収益", other_income))
     if interest_expense:
-        income_records.append(
-            {
-                "項目": "支払利息等",
-                "金額": interest_expense,
-                "構成比": interest_expense / revenue,
-            }
-        )
-    income_records.append(
+        income_rows.append(("支払利息等", interest_expense))
+    income_rows.append(("経常利益", ordinary_income))
+    if taxes_value:
+        income_rows.append(("法人税等", taxes_value))
+    income_rows.append(("当期純利益", net_income))
+    income_labels, income_values = zip(*income_rows)
+    income_amounts = np.asarray(income_values, dtype=np.float64)
+    income_df = pd.DataFrame(
         {
-            "項目": "経常利益",
-            "金額": ordinary_income,
-            "構成比": ordinary_income / revenue,
+            "項目": list(income_labels),
+            "金額": income_amounts,
+            "構成比": income_amounts / revenue,
         }
     )
-    if taxes_value:
-        income_records.append(
-            {
-                "項目": "法人税等",
-                "金額": taxes_value,
-                "構成比": taxes_value / revenue,
-            }
-        )
-    income_records.append(
-        {"項目": "当期純利益", "金額": net_income, "構成比": net_income / revenue}
-    )
-    income_df = pd.DataFrame(income_records)
 
     asset_turnover = profile.get("asset_turnover", 2.5)
     if not asset_turnover or not math.isfinite(asset_turnover):
@@ -3285,49 +3280,42 @@ def build_financial_statements(
         profile.get("balance_liabilities", [])
     )
 
-    balance_records: List[Dict[str, object]] = [
-        {
-            "区分": "資産",
-            "項目": item["item"],
-            "金額": assets_total * item["ratio"],
-            "構成比": item["ratio"],
-        }
-        for item in assets_items
-    ]
-    balance_records.extend(
+    balance_items = assets_items + liabilities_items
+    balance_ratios = np.fromiter(
+        (item["ratio"] for item in balance_items),
+        dtype=np.float64,
+        count=len(balance_items),
+    )
+    balance_df = pd.DataFrame(
         {
-            "区分": "負債・純資産",
-            "項目": item["item"],
-            "金額": assets_total * item["ratio"],
-            "構成比": item["ratio"],
+            "区分": ["資産"] * len(assets_items) + ["負債・純資産"] * len(liabilities_items),
+            "項目": [item["item"] for item in balance_items],
+            "金額": assets_total * balance_ratios,
+            "構成比": balance_ratios,
         }
-        for item in liabilities_items
     )
-    balance_df = pd.DataFrame(balance_records)
 
-    cash_records: List[Dict[str, object]] = []
-    net_cash = 0.0
-    for item in profile.get("cash_flow", []):
-        label = item.get("item") or "キャッシュフロー"
-        ratio_raw = item.get("ratio", 0.0)
-        try:
-            ratio = float(ratio_raw)
-        except (TypeError, ValueError):
-            continue
-        if not math.isfinite(ratio) or ratio == 0:
-            continue
-        amount = revenue * ratio
-        net_cash += amount
-        cash_records.append({"項目": label, "金額": amount, "構成比": ratio})
-    if cash_records:
-        cash_records.append(
+    cash_items = profile.get("cash_flow", [])
+    cash_ratio_all = _ratio_array(cash_items)
+    cash_keep = np.isfinite(cash_ratio_all) & (cash_ratio_all != 0)
+    if cash_keep.any():
+        cash_labels = [
+            item.get("item") or "キャッシュフロー"
+            for item, kept in zip(cash_items, cash_keep)
+            if kept
+        ]
+        cash_ratio_array = cash_ratio_all[cash_keep]
+        cash_amounts = revenue * cash_ratio_array
+        net_cash = float(cash_amounts.sum())
+        cash_df = pd.DataFrame(
             {
-                "項目": "フリーキャッシュフロー",
-                "金額": net_cash,
-                "構成比": net_cash / revenue,
+                "項目": cash_labels + ["フリーキャッシュフロー"],
+                "金額": np.append(cash_amounts, net_cash),
+                "構成比": np.append(cash_ratio_array, net_cash / revenue),
             }
         )
-    cash_df = pd.DataFrame(cash_records)
+    else:
+        cash_df = pd.DataFrame()
 
     return {
         "income": income_df,
@@ -3360,23 +3348,27 @@ def format_template_metric(metric: Dict[str, object]) -> str:
     return value_str
 
 
-def render_app_hero():
-    eyebrow = html.escape(t("header.eyebrow"))
-    title = html.escape(t("header.title"))
-    description = html.escape(t("header.description"))
+@st.cache_resource(show_spinner=False)
+def app_hero_html(language: str) -> str:
+    """ヒーロー領域の HTML を言語ごとに1回だけ組み立てる。"""
+
+    tr = partial(t, language=language)
+    eyebrow = html.escape(tr("header.eyebrow"))
+    title = html.escape(tr("header.title"))
+    description = html.escape(tr("header.description"))
 
     stats = [
         {
-            "value": t("header.stats.coverage.value", default="12ヶ月"),
-            "label": t("header.stats.coverage.label", default="ローリング期間"),
+            "value": tr("header.stats.coverage.value", default="12ヶ月"),
+            "label": tr("header.stats.coverage.label", default="ローリング期間"),
         },
         {
-            "value": t("header.stats.refresh.value", default="月次更新"),
-            "label": t("header.stats.refresh.label", default="更新頻度"),
+            "value": tr("header.stats.refresh.value", default="月次更新"),
+            "label": tr("header.stats.refresh.label", default="更新頻度"),
         },
         {
-            "value": t("header.stats.ai.value", default="AIサマリー"),
-            "label": t("header.stats.ai.label", default="分析モード"),
+            "value": tr("header.stats.ai.value", default="AIサマリー"),
+            "label": tr("header.stats.ai.label", default="分析モード"),
         },
     ]
     stat_items: List[str] = []
@@ -3401,24 +3393,24 @@ def render_app_hero():
     highlights = [
         {
             "icon": "📈",
-            "title": t("header.highlights.trend.title", default="勢いを一目で把握"),
-            "description": t(
+            "title": tr("header.highlights.trend.title", default="勢いを一目で把握"),
+            "description": tr(
                 "header.highlights.trend.description",
                 default="直近12カ月の推移から伸びと減速の兆しを見抜きます。",
             ),
         },
         {
             "icon": "🤖",
-            "title": t("header.highlights.copilot.title", default="AIが要点を要約"),
-            "description": t(
+            "title": tr("header.highlights.copilot.title", default="AIが要点を要約"),
+            "description": tr(
                 "header.highlights.copilot.description",
                 default="コパイロットがKPIの変化要因や注目SKUを短時間で提案します。",
             ),
         },
         {
             "icon": "🧭",
-            "title": t("header.highlights.workflow.title", default="次のアクションを導く"),
-            "description": t(
+            "title": tr("header.highlights.workflow.title", default="次のアクションを導く"),
+            "description": tr(
                 "header.highlights.workflow.description",
                 default="ランキング・比較・異常検知まで一気通貫で深掘りできます。",
             ),
@@ -3451,21 +3443,21 @@ def render_app_hero():
             .strip()
         )
 
-    primary_label = t("header.actions.primary.label", default="サンプルデータで試す")
-    primary_hint = t(
+    primary_label = tr("header.actions.primary.label", default="サンプルデータで試す")
+    primary_hint = tr(
         "header.actions.primary.description",
         default="テンプレートとデモデータですぐにダッシュボードを体験",
     )
-    secondary_label = t(
+    secondary_label = tr(
         "header.actions.secondary.label", default="データ取込ガイドを見る"
     )
-    secondary_hint = t(
+    secondary_hint = tr(
         "header.actions.secondary.description",
         default="CSV/Excel整形の手順とテンプレートを確認",
     )
-    primary_href = t("header.actions.primary.href", default="?nav=import")
-    secondary_href = t("header.actions.secondary.href", default="?nav=help")
-    action_note = t("header.actions.note", default="ダッシュボードの主要ワークフローをこの1画面に集約しました。")
+    primary_href = tr("header.actions.primary.href", default="?nav=import")
+    secondary_href = tr("header.actions.secondary.href", default="?nav=help")
+    action_note = tr("header.actions.note", default="ダッシュボードの主要ワークフローをこの1画面に集約しました。")
 
     stats_html = (
         f"<ul class='mck-hero__stats'>{''.join(stat_items)}</ul>" if stat_items else ""
@@ -3576,7 +3568,11 @@ def render_app_hero():
         .strip()
     )
 
-    st.markdown(hero_html, unsafe_allow_html=True)
+    return hero_html
+
+
+def render_app_hero():
+    st.markdown(app_hero_html(get_current_language()), unsafe_allow_html=True)
 
 
 def render_onboarding_modal() -> None:
@@ -3636,57 +3632,22 @@ def render_tour_banner() -> None:
 
     banner = st.container()
     with banner:
-        banner_class = "tour-banner" if active else "tour-banner tour-banner--muted"
-        st.markdown(f"<div class='{banner_class}'>", unsafe_allow_html=True)
         if active:
             step = TOUR_STEPS[idx]
-            section_label = step.get("section", "")
-            section_index = step.get("section_index", idx + 1)
-            section_total = step.get("section_total", total)
-            title_text = step.get("title") or step.get("heading") or step.get("label") or ""
-            description_text = step.get("description", "")
-            details_text = step.get("details", "")
-
-            if section_label:
-                st.markdown(
-                    f"<div class='tour-banner__section'>{html.escape(section_label)}<span>{section_index} / {section_total}</span></div>",
-                    unsafe_allow_html=True,
-                )
-
-            if title_text:
-                st.markdown(
-                    f"<div class='tour-banner__title'>{html.escape(title_text)}</div>",
-                    unsafe_allow_html=True,
-                )
-            if description_text:
-                st.markdown(
-                    f"<p class='tour-banner__desc'>{html.escape(description_text)}</p>",
-                    unsafe_allow_html=True,
-                )
-            if details_text:
-                st.markdown(
-                    f"<p class='tour-banner__details'>{html.escape(details_text)}</p>",
-                    unsafe_allow_html=True,
-                )
-
-            section_progress_label = (
-                f"{section_label} {section_index} / {section_total}"
-                if section_label
-                else f"STEP {idx + 1} / {total}"
-            )
-            progress_percent = ((idx + 1) / total) * 100 if total else 0
-            progress_html = f"""
-<div class='tour-progress'>
-  <div class='tour-progress__meta'>
-    <span>{html.escape(section_progress_label)}</span>
-    <span>STEP {idx + 1} / {total}</span>
-  </div>
-  <div class='tour-progress__track' role='progressbar' aria-valuemin='1' aria-valuemax='{total}' aria-valuenow='{idx + 1}'>
-    <div class='tour-progress__bar' style='width: {progress_percent:.2f}%;'></div>
-  </div>
-</div>
-"""
-            st.markdown(progress_html, unsafe_allow_html=True)
+            st.markdown(
+                tour_banner_html(
+                    muted=False,
+                    section=step.get("section", ""),
+                    section_index=step.get("section_index", idx + 1),
+                    section_total=step.get("section_total", total),
+                    title=step.get("title") or step.get("heading") or step.get("label") or "",
+                    description=step.get("description", ""),
+                    details=step.get("details", ""),
+                    step=idx + 1,
+                    total=total,
+                ),
+                unsafe_allow_html=True,
+            )
 
             st.markdown("<div class='tour-banner__nav'>", unsafe_allow_html=True)
             prev_col, next_col, finish_col = st.columns(3)
@@ -3743,17 +3704,6 @@ def render_tour_banner() -> None:
                 else ""
             )
 
-            if section_label:
-                st.markdown(
-                    f"<div class='tour-banner__section'>{html.escape(section_label)}<span>{section_index} / {section_total}</span></div>",
-                    unsafe_allow_html=True,
-                )
-
-            st.markdown(
-                "<p class='tour-banner__progress'>チュートリアルツアー</p>",
-                unsafe_allow_html=True,
-            )
-
             if completed and idx == total - 1:
                 desc_text = "基礎編から応用編までのツアーを完了しました。必要なときにいつでも振り返りできます。"
             elif last_step:
@@ -3764,30 +3714,19 @@ def render_tour_banner() -> None:
                 desc_text = "再開ボタンでいつでもハイライトを確認できます。"
 
             st.markdown(
-                f"<p class='tour-banner__desc'>{html.escape(desc_text)}</p>",
+                tour_banner_html(
+                    muted=True,
+                    section=section_label,
+                    section_index=section_index,
+                    section_total=section_total,
+                    eyebrow="チュートリアルツアー",
+                    description=desc_text,
+                    step=idx + 1 if last_step else 0,
+                    total=total,
+                ),
                 unsafe_allow_html=True,
             )
 
-            if last_step:
-                section_progress_label = (
-                    f"{section_label} {section_index} / {section_total}"
-                    if section_label
-                    else f"STEP {idx + 1} / {total}"
-                )
-                progress_percent = ((idx + 1) / total) * 100 if total else 0
-                progress_html = f"""
-<div class='tour-progress'>
-  <div class='tour-progress__meta'>
-    <span>{html.escape(section_progress_label)}</span>
-    <span>STEP {idx + 1} / {total}</span>
-  </div>
-  <div class='tour-progress__track' role='progressbar' aria-valuemin='1' aria-valuemax='{total}' aria-valuenow='{idx + 1}'>
-    <div class='tour-progress__bar' style='width: {progress_percent:.2f}%;'></div>
-  </div>
-</div>
-"""
-                st.markdown(progress_html, unsafe_allow_html=True)
-
             st.markdown(
                 "<div class='tour-banner__nav tour-banner__nav--resume'>",
                 unsafe_allow_html=True,
@@ -3820,85 +3759,80 @@ def render_tour_banner() -> None:
                     st.session_state.tour_pending_nav = TOUR_STEPS[0]["nav_key"]
                 st.rerun()
 
-        st.markdown("</div>", unsafe_allow_html=True)
-
 
-def apply_tour_highlight(step: Optional[Dict[str, str]]) -> None:
-    payload = {
-        "key": step.get("key") if step else "",
-        "navKey": step.get("nav_key") if step else "",
-        "label": step.get("label") if step else "",
-        "heading": step.get("heading") if step else "",
-    }
-    script = f"""
-    <script>
-    const STEP = {json.dumps(payload, ensure_ascii=False)};
+# ハイライト処理本体（STEP の中身だけが呼び出しごとに変わる）
+_TOUR_HIGHLIGHT_JS = r"""
     const normalize = (text) => (text || '').replace(/\s+/g, ' ').trim();
     const doc = window.parent.document;
-    const run = () => {{
+    const run = () => {
         const root = doc.documentElement;
-        if (STEP.key) {{
+        if (STEP.key) {
             root.setAttribute('data-tour-key', STEP.key);
-        }} else {{
+        } else {
             root.removeAttribute('data-tour-key');
-        }}
+        }
 
         const sidebar = doc.querySelector('section[data-testid="stSidebar"]');
-        if (sidebar) {{
+        if (sidebar) {
             sidebar.querySelectorAll('.tour-highlight-nav').forEach((el) => el.classList.remove('tour-highlight-nav'));
             let target = null;
-            if (STEP.navKey) {{
-                target = sidebar.querySelector(`label[data-nav-key="${{STEP.navKey}}"]`);
-            }}
-            if (!target && STEP.label) {{
+            if (STEP.navKey) {
+                target = sidebar.querySelector(`label[data-nav-key="${STEP.navKey}"]`);
+            }
+            if (!target && STEP.label) {
                 const labels = Array.from(sidebar.querySelectorAll('label'));
                 target = labels.find((el) => normalize(el.innerText) === normalize(STEP.label));
-            }}
-            if (target) {{
+            }
+            if (target) {
                 target.classList.add('tour-highlight-nav');
-                target.scrollIntoView({{ block: 'nearest' }});
-            }}
-        }}
+                target.scrollIntoView({ block: 'nearest' });
+            }
+        }
 
         doc.querySelectorAll('.tour-highlight-heading').forEach((el) => el.classList.remove('tour-highlight-heading'));
-        if (STEP.heading) {{
+        if (STEP.heading) {
             const headings = Array.from(doc.querySelectorAll('h1, h2, h3'));
             const targetHeading = headings.find((el) => normalize(el.innerText) === normalize(STEP.heading));
-            if (targetHeading) {{
+            if (targetHeading) {
                 const container = targetHeading.closest('.mck-section-header') || targetHeading.parentElement;
-                if (container) {{
+                if (container) {
                     container.classList.add('tour-highlight-heading');
-                    container.scrollIntoView({{ block: 'start', behavior: 'smooth' }});
-                }}
-            }}
-        }}
+                    container.scrollIntoView({ block: 'start', behavior: 'smooth' });
+                }
+            }
+        }
 
         const hints = Array.from(doc.querySelectorAll('div, span')).filter((el) => normalize(el.textContent).includes('→キーで次へ'));
         hints.forEach((el) => el.remove());
-    }};
+    };
     setTimeout(run, 120);
     </script>
-    """
+"""
+
+
+def apply_tour_highlight(step: Optional[Dict[str, str]]) -> None:
+    payload = {
+        "key": step.get("key") if step else "",
+        "navKey": step.get("nav_key") if step else "",
+        "label": step.get("label") if step else "",
+        "heading": step.get("heading") if step else "",
+    }
+    previous = st.session_state.get("_tour_highlight_payload")
+    st.session_state["_tour_highlight_payload"] = payload
+    # ツアー終了後は、消すべきハイライトが無ければ iframe 自体を出さない
+    if not any(payload.values()) and not (previous and any(previous.values())):
+        return
+    script = (
+        "\n    <script>\n    const STEP = "
+        + json.dumps(payload, ensure_ascii=False)
+        + ";\n"
+        + _TOUR_HIGHLIGHT_JS.lstrip("\n")
+    )
     components.html(script, height=0)
 def section_header(
     title: str, subtitle: Optional[str] = None, icon: Optional[str] = None
 ):
-    icon_html = f"<span class='mck-section-icon'>{icon}</span>" if icon else ""
-    subtitle_html = (
-        f"<p class='mck-section-subtitle'>{subtitle}</p>" if subtitle else ""
-    )
-    st.markdown(
-        f"""
-        <div class=\"mck-section-header\">
-            {icon_html}
-            <div>
-                <h2>{title}</h2>
-                {subtitle_html}
-            </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+    st.markdown(section_header_html(title, subtitle, icon), unsafe_allow_html=True)
 
 
 def clip_text(value: str, width: int = 220) -> str:
@@ -3914,6 +3848,9 @@ def require_data():
 
 
 def month_options(df: pd.DataFrame) -> List[str]:
+    # 保存済みの年計データなら SKU×月 行列の列（昇順の月）を使い、全行の unique を省く
+    if df is st.session_state.get("data_year"):
+        return get_year_sum_matrix().months.tolist()
     return sorted(df["month"].dropna().unique().tolist())
 
 
@@ -3954,17 +3891,62 @@ def end_month_selector(
     )
 
 
-def download_excel(df: pd.DataFrame, filename: str) -> bytes:
-    import xlsxwriter  # noqa
+# 文字列は文字列のまま書く（数式・URL 判定の走査を省き、"=" 始まりの値が数式化するのも防ぐ）
+_XLSX_WRITE_OPTIONS = {
+    "strings_to_numbers": False,
+    "strings_to_formulas": False,
+    "strings_to_urls": False,
+}
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def download_excel(df: pd.DataFrame, filename: str, *, styled: bool = False) -> bytes:
+    """DataFrame を xlsx のバイト列に変換する。
+
+    既定では xlsxwriter の ``constant_memory`` モードで1行ずつ書き出し、
+    ピークメモリを行数に依存させない。``styled=True`` の場合は従来どおり
+    ``pd.ExcelWriter`` 経由で書き出す。ダウンロードボタンの ``data`` として
+    再実行のたびに呼ばれるため、入力が同じなら作成済みのバイト列を返す。
+    """
+    import xlsxwriter
 
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="data")
+    if styled:
+        with pd.ExcelWriter(
+            output,
+            engine="xlsxwriter",
+            engine_kwargs={"options": dict(_XLSX_WRITE_OPTIONS)},
+        ) as writer:
+            df.to_excel(writer, index=False, sheet_name="data")
+        return output.getvalue()
+
+    workbook = xlsxwriter.Workbook(
+        output, {"constant_memory": True, **_XLSX_WRITE_OPTIONS}
+    )
+    worksheet = workbook.add_worksheet("data")
+    header_fmt = workbook.add_format(
+        {"bold": True, "border": 1, "align": "center", "valign": "top"}
+    )
+    date_fmt = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    col_fmts = [
+        date_fmt if pd.api.types.is_datetime64_any_dtype(dtype) else None
+        for dtype in df.dtypes
+    ]
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], header_fmt)
+    # constant_memory では行を昇順にしか書けないため、先頭から順に流し込む
+    for r, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        for c, value in enumerate(row):
+            if pd.isna(value):
+                continue
+            worksheet.write(r, c, value, col_fmts[c])
+    workbook.close()
     return output.getvalue()
 
 
+@st.cache_data(show_spinner=False, max_entries=16)
 def download_pdf_overview(kpi: dict, top_df: pd.DataFrame, filename: str) -> bytes:
     # Minimal PDF using reportlab (text only)
+    # 入力が同じなら st.cache_data が作成済みの PDF を返す（reportlab は触らない）
     from reportlab.lib.pagesizes import A4
     from reportlab.pdfgen import canvas
 
@@ -3984,13 +3966,11 @@ def download_pdf_overview(kpi: dict, top_df: pd.DataFrame, filename: str) -> byt
     c.drawString(40, y, "TOP10（年計）")
     y -= 18
     c.setFont("Helvetica", 10)
-    cols = ["product_code", "product_name", "year_sum"]
-    for _, row in top_df[cols].head(10).iterrows():
-        c.drawString(
-            40,
-            y,
-            f"{row['product_code']}  {row['product_name']}  {int(row['year_sum']):,}",
-        )
+    top = top_df[["product_code", "product_name", "year_sum"]].head(10)
+    # 年計の桁区切りはループ前にまとめて作っておく
+    year_sums = [format_int(v) for v in top["year_sum"].tolist()]
+    for code, name, year_sum in zip(top["product_code"], top["product_name"], year_sums):
+        c.drawString(40, y, f"{code}  {name}  {year_sum}")
         y -= 12
         if y < 60:
             c.showPage()
@@ -4001,6 +3981,165 @@ def download_pdf_overview(kpi: dict, top_df: pd.DataFrame, filename: str) -> byt
     return buffer.getvalue()
 
 
+YEAR_DISPLAY_COLUMNS = ["display_name", "month_dt"]
+
+
+def attach_display_columns(year_df: pd.DataFrame) -> pd.DataFrame:
+    """表示名・datetime 版の月列・カテゴリ型のSKUコードを取込時に一度だけ付与する。"""
+
+    year_df["display_name"] = year_df["product_name"].fillna(year_df["product_code"])
+    year_df["month_dt"] = pd.to_datetime(year_df["month"], format="%Y-%m")
+    # SKUコードは全コードを固定したカテゴリ型にし、isin/groupby/pivot を整数コードで処理する
+    codes = year_df["product_code"].astype(str)
+    year_df["product_code"] = codes.astype(pd.CategoricalDtype(np.sort(codes.unique())))
+    return year_df
+
+
+def code_row_slices(year_df: pd.DataFrame) -> Dict[str, Tuple[int, int]]:
+    """(product_code, month) 順に並んだ年計データから SKU ごとの行範囲を返す。"""
+
+    cat = year_df["product_code"].cat
+    codes, starts, counts = np.unique(
+        cat.codes.to_numpy(), return_index=True, return_counts=True
+    )
+    return {
+        cat.categories[code]: (int(start), int(start + count))
+        for code, start, count in zip(codes, starts, counts)
+    }
+
+
+def store_year_data(year_df: pd.DataFrame) -> pd.DataFrame:
+    """年計データと SKU×月 行列・コード→商品名の対応をセッションに保存する。
+
+    年計データは (product_code, month) 順に並べ替えて保存し、SKU 単位の
+    抽出は ``data_year_slices`` の行範囲スライスで済ませる。
+    """
+
+    year_df = attach_display_columns(year_df).sort_values(
+        ["product_code", "month"], ignore_index=True
+    )
+    st.session_state.data_year = year_df
+    st.session_state.data_year_slices = code_row_slices(year_df)
+    st.session_state.code_to_name = (
+        year_df[["product_code", "product_name"]]
+        .drop_duplicates()
+        .set_index("product_code")["product_name"]
+        .to_dict()
+    )
+    st.session_state.data_year_matrix = year_sum_matrix(year_df)
+    st.session_state.data_version = st.session_state.get("data_version", 0) + 1
+    return year_df
+
+
+SNAPSHOT_AUX_LIMIT = 8
+# 相関ヒートマップはこの辺長までセルに数値を描く（超えると判読できず描画も重い）
+CORR_HEATMAP_TEXT_MAX = 15
+
+
+def session_memo(name: str, key: Any, build: Callable[[], Any], limit: int = SNAPSHOT_AUX_LIMIT) -> Any:
+    """``build()`` の結果をセッション内で ``key`` ごとに保持する。
+
+    データ版 (``data_version``) が変わったら ``name`` の保持分をまとめて破棄し、
+    件数が ``limit`` を超えたら古いものから捨てる。
+    """
+
+    version = st.session_state.get("data_version", 0)
+    memo = st.session_state.get(name)
+    if not memo or memo.get("version") != version:
+        memo = {"version": version, "entries": {}}
+        st.session_state[name] = memo
+    entries: Dict[Any, Any] = memo["entries"]
+    if key not in entries:
+        if len(entries) >= limit:
+            entries.pop(next(iter(entries)))
+        entries[key] = build()
+    return entries[key]
+
+
+def _snapshot_option_labels(snap: pd.DataFrame) -> Dict[str, object]:
+    """「コード | 表示名」の選択肢と、ラベル→コード・コード→位置の対応表を作る。"""
+
+    codes = snap["product_code"].astype(str).to_numpy(dtype=object)
+    labels = codes + " | " + snap["display_name"].fillna("").to_numpy(dtype=object)
+    keep = [label.strip() != "|" for label in labels]
+    codes, labels = codes[keep].tolist(), labels[keep].tolist()
+    return {
+        "option_labels": labels,
+        "option_code": dict(zip(labels, codes)),
+        "option_index": {code: i for i, code in enumerate(codes)},
+    }
+
+
+def get_snapshot_aux(year_df: pd.DataFrame, end_m: str, search: str = "") -> Dict[str, object]:
+    """比較ビュー用のスナップショットと派生値を (end_m, 検索語) ごとに保持する。
+
+    データ版 (``data_version``) が変わったら破棄し、ウィジェット操作だけの
+    再実行ではスナップショット抽出・順位最大値・YoY 並べ替えを再計算しない。
+    """
+
+    def build() -> Dict[str, object]:
+        snap = latest_yearsum_snapshot(year_df, end_m)
+        if search:
+            snap = snap[snap["display_name"].str.contains(search, case=False, na=False)]
+        arrays = snapshot_arrays(snap)
+        aux = {
+            "snapshot": snap,
+            "arrays": arrays,
+            "max_rank": int(snap["rank"].max()) if not snap.empty else 1,
+            "yoy_desc_codes": top_k_codes(arrays, "yoy", len(snap)),
+        }
+        aux.update(_snapshot_option_labels(snap))
+        return aux
+
+    return session_memo("snapshot_aux_memo", (end_m, search), build)
+
+
+def get_code_row_slices() -> Dict[str, Tuple[int, int]]:
+    """保存済みの SKU→行範囲 対応を返す（未作成なら data_year から作る）。"""
+
+    slices = st.session_state.get("data_year_slices")
+    if slices is None:
+        slices = code_row_slices(st.session_state.data_year)
+        st.session_state.data_year_slices = slices
+    return slices
+
+
+def year_table_parquet_bytes() -> bytes:
+    """保存済み年計テーブルの Parquet バイト列を返す（データ版ごとに1回だけ書き出す）。"""
+
+    def build() -> bytes:
+        year_df = st.session_state.data_year
+        return to_parquet_bytes(year_df.drop(columns=YEAR_DISPLAY_COLUMNS, errors="ignore"))
+
+    return session_memo("year_parquet_memo", "data_year", build, limit=1)
+
+
+def get_year_sum_matrix() -> YearSumMatrix:
+    """保存済みの SKU×月 行列を返す（未作成なら data_year から作る）。"""
+
+    matrix = st.session_state.get("data_year_matrix")
+    if matrix is None:
+        matrix = year_sum_matrix(st.session_state.data_year)
+        st.session_state.data_year_matrix = matrix
+    return matrix
+
+
+def month_year_sum_total(year_df: pd.DataFrame, month: str) -> float:
+    """指定月の年計合計を返す。
+
+    保存済みの年計データなら SKU×月 行列の1列を足すだけで済ませ、
+    月ごとに全行を比較するマスクを作らない。
+    """
+
+    if year_df is st.session_state.get("data_year"):
+        matrix = get_year_sum_matrix()
+        pos = int(np.searchsorted(matrix.months, month))
+        if pos < len(matrix.months) and matrix.months[pos] == month:
+            return float(np.nansum(matrix.values[:, pos]))
+        return 0.0
+    return float(year_df.loc[year_df["month"] == month, "year_sum"].sum())
+
+
 def process_long_dataframe(long_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """Normalize long-form sales data and update session state tables."""
 
@@ -4014,7 +4153,7 @@ def process_long_dataframe(long_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Data
     year_df = compute_slopes(year_df, last_n=last_n)
 
     st.session_state.data_monthly = normalized
-    st.session_state.data_year = year_df
+    year_df = store_year_data(year_df)
     return normalized, year_df
 
 
@@ -4042,10 +4181,15 @@ def format_amount(val: Optional[float], unit: str) -> str:
     return f"{format_int(val / scale)} {unit}".strip()
 
 
+_fmt_int = "{:,}".format
+
+
 def format_int(val: float | int) -> str:
     """Format a number with commas and no decimal part."""
     try:
-        return f"{int(round(val)):,}"
+        if isinstance(val, int):
+            return _fmt_int(val)
+        return _fmt_int(int(round(val)))
     except (TypeError, ValueError):
         return "0"
 
@@ -4056,6 +4200,27 @@ def render_dataset_metric_cards(
     if data_year is None or getattr(data_year, "empty", True) or not end_month:
         return
     unit = st.session_state.settings.get("currency_unit", "円")
+
+    def build() -> List[Dict[str, object]]:
+        return _dataset_metric_cards(data_year, end_month, unit)
+
+    # 保存済みデータなら (終端月, 単位) ごとにカード内容を保持し、KPI・HHI の再計算を省く
+    if data_year is st.session_state.get("data_year"):
+        cards = session_memo("dataset_cards_memo", (end_month, unit), build)
+    else:
+        cards = build()
+    render_icon_label(
+        "metrics",
+        "主要指標サマリー",
+        "Key KPI snapshot",
+        help_text="年計基準のKPIをカード形式で表示します。ダッシュボードに移動する前に全体感を把握できます。",
+    )
+    render_metric_cards(cards, columns=min(4, len(cards)))
+
+
+def _dataset_metric_cards(
+    data_year: pd.DataFrame, end_month: str, unit: str
+) -> List[Dict[str, object]]:
     kpi = aggregate_overview(data_year, end_month)
     hhi_val = compute_hhi(data_year, end_month)
     sku_count = int(data_year["product_code"].nunique()) if "product_code" in data_year.columns else 0
@@ -4099,13 +4264,7 @@ def render_dataset_metric_cards(
     cards.append(
         _card("SKU数", "アクティブ件数", f"{sku_count:,}", "sku")
     )
-    render_icon_label(
-        "metrics",
-        "主要指標サマリー",
-        "Key KPI snapshot",
-        help_text="年計基準のKPIをカード形式で表示します。ダッシュボードに移動する前に全体感を把握できます。",
-    )
-    render_metric_cards(cards, columns=min(4, len(cards)))
+    return cards
 
 
 def _detect_column(
@@ -4128,18 +4287,17 @@ def _resolve_store_options(
     )
     if not store_column:
         return ["全体"], None
-    values = (
-        df[store_column]
-        .dropna()
-        .astype(str)
-        .str.strip()
-        .replace({"": None})
-        .dropna()
-        .unique()
-        .tolist()
-    )
-    values = sorted(values)
-    return ["全体"] + values, store_column
+
+    def build() -> List[str]:
+        # 文字列化の直後に重複を落とし、空白除去・空判定は店舗の種類数だけ行う
+        raw = df[store_column].dropna().astype(str).unique()
+        values = {value.strip() for value in raw}
+        values.discard("")
+        return ["全体"] + sorted(values)
+
+    if df is st.session_state.get("data_monthly"):
+        return session_memo("store_options_memo", store_column, build), store_column
+    return build(), store_column
 
 
 def _detect_channel_column(df: Optional[pd.DataFrame]) -> Optional[str]:
@@ -4299,8 +4457,7 @@ def _compute_financial_snapshot(
     ):
         return base_snapshot
 
-    snapshot = year_df[year_df["month"] == month].dropna(subset=["year_sum"])
-    total_revenue = float(snapshot["year_sum"].sum())
+    total_revenue = month_year_sum_total(year_df, month)
     if total_revenue <= 0:
         return base_snapshot
 
@@ -4613,15 +4770,13 @@ def _render_sales_tab(
                 )
 
         if fig is not None:
-            fig = apply_elegant_theme(
-                fig, theme=st.session_state.get("ui_theme", "light")
-            )
+            fig = apply_elegant_theme(fig, theme=ui_theme)
             render_plotly_with_spinner(
                 fig, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
             )
             if not download_df.empty:
                 trend_cols = st.columns([2, 1])
-                csv_bytes = download_df.to_csv(index=False).encode("utf-8-sig")
+                csv_bytes = to_csv_bytes(download_df)
                 with trend_cols[0]:
                     st.download_button(
                         "トレンドCSVをダウンロード",
@@ -4706,7 +4861,7 @@ def _render_sales_tab(
             "前年同月比(%)": "{:.1f}%",
             f"前月差({unit})": "{:,.0f}",
         }
-        detail_csv_data = detail_display_df.to_csv(index=False).encode("utf-8-sig")
+        detail_csv_data = to_csv_bytes(detail_display_df)
 
         pdf_table_df = detail_df[
             ["product_code", "product_name", "year_sum", "sales_amount_jpy"]
@@ -4810,9 +4965,7 @@ def _render_sales_tab(
                     tickvals=tick_vals,
                     ticktext=tick_text,
                 )
-                fig_prod = apply_elegant_theme(
-                    fig_prod, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_prod = apply_elegant_theme(fig_prod, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_prod, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -4857,9 +5010,7 @@ def _render_sales_tab(
                     xaxis_title=f"売上 ({unit})",
                     yaxis_title="チャネル",
                 )
-                fig_channel = apply_elegant_theme(
-                    fig_channel, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_channel = apply_elegant_theme(fig_channel, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_channel, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -4933,9 +5084,7 @@ def _render_sales_tab(
                 range=[0, 105],
                 secondary_y=True,
             )
-            fig_abc = apply_elegant_theme(
-                fig_abc, theme=st.session_state.get("ui_theme", "light")
-            )
+            fig_abc = apply_elegant_theme(fig_abc, theme=ui_theme)
             render_plotly_with_spinner(
                 fig_abc, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
             )
@@ -5133,9 +5282,7 @@ def _render_gross_profit_tab(
         )
         fig_amount.update_yaxes(title=f"粗利額 ({unit})", tickformat=",.0f")
         fig_amount.update_xaxes(title="月", tickformat="%Y-%m", dtick="M1")
-        fig_amount = apply_elegant_theme(
-            fig_amount, theme=st.session_state.get("ui_theme", "light")
-        )
+        fig_amount = apply_elegant_theme(fig_amount, theme=ui_theme)
         render_plotly_with_spinner(
             fig_amount, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
         )
@@ -5169,9 +5316,7 @@ def _render_gross_profit_tab(
         )
         fig_margin.update_yaxes(title="粗利率(%)", tickformat=",.1f")
         fig_margin.update_xaxes(title="月", tickformat="%Y-%m", dtick="M1")
-        fig_margin = apply_elegant_theme(
-            fig_margin, theme=st.session_state.get("ui_theme", "light")
-        )
+        fig_margin = apply_elegant_theme(fig_margin, theme=ui_theme)
         render_plotly_with_spinner(
             fig_margin, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
         )
@@ -5263,9 +5408,7 @@ def _render_gross_profit_tab(
                     tickvals=tick_vals,
                     ticktext=tick_text,
                 )
-                fig_prod = apply_elegant_theme(
-                    fig_prod, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_prod = apply_elegant_theme(fig_prod, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_prod, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -5323,9 +5466,7 @@ def _render_gross_profit_tab(
                         yaxis_title="粗利率(%)",
                         xaxis_title="月",
                     )
-                    fig_margin = apply_elegant_theme(
-                        fig_margin, theme=st.session_state.get("ui_theme", "light")
-                    )
+                    fig_margin = apply_elegant_theme(fig_margin, theme=ui_theme)
                     render_plotly_with_spinner(
                         fig_margin,
                         config=PLOTLY_CONFIG,
@@ -5404,7 +5545,7 @@ def _render_gross_profit_tab(
                 use_container_width=True,
             )
 
-            csv_data = display_df.to_csv(index=False).encode("utf-8-sig")
+            csv_data = to_csv_bytes(display_df)
             clicked = st.download_button(
                 "CSVダウンロード",
                 data=csv_data,
@@ -5543,9 +5684,7 @@ def _render_inventory_tab(
     )
     fig_inventory.update_yaxes(title=f"在庫残高 ({unit})", tickformat=",.0f")
     fig_inventory.update_xaxes(title="月", tickformat="%Y-%m", dtick="M1")
-    fig_inventory = apply_elegant_theme(
-        fig_inventory, theme=st.session_state.get("ui_theme", "light")
-    )
+    fig_inventory = apply_elegant_theme(fig_inventory, theme=ui_theme)
     render_plotly_with_spinner(
         fig_inventory, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
     )
@@ -5579,9 +5718,7 @@ def _render_inventory_tab(
     )
     fig_turnover.update_yaxes(title="在庫回転率(回)", tickformat=",.2f")
     fig_turnover.update_xaxes(title="月", tickformat="%Y-%m", dtick="M1")
-    fig_turnover = apply_elegant_theme(
-        fig_turnover, theme=st.session_state.get("ui_theme", "light")
-    )
+    fig_turnover = apply_elegant_theme(fig_turnover, theme=ui_theme)
     render_plotly_with_spinner(
         fig_turnover, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
     )
@@ -5668,9 +5805,7 @@ def _render_inventory_tab(
             xaxis_title=f"在庫金額 ({unit})",
             yaxis_title="カテゴリー",
         )
-        fig_category = apply_elegant_theme(
-            fig_category, theme=st.session_state.get("ui_theme", "light")
-        )
+        fig_category = apply_elegant_theme(fig_category, theme=ui_theme)
         render_plotly_with_spinner(
             fig_category, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
         )
@@ -5710,9 +5845,7 @@ def _render_inventory_tab(
                 xaxis_title=f"在庫金額 ({unit})",
                 yaxis_title="",
             )
-            fig_inv = apply_elegant_theme(
-                fig_inv, theme=st.session_state.get("ui_theme", "light")
-            )
+            fig_inv = apply_elegant_theme(fig_inv, theme=ui_theme)
             render_plotly_with_spinner(
                 fig_inv, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
             )
@@ -5745,9 +5878,7 @@ def _render_inventory_tab(
                 margin=dict(l=10, r=10, t=30, b=10),
                 yaxis_tickformat="+.0%",
             )
-            fig_turnover = apply_elegant_theme(
-                fig_turnover, theme=st.session_state.get("ui_theme", "light")
-            )
+            fig_turnover = apply_elegant_theme(fig_turnover, theme=ui_theme)
             render_plotly_with_spinner(
                 fig_turnover, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
             )
@@ -5790,7 +5921,7 @@ def _render_inventory_tab(
                 ),
                 use_container_width=True,
             )
-            csv_data = display_df.to_csv(index=False).encode("utf-8-sig")
+            csv_data = to_csv_bytes(display_df)
             clicked = st.download_button(
                 "CSVダウンロード",
                 data=csv_data,
@@ -5927,7 +6058,7 @@ def _render_funds_tab(
             legend=dict(orientation="h", yanchor="bottom", y=1.02, x=0.0),
         )
         fig.update_xaxes(title="月", tickformat="%Y-%m", dtick="M1")
-        fig = apply_elegant_theme(fig, theme=st.session_state.get("ui_theme", "light"))
+        fig = apply_elegant_theme(fig, theme=ui_theme)
         render_plotly_with_spinner(
             fig, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
         )
@@ -5975,9 +6106,7 @@ def _render_funds_tab(
             xaxis=dict(tickformat=",.0f"),
         )
         fig_latest.update_yaxes(categoryorder="array", categoryarray=latest_flows["category"])
-        fig_latest = apply_elegant_theme(
-            fig_latest, theme=st.session_state.get("ui_theme", "light")
-        )
+        fig_latest = apply_elegant_theme(fig_latest, theme=ui_theme)
         render_plotly_with_spinner(
             fig_latest, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
         )
@@ -6006,7 +6135,7 @@ def _render_funds_tab(
                 ),
                 use_container_width=True,
             )
-            csv_data = display_df.to_csv(index=False).encode("utf-8-sig")
+            csv_data = to_csv_bytes(display_df)
             clicked = st.download_button(
                 "CSVダウンロード",
                 data=csv_data,
@@ -9103,6 +9232,8 @@ Use the recommended fields and metrics as a checklist to prevent omissions."""
         )
         fields = template_config.get("fields", [])
         metrics_list = template_config.get("recommended_metrics", [])
+        # カードと棒グラフのラベルで共用するため表示値は1回だけ整形する
+        metric_displays = [format_template_metric(metric) for metric in metrics_list]
         col_fields, col_metrics = st.columns([1, 2])
         with col_fields:
             render_icon_label(
@@ -9132,12 +9263,12 @@ No additional recommended columns in this template."""
             )
             if metrics_list:
                 metric_cards: List[Dict[str, object]] = []
-                for metric in metrics_list:
+                for metric, display in zip(metrics_list, metric_displays):
                     metric_cards.append(
                         {
                             "title": metric.get("name", "指標"),
                             "subtitle": "Template KPI",
-                            "value": format_template_metric(metric),
+                            "value": display,
                             "icon": detect_metric_icon(metric.get("name", "")),
                             "footnote": metric.get("description", ""),
                             "tooltip": metric.get("description", ""),
@@ -9150,7 +9281,7 @@ No additional recommended columns in this template."""
 No auto-calculated metrics are linked to this template."""
                 )
         if metrics_list:
-            render_metric_bar_chart(metrics_list)
+            render_metric_bar_chart(metrics_list, metric_displays)
         template_preview_df = build_industry_template_dataframe(active_template, months=6)
         if not template_preview_df.empty:
             with st.expander(
@@ -9432,7 +9563,7 @@ After validating and mapping the CSV/XLSX, yearly KPIs will be calculated automa
                 )
                 download_clicked = st.download_button(
                     "年計テーブルをCSVでダウンロード / Download yearly table (CSV)",
-                    data=data_year.to_csv(index=False).encode("utf-8-sig"),
+                    data=to_csv_bytes(data_year.drop(columns=YEAR_DISPLAY_COLUMNS, errors="ignore")),
                     file_name="year_rolling.csv",
                     mime="text/csv",
                     help="年計やYoYなどの計算結果をCSVで保存し、他システムと共有できます。/ Export yearly KPIs as CSV for sharing.",
@@ -9444,6 +9575,13 @@ After validating and mapping the CSV/XLSX, yearly KPIs will be calculated automa
                         key="import_year_csv_ready",
                         guide="ダウンロードしたCSVを共有し、最新の年計指標を連携できます。",
                     )
+                st.download_button(
+                    "年計テーブルをParquetでダウンロード / Download yearly table (Parquet)",
+                    data=year_table_parquet_bytes(),
+                    file_name="year_rolling.parquet",
+                    mime="application/vnd.apache.parquet",
+                    help="型を保ったまま小さく保存でき、pandas や DuckDB などの分析ツールで素早く読み込めます。/ Compact typed snapshot for analysis tools.",
+                )
             st.caption(
                 """ダッシュボードやランキングに移動して、AIサマリーやPDF出力を活用しましょう。
 Move to the dashboard or ranking pages to use AI summaries and PDF exports."""
@@ -9458,7 +9596,7 @@ Move to the dashboard or ranking pages to use AI summaries and PDF exports."""
             )
             download_clicked = st.download_button(
                 "年計テーブルをCSVでダウンロード / Download yearly table (CSV)",
-                data=data_year.to_csv(index=False).encode("utf-8-sig"),
+                data=to_csv_bytes(data_year.drop(columns=YEAR_DISPLAY_COLUMNS, errors="ignore")),
                 file_name="year_rolling.csv",
                 mime="text/csv",
             )
@@ -9469,6 +9607,13 @@ Move to the dashboard or ranking pages to use AI summaries and PDF exports."""
                     key="import_year_csv_ready",
                     guide="ダウンロードしたCSVを共有し、最新の年計指標を連携できます。",
                 )
+            st.download_button(
+                "年計テーブルをParquetでダウンロード / Download yearly table (Parquet)",
+                data=year_table_parquet_bytes(),
+                file_name="year_rolling.parquet",
+                mime="application/vnd.apache.parquet",
+                help="型を保ったまま小さく保存でき、pandas や DuckDB などの分析ツールで素早く読み込めます。/ Compact typed snapshot for analysis tools.",
+            )
             st.caption(
                 """現在のデータセットに基づく品質サマリーを取得しています。
 Quality metrics are available for the current dataset."""
@@ -9886,9 +10031,7 @@ elif page == "経営ダッシュボード":
                 )
                 fig_trend.update_xaxes(title="月")
                 fig_trend.update_yaxes(title="金額（円）", tickformat=",.0f")
-                fig_trend = apply_elegant_theme(
-                    fig_trend, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_trend = apply_elegant_theme(fig_trend, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_trend, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -9916,9 +10059,7 @@ elif page == "経営ダッシュボード":
                     xaxis_title="金額（円）",
                     yaxis_title="カテゴリ",
                 )
-                fig_category = apply_elegant_theme(
-                    fig_category, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_category = apply_elegant_theme(fig_category, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_category, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -9944,9 +10085,7 @@ elif page == "経営ダッシュボード":
                     xaxis_title="金額（円）",
                     yaxis_title="チャネル",
                 )
-                fig_channel = apply_elegant_theme(
-                    fig_channel, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_channel = apply_elegant_theme(fig_channel, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_channel, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -9981,7 +10120,7 @@ elif page == "経営ダッシュボード":
             )
 
             csv_bytes = (
-                detail_df[display_cols].to_csv(index=False).encode("utf-8-sig")
+                to_csv_bytes(detail_df[display_cols])
             )
             pdf_table_df = (
                 detail_df.groupby("商品", as_index=False)["売上"].sum()
@@ -10116,9 +10255,7 @@ elif page == "経営ダッシュボード":
                     range=[0, 100],
                     secondary_y=True,
                 )
-                fig_gross = apply_elegant_theme(
-                    fig_gross, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_gross = apply_elegant_theme(fig_gross, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_gross, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -10148,7 +10285,7 @@ elif page == "経営ダッシュボード":
                 )
                 fig_gross_product = apply_elegant_theme(
                     fig_gross_product,
-                    theme=st.session_state.get("ui_theme", "light"),
+                    theme=ui_theme,
                 )
                 render_plotly_with_spinner(
                     fig_gross_product,
@@ -10179,7 +10316,7 @@ elif page == "経営ダッシュボード":
                 )
                 fig_store_gross = apply_elegant_theme(
                     fig_store_gross,
-                    theme=st.session_state.get("ui_theme", "light"),
+                    theme=ui_theme,
                 )
                 render_plotly_with_spinner(
                     fig_store_gross,
@@ -10248,9 +10385,7 @@ elif page == "経営ダッシュボード":
                     xaxis_title="推定在庫（円）",
                     yaxis_title="商品",
                 )
-                fig_sku = apply_elegant_theme(
-                    fig_sku, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_sku = apply_elegant_theme(fig_sku, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_sku, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -10277,9 +10412,7 @@ elif page == "経営ダッシュボード":
                     xaxis_title="推定在庫（円）",
                     yaxis_title="店舗",
                 )
-                fig_store_inv = apply_elegant_theme(
-                    fig_store_inv, theme=st.session_state.get("ui_theme", "light")
-                )
+                fig_store_inv = apply_elegant_theme(fig_store_inv, theme=ui_theme)
                 render_plotly_with_spinner(
                     fig_store_inv, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
                 )
@@ -10399,9 +10532,7 @@ elif page == "経営ダッシュボード":
             yaxis_title="残高（円）",
             legend=dict(orientation="h", yanchor="bottom", y=1.02, x=0.0),
         )
-        fig_cash = apply_elegant_theme(
-            fig_cash, theme=st.session_state.get("ui_theme", "light")
-        )
+        fig_cash = apply_elegant_theme(fig_cash, theme=ui_theme)
         render_plotly_with_spinner(
             fig_cash, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
         )
@@ -10429,9 +10560,7 @@ elif page == "経営ダッシュボード":
             yaxis_title="金額（円）",
             showlegend=False,
         )
-        fig_comp = apply_elegant_theme(
-            fig_comp, theme=st.session_state.get("ui_theme", "light")
-        )
+        fig_comp = apply_elegant_theme(fig_comp, theme=ui_theme)
         render_plotly_with_spinner(
             fig_comp, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
         )
@@ -10452,7 +10581,7 @@ elif page == "経営ダッシュボード":
                     "粗利": st.column_config.NumberColumn("粗利", format="¥%,d"),
                 },
             )
-            csv_cash = cash_detail[cash_cols].to_csv(index=False).encode("utf-8-sig")
+            csv_cash = to_csv_bytes(cash_detail[cash_cols])
             st.download_button(
                 "資金明細CSV",
                 data=csv_cash,
@@ -10724,7 +10853,7 @@ elif page == "ダッシュボード":
             xaxis=dict(visible=False),
             yaxis=dict(visible=False),
         )
-        fig = apply_elegant_theme(fig, theme=st.session_state.get("ui_theme", "light"))
+        fig = apply_elegant_theme(fig, theme=ui_theme)
         column.plotly_chart(
             fig,
             use_container_width=True,
@@ -11322,9 +11451,7 @@ elif page == "ランキング":
                 margin=dict(l=10, r=10, t=30, b=10),
                 coloraxis_colorbar=dict(title="前年比(%)"),
             )
-            fig_top = apply_elegant_theme(
-                fig_top, theme=st.session_state.get("ui_theme", "light")
-            )
+            fig_top = apply_elegant_theme(fig_top, theme=ui_theme)
             render_plotly_with_spinner(
                 fig_top, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
             )
@@ -11370,9 +11497,7 @@ elif page == "ランキング":
                 height=420,
                 margin=dict(l=10, r=10, t=30, b=10),
             )
-            fig_scatter = apply_elegant_theme(
-                fig_scatter, theme=st.session_state.get("ui_theme", "light")
-            )
+            fig_scatter = apply_elegant_theme(fig_scatter, theme=ui_theme)
             render_plotly_with_spinner(
                 fig_scatter, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
             )
@@ -11529,7 +11654,7 @@ elif page == "ランキング":
 
     csv_clicked = st.download_button(
         "CSVダウンロード",
-        data=export_df.to_csv(index=False).encode("utf-8-sig"),
+        data=to_csv_bytes(export_df),
         file_name=f"ranking_{metric}_{end_m}.csv",
         mime="text/csv",
         key="ranking_csv_download",
@@ -11562,14 +11687,11 @@ elif page == "比較ビュー":
     year_df = st.session_state.data_year
     end_m = sidebar_state.get("compare_end_month") or latest_month
 
-    snapshot = latest_yearsum_snapshot(year_df, end_m)
-    snapshot["display_name"] = snapshot["product_name"].fillna(snapshot["product_code"])
+    assert year_df["month_dt"].dtype.kind == "M", "data_year must carry month_dt"
 
     search = st.text_input("検索ボックス", "")
-    if search:
-        snapshot = snapshot[
-            snapshot["display_name"].str.contains(search, case=False, na=False)
-        ]
+    snap_aux = get_snapshot_aux(year_df, end_m, search)
+    snapshot = snap_aux["snapshot"]
     # ---- 操作バー＋グラフ密着カード ----
 
     
@@ -11917,29 +12039,16 @@ elif page == "比較ビュー":
         )
         if band_mode == "商品指定(2)":
             if not snapshot.empty:
-                opts = (
-                    snapshot["product_code"].fillna("")
-                    + " | "
-                    + snapshot["display_name"].fillna("")
-                ).tolist()
-                opts = [o for o in opts if o.strip() != "|"]
-                idx_a = 0
-                idx_b = 1 if len(opts) > 1 else 0
-                if band_params.get("prod_a"):
-                    idx_a = next(
-                        (i for i, o in enumerate(opts) if o.split(" | ")[0] == band_params.get("prod_a")),
-                        0,
-                    )
-                if band_params.get("prod_b"):
-                    idx_b = next(
-                        (i for i, o in enumerate(opts) if o.split(" | ")[0] == band_params.get("prod_b")),
-                        1 if len(opts) > 1 else 0,
-                    )
+                opts = snap_aux["option_labels"]
+                option_code = snap_aux["option_code"]
+                option_index = snap_aux["option_index"]
+                idx_a = option_index.get(band_params.get("prod_a"), 0)
+                idx_b = option_index.get(band_params.get("prod_b"), 1 if len(opts) > 1 else 0)
                 prod_a = st.selectbox("商品A", opts, index=idx_a, key="compare_prod_a") if opts else ""
                 prod_b = st.selectbox("商品B", opts, index=idx_b, key="compare_prod_b") if len(opts) > 1 else prod_a
                 band_params = {
-                    "prod_a": prod_a.split(" | ")[0] if prod_a else "",
-                    "prod_b": prod_b.split(" | ")[0] if prod_b else "",
+                    "prod_a": option_code.get(prod_a, ""),
+                    "prod_b": option_code.get(prod_b, ""),
                 }
             else:
                 band_params = band_params_initial
@@ -11959,7 +12068,7 @@ elif page == "比較ビュー":
                 band_params = {"p_low": band_params.get("p_low", 0), "p_high": band_params.get("p_high", 100)}
         elif band_mode == "順位帯":
             if not snapshot.empty:
-                max_rank = int(snapshot["rank"].max()) if not snapshot.empty else 1
+                max_rank = snap_aux["max_rank"]
                 r_low = int(band_params.get("r_low", 1))
                 r_high = int(band_params.get("r_high", max_rank))
                 r_low, r_high = st.slider(
@@ -11976,17 +12085,10 @@ elif page == "比較ビュー":
                     "r_high": int(band_params.get("r_high", 1)),
                 }
         elif band_mode == "ターゲット近傍":
-            opts = (
-                snapshot["product_code"].fillna("") + " | " + snapshot["display_name"].fillna("")
-            ).tolist()
-            idx = 0
-            if band_params.get("target_code"):
-                idx = next(
-                    (i for i, o in enumerate(opts) if o.split(" | ")[0] == band_params.get("target_code")),
-                    0,
-                )
+            opts = snap_aux["option_labels"]
+            idx = snap_aux["option_index"].get(band_params.get("target_code"), 0)
             tlabel = st.selectbox("基準商品", opts, index=idx, key="compare_target_label") if opts else ""
-            tcode = tlabel.split(" | ")[0] if tlabel else ""
+            tcode = snap_aux["option_code"].get(tlabel, "")
             by = st.radio(
                 "幅指定",
                 ["金額", "%"],
@@ -12126,22 +12228,20 @@ elif page == "比較ビュー":
         "順位帯": "rank",
         "ターゲット近傍": "target_near",
     }
-    low, high = resolve_band(snapshot, mode_map[band_mode], band_params)
-    codes = filter_products_by_band(snapshot, low, high)
+    snap_arrays = snap_aux["arrays"]
+    low, high = resolve_band(snap_arrays, mode_map[band_mode], band_params)
+    codes = filter_products_by_band(snap_arrays, low, high)
 
     if quick == "Top5":
-        codes = snapshot.nlargest(5, "year_sum")["product_code"].tolist()
+        codes = top_k_codes(snap_arrays, "year_sum", 5)
     elif quick == "Top10":
-        codes = snapshot.nlargest(10, "year_sum")["product_code"].tolist()
+        codes = top_k_codes(snap_arrays, "year_sum", 10)
     elif quick == "最新YoY上位":
-        codes = (
-            snapshot.dropna(subset=["yoy"])
-            .sort_values("yoy", ascending=False)
-            .head(10)["product_code"]
-            .tolist()
-        )
+        codes = snap_aux["yoy_desc_codes"][:10]
     elif quick == "直近6M伸長上位":
-        codes = top_growth_codes(year_df, end_m, window=6, top=10)
+        codes = top_growth_codes(
+            year_df, end_m, window=6, top=10, matrix=get_year_sum_matrix()
+        )
 
     snap = slopes_snapshot(year_df, n=n_win)
     if thr_type == "円/月":
@@ -12154,35 +12254,37 @@ elif page == "比較ビュー":
     codes_by_slope = set(snap.loc[mask, "product_code"])
 
     eff_n = n_win if n_win > 0 else 12
-    shape_df = shape_flags(
-        year_df,
-        window=max(6, eff_n * 2),
-        alpha_ratio=0.02 * (1.0 - sens),
-        amp_ratio=0.06 * (1.0 - sens),
-    )
+
+    def _shape_codes() -> Tuple[set, set]:
+        shape_df = shape_flags(
+            year_df,
+            window=max(6, eff_n * 2),
+            alpha_ratio=0.02 * (1.0 - sens),
+            amp_ratio=0.06 * (1.0 - sens),
+        )
+        return (
+            set(shape_df.loc[shape_df["is_mountain"], "product_code"]),
+            set(shape_df.loc[shape_df["is_valley"], "product_code"]),
+        )
+
+    # 山/谷の判定は全SKUを走査するため、形状抽出かAIサマリーで必要になるまで計算しない
     codes_steep = set(snap.loc[snap["slope_z"].abs() >= z_thr, "product_code"])
-    codes_mtn = set(shape_df.loc[shape_df["is_mountain"], "product_code"])
-    codes_val = set(shape_df.loc[shape_df["is_valley"], "product_code"])
-    shape_map = {
-        "（なし）": None,
-        "急勾配": codes_steep,
-        "山（への字）": codes_mtn,
-        "谷（逆への字）": codes_val,
-    }
-    codes_by_shape = shape_map[shape_pick] or set(snap["product_code"])
+    shape_codes: Optional[Tuple[set, set]] = None
+    picked_codes: Optional[set] = None
+    if shape_pick == "急勾配":
+        picked_codes = codes_steep
+    elif shape_pick in ("山（への字）", "谷（逆への字）"):
+        shape_codes = _shape_codes()
+        picked_codes = shape_codes[0] if shape_pick == "山（への字）" else shape_codes[1]
+    codes_by_shape = picked_codes or set(snap["product_code"])
 
     codes_from_band = set(codes)
     target_codes = list(codes_from_band & codes_by_slope & codes_by_shape)
 
     scale = {"円": 1, "千円": 1_000, "百万円": 1_000_000}[unit]
-    snapshot_disp = snapshot.copy()
-    snapshot_disp["year_sum_disp"] = snapshot_disp["year_sum"] / scale
-    hist_fig = px.histogram(snapshot_disp, x="year_sum_disp")
-    hist_fig.update_xaxes(title_text=f"年計（{unit}）")
 
     df_long, _ = get_yearly_series(year_df, target_codes)
-    df_long["month"] = pd.to_datetime(df_long["month"])
-    df_long["display_name"] = df_long["product_name"].fillna(df_long["product_code"])
+    df_long["month"] = df_long["month_dt"]
 
     main_codes = target_codes
     max_lines = 30
@@ -12211,6 +12313,7 @@ elif page == "比較ビュー":
             )
             with st.expander("AIサマリー", expanded=ai_on):
                 if ai_on and not df_main.empty:
+                    codes_mtn, codes_val = shape_codes or _shape_codes()
                     pos = len(codes_steep)
                     mtn = len(codes_mtn & set(main_codes))
                     val = len(codes_val & set(main_codes))
@@ -12218,10 +12321,11 @@ elif page == "比較ビュー":
                         {
                             "対象SKU数": len(main_codes),
                             "中央値(年計)": float(
-                                snapshot_disp.loc[
-                                    snapshot_disp["product_code"].isin(main_codes),
-                                    "year_sum_disp",
+                                snapshot.loc[
+                                    snapshot["product_code"].isin(main_codes),
+                                    "year_sum",
                                 ].median()
+                                / scale
                             ),
                             "急勾配数": pos,
                             "山数": mtn,
@@ -12279,12 +12383,17 @@ zスコア：全SKUの傾き分布に対する標準化。|z|≥1.5で急勾配
 """
     )
 
-    snap_export = snapshot[snapshot["product_code"].isin(main_codes)].copy()
-    snap_export[f"year_sum_{unit}"] = snap_export["year_sum"] / scale
-    snap_export = snap_export.drop(columns=["year_sum"])
+    export_mask = snapshot["product_code"].isin(main_codes)
+    snap_export = (
+        snapshot.loc[export_mask]
+        .drop(columns=["year_sum"])
+        .assign(
+            **{f"year_sum_{unit}": snapshot.loc[export_mask, "year_sum"].to_numpy() / scale}
+        )
+    )
     csv_band_clicked = st.download_button(
         "CSVエクスポート",
-        data=snap_export.to_csv(index=False).encode("utf-8-sig"),
+        data=to_csv_bytes(snap_export),
         file_name=f"band_snapshot_{end_m}.csv",
         mime="text/csv",
         key="compare_band_csv",
@@ -12295,11 +12404,30 @@ zスコア：全SKUの傾き分布に対する標準化。|z|≥1.5で急勾配
             key="compare_band_csv_downloaded",
             guide="比較ビューのCSVを共有してチーム分析に役立てましょう。",
         )
-    try:
-        png_bytes = fig.to_image(format="png")
+    # PNG 変換（Kaleido）は重いため、ボタン押下時のみ実行して結果を保持する
+    png_signature = (
+        end_m,
+        unit,
+        period,
+        tuple(main_codes),
+        enable_label_avoid,
+        alternate_side,
+        label_gap_px,
+        label_max,
+    )
+    if st.button("PNGを準備", key="compare_band_png_prepare"):
+        try:
+            st.session_state.compare_band_png_cache = (
+                png_signature,
+                fig.to_image(format="png"),
+            )
+        except Exception:
+            st.session_state.pop("compare_band_png_cache", None)
+    png_cache = st.session_state.get("compare_band_png_cache")
+    if png_cache and png_cache[0] == png_signature:
         png_clicked = st.download_button(
             "PNGエクスポート",
-            data=png_bytes,
+            data=png_cache[1],
             file_name=f"band_overlay_{end_m}.png",
             mime="image/png",
             key="compare_band_png",
@@ -12310,16 +12438,18 @@ zスコア：全SKUの傾き分布に対する標準化。|z|≥1.5で急勾配
                 key="compare_band_png_downloaded",
                 guide="可視化画像を資料に貼り付けて共有できます。",
             )
-    except Exception:
-        pass
 
-    with st.expander("分布（オプション）", expanded=False):
-        hist_fig = apply_elegant_theme(
-            hist_fig, theme=st.session_state.get("ui_theme", "light")
-        )
-        render_plotly_with_spinner(
-            hist_fig, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
-        )
+    st.session_state.setdefault("dist_open", False)
+    with st.expander("分布（オプション）", expanded=st.session_state["dist_open"]):
+        # expander の中身は閉じていても毎回実行されるため、チェック時のみ図を組み立てる
+        if st.checkbox("年計の分布を表示", key="dist_open"):
+            hist_fig = _year_sum_histogram(
+                snapshot["year_sum"].to_numpy() / scale, unit
+            )
+            hist_fig = apply_elegant_theme(hist_fig, theme=ui_theme)
+            render_plotly_with_spinner(
+                hist_fig, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
+            )
 
     # ---- Small Multiples ----
     df_nodes = df_main.iloc[0:0].copy()
@@ -12329,73 +12459,92 @@ zスコア：全SKUの傾き分布に対する標準化。|z|≥1.5で急勾配
     drag = {"ズーム": "zoom", "パン": "pan", "選択": "select"}[op_mode]
 
     st.subheader("スモールマルチプル")
-    share_y = st.checkbox("Y軸共有", value=False)
-    show_keynode_labels = st.checkbox("キーノードラベル表示", value=False)
-    per_page = st.radio("1ページ表示枚数", [8, 12], horizontal=True, index=0)
-    total_pages = max(1, math.ceil(len(main_codes) / per_page))
-    page_idx = st.number_input("ページ", min_value=1, max_value=total_pages, value=1)
-    start = (page_idx - 1) * per_page
-    page_codes = main_codes[start : start + per_page]
-    col_count = 4
-    cols = st.columns(col_count)
-    ymax = (
-        df_long[df_long["product_code"].isin(main_codes)]["year_sum"].max()
-        / UNIT_MAP[unit]
-        if share_y
-        else None
-    )
-    for i, code in enumerate(page_codes):
-        g = df_long[df_long["product_code"] == code]
-        disp = g["display_name"].iloc[0] if not g.empty else code
-        palette = fig.layout.colorway or px.colors.qualitative.Safe
-        fig_s = px.line(
-            g,
-            x="month",
-            y="year_sum",
-            color_discrete_sequence=[palette[i % len(palette)]],
-            custom_data=["display_name"],
-        )
-        fig_s.update_traces(
-            mode="lines",
-            line=dict(width=1.5),
-            opacity=0.8,
-            showlegend=False,
-            hovertemplate=f"<b>%{{customdata[0]}}</b><br>月：%{{x|%Y-%m}}<br>年計：%{{y:,.0f}} {unit}<extra></extra>",
-        )
-        fig_s.update_xaxes(tickformat="%Y-%m", dtick=dtick, title_text="月（YYYY-MM）")
-        fig_s.update_yaxes(
-            tickformat="~,d",
-            range=[0, ymax] if ymax else None,
-            title_text=f"売上 年計（{unit}）",
-        )
-        fig_s.update_layout(font=dict(family="Noto Sans JP, Meiryo, Arial", size=12))
-        fig_s.update_layout(
-            hoverlabel=dict(
-                bgcolor="rgba(30,30,30,0.92)", font=dict(color="#fff", size=12)
-            )
-        )
-        fig_s.update_layout(dragmode=drag)
-        if hover_mode == "個別":
-            fig_s.update_layout(hovermode="closest")
-        else:
-            fig_s.update_layout(hovermode="x unified", hoverlabel=dict(align="left"))
-        last_val = (
-            g.sort_values("month")["year_sum"].iloc[-1] / UNIT_MAP[unit]
-            if not g.empty
-            else np.nan
+
+    # 軸共有・ページ送りはスモールマルチプルだけを再実行する
+    @compat_fragment
+    def _render_small_multiples() -> None:
+        share_y = st.checkbox("Y軸共有", value=False)
+        st.checkbox("キーノードラベル表示", value=False)
+        per_page = st.radio("1ページ表示枚数", [8, 12], horizontal=True, index=0)
+        total_pages = max(1, math.ceil(len(main_codes) / per_page))
+        page_idx = st.number_input("ページ", min_value=1, max_value=total_pages, value=1)
+        start = (page_idx - 1) * per_page
+        page_codes = main_codes[start : start + per_page]
+        col_count = 4
+        cols = st.columns(col_count)
+        ymax = (
+            df_long.loc[df_long["product_code"].isin(main_codes), "year_sum"].max()
+            / UNIT_MAP[unit]
+            if share_y
+            else None
         )
-        with cols[i % col_count]:
-            st.metric(
-                disp, f"{last_val:,.0f} {unit}" if not np.isnan(last_val) else "—"
+        # 月順に一度だけ並べ替え、SKUごとの行位置を引いてページ分だけ切り出す
+        df_sorted = df_long.sort_values("month", kind="stable", ignore_index=True)
+        idx_map = df_sorted.groupby("product_code", sort=False, observed=True).indices
+        page_pos = [idx_map[code] for code in page_codes if code in idx_map]
+        df_page = df_sorted.iloc[np.concatenate(page_pos)] if page_pos else df_sorted.iloc[0:0]
+        page_names: Dict[str, str] = {}
+        for i, code in enumerate(page_codes):
+            pos = idx_map.get(code)
+            if pos is not None:
+                disp = df_sorted["display_name"].iat[pos[-1]]
+                last_val = df_sorted["year_sum"].iat[pos[-1]] / UNIT_MAP[unit]
+                page_names[code] = disp
+            else:
+                disp, last_val = code, np.nan
+            with cols[i % col_count]:
+                st.metric(
+                    disp, f"{last_val:,.0f} {unit}" if not np.isnan(last_val) else "—"
+                )
+        if not df_page.empty:
+            # 1ページ分のSKUをファセットで1枚の図にまとめ、描画とJSON転送を1回で済ませる
+            palette = fig.layout.colorway or px.colors.qualitative.Safe
+            fig_s = px.line(
+                df_page,
+                x="month",
+                y="year_sum",
+                color="product_code",
+                facet_col="product_code",
+                facet_col_wrap=col_count,
+                category_orders={"product_code": page_codes},
+                color_discrete_sequence=[palette[i % len(palette)] for i in range(len(page_codes))],
+                custom_data=["display_name"],
+                labels={"month": "月（YYYY-MM）", "year_sum": f"売上 年計（{unit}）"},
+            )
+            fig_s.for_each_annotation(
+                lambda a: a.update(text=page_names.get(a.text.split("=", 1)[-1], a.text))
+            )
+            fig_s.update_traces(
+                mode="lines",
+                line=dict(width=1.5),
+                opacity=0.8,
+                showlegend=False,
+                hovertemplate=f"<b>%{{customdata[0]}}</b><br>月：%{{x|%Y-%m}}<br>年計：%{{y:,.0f}} {unit}<extra></extra>",
             )
-            fig_s = apply_elegant_theme(
-                fig_s, theme=st.session_state.get("ui_theme", "light")
+            fig_s.update_xaxes(tickformat="%Y-%m", dtick=dtick)
+            if share_y:
+                fig_s.update_yaxes(tickformat="~,d", range=[0, ymax] if ymax else None)
+            else:
+                fig_s.update_yaxes(tickformat="~,d", matches=None, showticklabels=True)
+            fig_s.update_layout(font=dict(family="Noto Sans JP, Meiryo, Arial", size=12))
+            fig_s.update_layout(
+                hoverlabel=dict(
+                    bgcolor="rgba(30,30,30,0.92)", font=dict(color="#fff", size=12)
+                )
             )
-            fig_s.update_layout(height=225)
+            fig_s.update_layout(dragmode=drag)
+            if hover_mode == "個別":
+                fig_s.update_layout(hovermode="closest")
+            else:
+                fig_s.update_layout(hovermode="x unified", hoverlabel=dict(align="left"))
+            fig_s = apply_elegant_theme(fig_s, theme=ui_theme)
+            fig_s.update_layout(height=225 * math.ceil(len(page_codes) / col_count))
             render_plotly_with_spinner(
                 fig_s, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
             )
 
+    _render_small_multiples()
+
     # 5) SKU詳細
 elif page == "SKU詳細":
     require_data()
@@ -12408,8 +12557,7 @@ elif page == "SKU詳細":
     )
     mode = st.radio("表示モード", ["単品", "複数比較"], horizontal=True)
     tb = toolbar_sku_detail(multi_mode=(mode == "複数比較"))
-    df_year = st.session_state.data_year.copy()
-    df_year["display_name"] = df_year["product_name"].fillna(df_year["product_code"])
+    df_year = st.session_state.data_year
 
     ai_on = st.toggle(
         "AIサマリー",
@@ -12424,7 +12572,7 @@ elif page == "SKU詳細":
 
     if mode == "単品":
         prod_label = st.selectbox(
-            "SKU選択", options=prods["product_code"] + " | " + prods["product_name"]
+            "SKU選択", options=prods["product_code"].astype(str) + " | " + prods["product_name"]
         )
         code = prod_label.split(" | ")[0]
         build_chart_card(
@@ -12493,12 +12641,12 @@ elif page == "SKU詳細":
             )
             st.download_button(
                 "ダウンロード",
-                data=meta.to_csv(index=False).encode("utf-8-sig"),
+                data=to_csv_bytes(meta),
                 file_name=f"notes_{code}.csv",
                 mime="text/csv",
             )
     else:
-        opts = (prods["product_code"] + " | " + prods["product_name"]).tolist()
+        opts = (prods["product_code"].astype(str) + " | " + prods["product_name"]).tolist()
         sel = st.multiselect("SKU選択（最大60件）", options=opts, max_selections=60)
         codes = [s.split(" | ")[0] for s in sel]
         if codes or (tb.get("slope_conf") and tb["slope_conf"].get("quick") != "なし"):
@@ -12524,7 +12672,7 @@ elif page == "SKU詳細":
             )
             st.download_button(
                 "CSVダウンロード",
-                data=snap.to_csv(index=False).encode("utf-8-sig"),
+                data=to_csv_bytes(snap),
                 file_name=f"sku_multi_{end_m}.csv",
                 mime="text/csv",
             )
@@ -12555,7 +12703,7 @@ elif page == "SKU詳細":
 elif page == "異常検知":
     require_data()
     section_header("異常検知", "回帰残差ベースで異常ポイントを抽出します。", icon="🚨")
-    year_df = st.session_state.data_year.copy()
+    year_df = st.session_state.data_year
     unit = st.session_state.settings.get("currency_unit", "円")
     scale = UNIT_MAP.get(unit, 1)
 
@@ -12594,9 +12742,9 @@ elif page == "異常検知":
         .sort_values("product_code")
     )
     prod_opts["label"] = (
-        prod_opts["product_code"]
+        prod_opts["product_code"].astype(str)
         + " | "
-        + prod_opts["product_name"].fillna(prod_opts["product_code"])
+        + prod_opts["product_name"].fillna(prod_opts["product_code"].astype(str))
     )
     selected_labels = st.multiselect(
         "対象SKU（未選択=全件）",
@@ -12605,36 +12753,49 @@ elif page == "異常検知":
     )
     selected_codes = [lab.split(" | ")[0] for lab in selected_labels]
 
-    records: List[pd.DataFrame] = []
-    for code, g in year_df.groupby("product_code"):
-        if selected_codes and code not in selected_codes:
-            continue
-        s = g.sort_values("month").set_index("month")["year_sum"]
-        res = detect_linear_anomalies(
-            s,
+    def build_anomalies() -> pd.DataFrame:
+        sku_matrix = get_year_sum_matrix()
+        row_mask = (
+            np.isin(sku_matrix.codes, selected_codes)
+            if selected_codes
+            else np.ones(len(sku_matrix.codes), dtype=bool)
+        )
+        target_codes = sku_matrix.codes[row_mask]
+        sku_idx, month_idx, scores = rolling_anomaly(
+            sku_matrix.values[row_mask],
             window=int(window),
-            threshold=float(threshold),
+            thr=float(threshold),
             robust=robust,
         )
-        if res.empty:
-            continue
-        res["product_code"] = code
-        res["product_name"] = g["product_name"].iloc[0]
-        res = res.merge(
-            g[["month", "year_sum", "yoy", "delta"]],
-            on="month",
+        if len(scores) == 0:
+            return pd.DataFrame()
+        found = pd.DataFrame(
+            {
+                "product_code": target_codes[sku_idx],
+                "month": sku_matrix.months[month_idx],
+                "score": scores,
+            }
+        ).merge(
+            year_df[["product_code", "product_name", "month", "year_sum", "yoy", "delta"]],
+            on=["product_code", "month"],
             how="left",
         )
-        res["score_abs"] = res["score"].abs()
-        records.append(res)
+        found["score_abs"] = found["score"].abs()
+        found = found.sort_values("score_abs", ascending=False)
+        found["year_sum_disp"] = found["year_sum"] / scale
+        found["delta_disp"] = found["delta"] / scale
+        return found
+
+    # 表示件数や詳細SKUの切替では検出・結合をやり直さない
+    anomalies = session_memo(
+        "anomaly_memo",
+        (int(window), float(threshold), robust, tuple(selected_codes), scale),
+        build_anomalies,
+    )
 
-    if not records:
+    if anomalies.empty:
         st.success("異常値は検出されませんでした。窓幅やしきい値を調整してください。")
     else:
-        anomalies = pd.concat(records, ignore_index=True)
-        anomalies = anomalies.sort_values("score_abs", ascending=False)
-        anomalies["year_sum_disp"] = anomalies["year_sum"] / scale
-        anomalies["delta_disp"] = anomalies["delta"] / scale
         total_count = len(anomalies)
         sku_count = anomalies["product_code"].nunique()
         pos_cnt = int((anomalies["score"] > 0).sum())
@@ -12656,7 +12817,7 @@ elif page == "異常検知":
                 key="anomaly_view_top",
             )
         )
-        view = anomalies.head(top_n).copy()
+        view = anomalies.head(top_n)
         view_table = view[
             [
                 "product_code",
@@ -12682,7 +12843,7 @@ elif page == "異常検知":
         st.caption("値は指定した単位換算、スコアはローカル回帰残差の標準化値です。")
         st.download_button(
             "CSVダウンロード",
-            data=view_table.to_csv(index=False).encode("utf-8-sig"),
+            data=to_csv_bytes(view_table),
             file_name=f"anomalies_{score_method}_{threshold:.1f}.csv",
             mime="text/csv",
         )
@@ -12697,15 +12858,31 @@ elif page == "異常検知":
                 ].fillna(0)
                 st.info(_ai_anomaly_report(ai_df))
 
-        option_labels = [
-            f"{row['product_code']}｜{row['product_name'] or row['product_code']}｜{row['month']}"
-            for _, row in view.iterrows()
-        ]
+        view_codes = view["product_code"].astype(str)
+        view_names = view["product_name"].fillna("").astype(str)
+        option_labels = (
+            view_codes
+            + "｜"
+            + view_names.where(view_names != "", view_codes)
+            + "｜"
+            + view["month"].astype(str)
+        ).tolist()
         if option_labels:
-            sel_label = st.selectbox("詳細チャート", options=option_labels, key="anomaly_detail_select")
-            code_sel, name_sel, month_sel = sel_label.split("｜")
-            g = year_df[year_df["product_code"] == code_sel].sort_values("month").copy()
-            g["year_sum_disp"] = g["year_sum"] / scale
+            sel_idx = st.selectbox(
+                "詳細チャート",
+                options=range(len(option_labels)),
+                format_func=option_labels.__getitem__,
+                key="anomaly_detail_idx",
+            )
+            tgt = view.iloc[sel_idx]
+            code_sel = tgt["product_code"]
+            name_sel = view_names.iat[sel_idx] or view_codes.iat[sel_idx]
+            month_sel = tgt["month"]
+            # data_year は (product_code, month) 順なので SKU の推移は行範囲で取り出せる
+            start, stop = get_code_row_slices()[code_sel]
+            g = year_df.iloc[start:stop].assign(
+                year_sum_disp=lambda d: d["year_sum"] / scale
+            )
             fig_anom = px.line(
                 g,
                 x="month",
@@ -12728,28 +12905,23 @@ elif page == "異常検知":
                     customdata=np.stack([code_anoms["score"]], axis=-1),
                     showlegend=False,
                 )
-            target = code_anoms[code_anoms["month"] == month_sel]
-            if not target.empty:
-                tgt = target.iloc[0]
-                fig_anom.add_annotation(
-                    x=month_sel,
-                    y=tgt["year_sum"] / scale,
-                    text=f"スコア {tgt['score']:.2f}",
-                    showarrow=True,
-                    arrowcolor="#d94c53",
-                    arrowhead=2,
-                )
-                yoy_txt = (
-                    f"{tgt['yoy'] * 100:.1f}%" if tgt.get("yoy") is not None and not pd.isna(tgt.get("yoy")) else "—"
-                )
-                delta_txt = format_amount(tgt.get("delta"), unit)
-                st.info(
-                    f"{name_sel} {month_sel} の年計は {tgt['year_sum_disp']:.0f} {unit}、YoY {yoy_txt}、Δ {delta_txt}。"
-                    f" 異常スコアは {tgt['score']:.2f} です。"
-                )
-            fig_anom = apply_elegant_theme(
-                fig_anom, theme=st.session_state.get("ui_theme", "light")
+            fig_anom.add_annotation(
+                x=month_sel,
+                y=tgt["year_sum"] / scale,
+                text=f"スコア {tgt['score']:.2f}",
+                showarrow=True,
+                arrowcolor="#d94c53",
+                arrowhead=2,
             )
+            yoy_txt = (
+                f"{tgt['yoy'] * 100:.1f}%" if tgt.get("yoy") is not None and not pd.isna(tgt.get("yoy")) else "—"
+            )
+            delta_txt = format_amount(tgt.get("delta"), unit)
+            st.info(
+                f"{name_sel} {month_sel} の年計は {tgt['year_sum_disp']:.0f} {unit}、YoY {yoy_txt}、Δ {delta_txt}。"
+                f" 異常スコアは {tgt['score']:.2f} です。"
+            )
+            fig_anom = apply_elegant_theme(fig_anom, theme=ui_theme)
             render_plotly_with_spinner(
                 fig_anom, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
             )
@@ -12759,7 +12931,7 @@ elif page == "相関分析":
     require_data()
     section_header("相関分析", "指標間の関係性からインサイトを発掘。", icon="🧭")
     end_m = sidebar_state.get("corr_end_month") or latest_month
-    snapshot = latest_yearsum_snapshot(st.session_state.data_year, end_m)
+    snapshot = get_snapshot_aux(st.session_state.data_year, end_m)["snapshot"]
 
     metric_opts = [
         "year_sum",
@@ -12795,19 +12967,29 @@ elif page == "相関分析":
         )
         winsor_pct = st.slider("外れ値丸め(%)", 0.0, 5.0, 1.0)
         log_enable = st.checkbox("ログ変換", value=False)
-        ai_on = st.toggle(
-            "AIサマリー",
-            value=False,
-            key="corr_ai_metric",
-            help="要約・コメント・自動説明を表示（オンデマンド計算）",
-        )
 
         if metrics:
-            df_plot = snapshot.copy()
-            df_plot = winsorize_frame(df_plot, metrics, p=winsor_pct / 100)
-            df_plot = maybe_log1p(df_plot, metrics, log_enable)
-            tbl = corr_table(df_plot, metrics, method=method)
-            tbl = tbl[abs(tbl["r"]) >= r_thr]
+
+            def build_metric_frames() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+                frame = winsorize_frame(snapshot, metrics, p=winsor_pct / 100)
+                frame = maybe_log1p(frame, metrics, log_enable)
+                matrix = corr_matrix(frame, metrics, method=method)
+                # 欠損がなければヒートマップ用の行列がそのまま表の相関になる
+                complete = not frame[metrics].isna().to_numpy().any()
+                table = corr_table(
+                    frame, metrics, method=method, matrix=matrix if complete else None
+                )
+                return frame, matrix, table
+
+            # 閾値・AI・ペア選択の操作では丸め/変換/相関を再計算しない
+            corr_key = (end_m, tuple(metrics), float(winsor_pct), bool(log_enable), method)
+            df_plot, corr, tbl_all = session_memo(
+                "corr_metric_memo", corr_key, build_metric_frames
+            )
+            theme = ui_theme
+            # apply_elegant_theme は品格UIトグルでも結果が変わるため memo キーに含める
+            style_key = (theme, bool(st.session_state.get("elegant_on", True)))
+            tbl = tbl_all[abs(tbl_all["r"]) >= r_thr]
 
             st.subheader("相関の要点")
             for line in narrate_top_insights(tbl, NAME_MAP):
@@ -12817,26 +12999,33 @@ elif page == "相関分析":
             st.write(f"統計的に有意な相関: {sig_cnt} 組")
             st.write(f"|r|<0.2 の組み合わせ: {weak_cnt} 組")
 
-            with st.expander("AIサマリー", expanded=ai_on):
-                if ai_on and not tbl.empty:
-                    r_mean = float(tbl["r"].abs().mean())
-                    st.info(
-                        _ai_explain(
-                            {
-                                "有意本数": int((tbl["sig"] == "有意(95%)").sum()),
-                                "平均|r|": r_mean,
-                            }
-                        )
-                    )
+            render_ai_summary_on_demand(
+                "corr_ai_metric",
+                (
+                    st.session_state.get("data_version", 0),
+                    end_m,
+                    tuple(metrics),
+                    winsor_pct,
+                    log_enable,
+                    method,
+                    r_thr,
+                ),
+                (
+                    {"有意本数": sig_cnt, "平均|r|": float(tbl["r"].abs().mean())}
+                    if not tbl.empty
+                    else None
+                ),
+            )
 
             st.subheader("相関ヒートマップ")
             st.caption("右上=強い正、左下=強い負、白=関係薄")
-            corr = df_plot[metrics].corr(method=method)
-            fig_corr = px.imshow(
-                corr, color_continuous_scale="RdBu_r", zmin=-1, zmax=1, text_auto=True
-            )
-            fig_corr = apply_elegant_theme(
-                fig_corr, theme=st.session_state.get("ui_theme", "light")
+            # 入力が同じ間は描画済みの Figure をそのまま使い回す
+            fig_corr = session_memo(
+                "corr_metric_heatmap_memo",
+                (corr_key, style_key),
+                lambda: apply_elegant_theme(
+                    corr_heatmap(corr, text_max=CORR_HEATMAP_TEXT_MAX), theme=theme
+                ),
             )
             render_plotly_with_spinner(
                 fig_corr, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
@@ -12852,41 +13041,50 @@ elif page == "相関分析":
                 )
             df_xy = df_plot[[x_col, y_col, "product_name", "product_code"]].dropna()
             if not df_xy.empty:
-                m, b, r2 = fit_line(df_xy[x_col], df_xy[y_col])
-                r = df_xy[x_col].corr(df_xy[y_col], method=method)
-                lo, hi = fisher_ci(r, len(df_xy))
-                fig_sc = px.scatter(
-                    df_xy, x=x_col, y=y_col, hover_data=["product_code", "product_name"]
-                )
-                xs = np.linspace(df_xy[x_col].min(), df_xy[x_col].max(), 100)
-                fig_sc.add_trace(
-                    go.Scatter(x=xs, y=m * xs + b, mode="lines", name="回帰")
-                )
-                fig_sc.add_annotation(
-                    x=0.99,
-                    y=0.01,
-                    xref="paper",
-                    yref="paper",
-                    xanchor="right",
-                    yanchor="bottom",
-                    text=f"r={r:.2f} (95%CI [{lo:.2f},{hi:.2f}])<br>R²={r2:.2f}",
-                    showarrow=False,
-                    align="right",
-                    bgcolor="rgba(255,255,255,0.6)",
-                )
-                resid = np.abs(df_xy[y_col] - (m * df_xy[x_col] + b))
-                outliers = df_xy.loc[resid.nlargest(3).index]
-                for _, row in outliers.iterrows():
-                    label = row["product_name"] or row["product_code"]
+
+                def build_scatter() -> go.Figure:
+                    m, b, r2 = fit_line(df_xy[x_col], df_xy[y_col])
+                    # n・CI・回帰線と同じ行（df_xy）で r を求める
+                    r = df_xy[x_col].corr(df_xy[y_col], method=method)
+                    lo, hi = fisher_ci(r, len(df_xy))
+                    fig_sc = px.scatter(
+                        df_xy,
+                        x=x_col,
+                        y=y_col,
+                        hover_data=["product_code", "product_name"],
+                    )
+                    xs = np.linspace(df_xy[x_col].min(), df_xy[x_col].max(), 100)
+                    fig_sc.add_trace(
+                        go.Scatter(x=xs, y=m * xs + b, mode="lines", name="回帰")
+                    )
                     fig_sc.add_annotation(
-                        x=row[x_col],
-                        y=row[y_col],
-                        text=label,
-                        showarrow=True,
-                        arrowhead=1,
+                        x=0.99,
+                        y=0.01,
+                        xref="paper",
+                        yref="paper",
+                        xanchor="right",
+                        yanchor="bottom",
+                        text=f"r={r:.2f} (95%CI [{lo:.2f},{hi:.2f}])<br>R²={r2:.2f}",
+                        showarrow=False,
+                        align="right",
+                        bgcolor="rgba(255,255,255,0.6)",
                     )
-                fig_sc = apply_elegant_theme(
-                    fig_sc, theme=st.session_state.get("ui_theme", "light")
+                    outliers = df_xy.iloc[
+                        largest_residuals(df_xy[x_col], df_xy[y_col], m, b)
+                    ]
+                    for _, row in outliers.iterrows():
+                        label = row["product_name"] or row["product_code"]
+                        fig_sc.add_annotation(
+                            x=row[x_col],
+                            y=row[y_col],
+                            text=label,
+                            showarrow=True,
+                            arrowhead=1,
+                        )
+                    return apply_elegant_theme(fig_sc, theme=theme)
+
+                fig_sc = session_memo(
+                    "corr_metric_scatter_memo", (corr_key, style_key, x_col, y_col), build_scatter
                 )
                 render_plotly_with_spinner(
                     fig_sc, config=PLOTLY_CONFIG, spinner_text=SPINNER_MESSAGE
@@ -12896,7 +13094,7 @@ elif page == "相関分析":
         else:
             st.info("指標を選択してください。")
     else:
-        df_year = st.session_state.data_year.copy()
+        df_year = st.session_state.data_year
         series_metric_opts = [m for m in metric_opts if m in df_year.columns]
         if not series_metric_opts:
             st.info("SKU間相関に利用できる指標がありません。")
@@ -12906,13 +13104,13 @@ elif page == "相関分析":
                 series_metric_opts,
                 format_func=lambda x: NAME_MAP.get(x, x),
             )
-            months_all = sorted(df_year["month"].unique())
-            if not months_all:
+            # 取込時に作った SKU×月 行列の月軸（昇順）を使い、月一覧の再計算を避ける
+            months_all = get_year_sum_matrix().months
+            if len(months_all) == 0:
                 st.info("データが不足しています。")
             else:
-                if end_m in months_all:
-                    end_idx = months_all.index(end_m)
-                else:
+                end_idx = int(np.searchsorted(months_all, end_m)) if end_m else len(months_all)
+                if end_idx >= len(months_all) or months_all[end_idx] != end_m:
                     end_idx = len(months_all) - 1
                 if end_idx < 0:
                     st.info("対象期間のデータがありません。")
@@ -12934,19 +13132,28 @@ elif page == "相関分析":
                         )
                         start_idx = max(0, end_idx - period + 1)
                         months_window = months_all[start_idx : end_idx + 1]
-                        df_window = df_year[df_year["month"].isin(months_window)]
-                        pivot = (
-                            df_window.pivot(
-                                index="month", columns="product_code", values=sku_metric
-                            ).sort_index()
+
+                        def build_window() -> Tuple[pd.DataFrame, List[str], pd.Index]:
+                            frame = df_year[df_year["month"].isin(months_window)]
+                            filled = set(frame.loc[frame[sku_metric].notna(), "month"])
+                            return (
+                                frame,
+                                [m for m in months_window if m in filled],
+                                pd.Index(frame["product_code"].unique()),
+                            )
+
+                        df_window, months_kept, window_codes = session_memo(
+                            "corr_sku_window_memo",
+                            (sku_metric, tuple(months_window)),
+                            build_window,
                         )
-                        pivot = pivot.dropna(how="all")
-                        if pivot.empty:
+                        if not months_kept:
                             st.info("選択した期間に利用できるデータがありません。")
                         else:
-                            top_candidates = [
-                                c for c in snapshot["product_code"] if c in pivot.columns
-                            ]
+                            # スナップショット順（年計降順）を保ったままハッシュ照合で一括抽出
+                            top_candidates = snapshot.loc[
+                                snapshot["product_code"].isin(window_codes), "product_code"
+                            ].tolist()
                             if len(top_candidates) < 2:
                                 st.info("対象SKUが不足しています。")
                             else:
@@ -12961,46 +13168,54 @@ elif page == "相関分析":
                                     )
                                 )
                                 selected_codes = top_candidates[:top_n]
-                                sku_pivot = pivot[selected_codes].dropna(
-                                    axis=1, how="all"
-                                )
-                                available_codes = sku_pivot.columns.tolist()
                                 min_periods = 3
-                                valid_codes = [
-                                    code
-                                    for code in available_codes
-                                    if sku_pivot[code].count() >= min_periods
-                                ]
+
+                                def build_sku_corr() -> Tuple[
+                                    pd.DataFrame, List[str], pd.DataFrame, pd.DataFrame
+                                ]:
+                                    # 全SKUのピボットは作らず、選択SKUの列だけを組み立てる
+                                    sub = sku_metric_block(
+                                        df_window, sku_metric, months_kept, selected_codes
+                                    ).dropna(axis=1, how="all")
+                                    counts = sub.notna().sum(axis=0)
+                                    codes_ok = counts.index[counts >= min_periods].tolist()
+                                    if len(codes_ok) < 2:
+                                        return sub, codes_ok, pd.DataFrame(), pd.DataFrame()
+                                    sub = sub[codes_ok]
+                                    # 順位付け（Spearman）と相関はヒートマップと表で1回だけ計算する
+                                    matrix = corr_matrix(
+                                        sub, codes_ok, method=method, min_periods=min_periods
+                                    )
+                                    table = corr_table(
+                                        sub,
+                                        codes_ok,
+                                        method=method,
+                                        pairwise=True,
+                                        min_periods=min_periods,
+                                        matrix=matrix,
+                                    )
+                                    return sub, codes_ok, table, matrix
+
+                                sku_key = (
+                                    sku_metric,
+                                    tuple(months_window),
+                                    tuple(selected_codes),
+                                    method,
+                                )
+                                sku_pivot, valid_codes, tbl_raw, sku_corr = session_memo(
+                                    "corr_sku_memo", sku_key, build_sku_corr
+                                )
                                 if len(valid_codes) < 2:
                                     st.info(
                                         "有効なSKUが2件未満です。期間やSKU数を調整してください。"
                                     )
                                 else:
-                                    sku_pivot = sku_pivot[valid_codes]
                                     months_used = sku_pivot.index.tolist()
-                                    code_to_name = (
-                                        df_year[["product_code", "product_name"]]
-                                        .drop_duplicates()
-                                        .set_index("product_code")["product_name"]
-                                        .to_dict()
-                                    )
+                                    code_to_name = st.session_state.code_to_name
                                     display_map = {
                                         code: f"{code}｜{code_to_name.get(code, code) or code}"
                                         for code in valid_codes
                                     }
-                                    ai_on = st.toggle(
-                                        "AIサマリー",
-                                        value=False,
-                                        key="corr_ai_sku",
-                                        help="要約・コメント・自動説明を表示（オンデマンド計算）",
-                                    )
-                                    tbl_raw = corr_table(
-                                        sku_pivot,
-                                        valid_codes,
-                                        method=method,
-                                        pairwise=True,
-                                        min_periods=min_periods,
-                                    )
                                     tbl = tbl_raw.dropna(subset=["r"])
                                     tbl = tbl[abs(tbl["r"]) >= r_thr]
 
@@ -13024,37 +13239,47 @@ elif page == "相関分析":
                                             "条件に合致するSKU間相関は見つかりませんでした。"
                                         )
 
-                                    with st.expander("AIサマリー", expanded=ai_on):
-                                        if ai_on and not tbl.empty:
-                                            r_mean = float(tbl["r"].abs().mean())
-                                            st.info(
-                                                _ai_explain(
-                                                    {
-                                                        "有意本数": int(
-                                                            (tbl["sig"] == "有意(95%)").sum()
-                                                        ),
-                                                        "平均|r|": r_mean,
-                                                    }
-                                                )
-                                            )
+                                    render_ai_summary_on_demand(
+                                        "corr_ai_sku",
+                                        (
+                                            st.session_state.get("data_version", 0),
+                                            sku_metric,
+                                            tuple(months_window),
+                                            tuple(valid_codes),
+                                            method,
+                                            r_thr,
+                                        ),
+                                        (
+                                            {
+                                                "有意本数": sig_cnt,
+                                                "平均|r|": float(tbl["r"].abs().mean()),
+                                            }
+                                            if not tbl.empty
+                                            else None
+                                        ),
+                                    )
 
                                     st.subheader("相関ヒートマップ")
                                     st.caption(
                                         "セルは対象期間におけるSKU同士の相関係数を示します。"
                                     )
-                                    heatmap = sku_pivot.rename(columns=display_map)
-                                    corr = heatmap.corr(
-                                        method=method, min_periods=min_periods
+                                    theme = ui_theme
+                                    style_key = (
+                                        theme,
+                                        bool(st.session_state.get("elegant_on", True)),
                                     )
-                                    fig_corr = px.imshow(
-                                        corr,
-                                        color_continuous_scale="RdBu_r",
-                                        zmin=-1,
-                                        zmax=1,
-                                        text_auto=True,
-                                    )
-                                    fig_corr = apply_elegant_theme(
-                                        fig_corr, theme=st.session_state.get("ui_theme", "light")
+                                    fig_corr = session_memo(
+                                        "corr_sku_heatmap_memo",
+                                        (sku_key, style_key),
+                                        lambda: apply_elegant_theme(
+                                            corr_heatmap(
+                                                sku_corr.rename(
+                                                    index=display_map, columns=display_map
+                                                ),
+                                                text_max=CORR_HEATMAP_TEXT_MAX,
+                                            ),
+                                            theme=theme,
+                                        ),
                                     )
                                     render_plotly_with_spinner(
                                         fig_corr,
@@ -13096,9 +13321,11 @@ elif page == "相関分析":
                                         m, b, r2 = fit_line(
                                             df_xy[x_label], df_xy[y_label]
                                         )
-                                        r = df_xy[x_label].corr(
-                                            df_xy[y_label], method=method
-                                        )
+                                        r = sku_corr.loc[x_code, y_code]
+                                        if pd.isna(r):
+                                            r = df_xy[x_label].corr(
+                                                df_xy[y_label], method=method
+                                            )
                                         lo, hi = fisher_ci(r, len(df_xy))
                                         fig_sc = px.scatter(
                                             df_xy,
@@ -13126,11 +13353,10 @@ elif page == "相関分析":
                                             align="right",
                                             bgcolor="rgba(255,255,255,0.6)",
                                         )
-                                        resid = np.abs(
-                                            df_xy[y_label] - (m * df_xy[x_label] + b)
-                                        )
-                                        outliers = df_xy.loc[
-                                            resid.nlargest(min(3, len(resid))).index
+                                        outliers = df_xy.iloc[
+                                            largest_residuals(
+                                                df_xy[x_label], df_xy[y_label], m, b
+                                            )
                                         ]
                                         for _, row in outliers.iterrows():
                                             fig_sc.add_annotation(
@@ -13140,10 +13366,7 @@ elif page == "相関分析":
                                                 showarrow=True,
                                                 arrowhead=1,
                                             )
-                                        fig_sc = apply_elegant_theme(
-                                            fig_sc,
-                                            theme=st.session_state.get("ui_theme", "light"),
-                                        )
+                                        fig_sc = apply_elegant_theme(fig_sc, theme=theme)
                                         render_plotly_with_spinner(
                                             fig_sc,
                                             config=PLOTLY_CONFIG,
@@ -13166,6 +13389,9 @@ elif page == "相関分析":
 
 # 7) 併買カテゴリ
 elif page == "併買カテゴリ":
+    # networkx / scikit-learn / scipy を読み込むため、このページを開いたときだけ取り込む
+    from core.product_clusters import render_correlation_category_module
+
     render_correlation_category_module(plot_config=PLOTLY_CONFIG)
 
 # 8) アラート
@@ -13187,7 +13413,7 @@ elif page == "アラート":
         st.dataframe(alerts, use_container_width=True)
         st.download_button(
             "CSVダウンロード",
-            data=alerts.to_csv(index=False).encode("utf-8-sig"),
+            data=to_csv_bytes(alerts),
             file_name=f"alerts_{end_m}.csv",
             mime="text/csv",
         )
@@ -13255,7 +13481,7 @@ elif page == "設定":
                 long_df, window=s["window"], policy=s["missing_policy"]
             )
             year_df = compute_slopes(year_df, last_n=s["last_n"])
-            st.session_state.data_year = year_df
+            store_year_data(year_df)
             st.success("再計算が完了しました。")
 
 # 10) 保存ビュー
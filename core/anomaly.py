@@ -0,0 +1,137 @@
+"""異常検知カーネル。
+
+``services.detect_linear_anomalies`` と同じローカル線形回帰の残差スコアを、
+SKU×月の行列（行=SKU, 列=月）に対して一括で計算する。Numba が利用できる
+環境ではコンパイル済みのループで SKU 行を処理し、利用できない場合は NumPy の
+スライディングウィンドウで同じ結果を返す。
+"""
+
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:  # numba は任意依存（未インストール環境では NumPy 実装にフォールバック）
+    from numba import njit
+except ImportError:  # pragma: no cover - optional dependency
+    njit = None
+
+NUMBA_AVAILABLE = njit is not None
+
+
+def _rolling_scores_numpy(mat: np.ndarray, window: int, robust: bool) -> np.ndarray:
+    """行ごとに欠損を詰めた系列で残差スコアを計算する（NumPy 実装）。"""
+
+    scores = np.full(mat.shape, np.nan)
+    x = np.arange(window, dtype=float)
+    xc = x - x.mean()
+    sxx = float(np.sum(xc * xc))
+    for r in range(mat.shape[0]):
+        row = mat[r]
+        pos = np.flatnonzero(~np.isnan(row))
+        if len(pos) < window + 1:
+            continue
+        y = row[pos]
+        win = sliding_window_view(y, window)[:-1]
+        y_bar = win.mean(axis=1)
+        m = ((win - y_bar[:, None]) * xc).sum(axis=1) / sxx
+        b = y_bar - m * x.mean()
+        resid = y[window:] - (m * window + b)
+        fit_resid = win - (m[:, None] * x + b[:, None])
+        if robust:
+            med = np.median(fit_resid, axis=1)
+            sigma = 1.4826 * np.median(np.abs(fit_resid - med[:, None]), axis=1)
+        else:
+            sigma = fit_resid.std(axis=1, ddof=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = np.where(sigma > 0, resid / sigma, 0.0)
+        scores[r, pos[window:]] = score
+    return scores
+
+
+def _rolling_scores_kernel(mat, window, robust):  # pragma: no cover - compiled by numba
+    n_rows, n_cols = mat.shape
+    scores = np.full((n_rows, n_cols), np.nan)
+    x_bar = (window - 1) / 2.0
+    sxx = 0.0
+    for k in range(window):
+        sxx += (k - x_bar) * (k - x_bar)
+    for r in range(n_rows):
+        pos = np.empty(n_cols, dtype=np.int64)
+        y = np.empty(n_cols)
+        n = 0
+        for c in range(n_cols):
+            v = mat[r, c]
+            if not np.isnan(v):
+                pos[n] = c
+                y[n] = v
+                n += 1
+        if n < window + 1:
+            continue
+        fit_resid = np.empty(window)
+        for i in range(window, n):
+            y_bar = 0.0
+            for k in range(window):
+                y_bar += y[i - window + k]
+            y_bar /= window
+            sxy = 0.0
+            for k in range(window):
+                sxy += (k - x_bar) * (y[i - window + k] - y_bar)
+            m = sxy / sxx
+            b = y_bar - m * x_bar
+            for k in range(window):
+                fit_resid[k] = y[i - window + k] - (m * k + b)
+            if robust:
+                med = np.median(fit_resid)
+                sigma = 1.4826 * np.median(np.abs(fit_resid - med))
+            else:
+                mu = fit_resid.mean()
+                ss = 0.0
+                for k in range(window):
+                    ss += (fit_resid[k] - mu) * (fit_resid[k] - mu)
+                sigma = np.sqrt(ss / (window - 1))
+            resid = y[i] - (m * window + b)
+            scores[r, pos[i]] = resid / sigma if sigma > 0 else 0.0
+    return scores
+
+
+if NUMBA_AVAILABLE:
+    # Streamlit のスクリプトスレッドから呼ばれるため並列化しない
+    # （メインスレッド以外で parallel カーネルを起動すると TBB 下で終了時に固まる）
+    _rolling_scores_kernel = njit(cache=True)(_rolling_scores_kernel)
+
+
+def rolling_anomaly(
+    mat: np.ndarray, window: int, thr: float, robust: bool = False
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """SKU×月行列から閾値を超える異常点を抽出する。
+
+    Args:
+        mat: 行=SKU、列=月の年計行列。欠損は ``NaN``。
+        window: 学習窓幅（月）。
+        thr: 異常判定しきい値（スコアの絶対値）。
+        robust: ``True`` の場合は MAD、``False`` の場合は標準偏差で標準化する。
+
+    Returns:
+        ``(sku_idx, month_idx, score)`` の配列タプル。
+    """
+
+    mat = np.ascontiguousarray(mat, dtype=np.float64)
+    window = int(window)
+    if mat.ndim != 2 or mat.size == 0 or window < 2:
+        empty = np.empty(0, dtype=np.int32)
+        return empty, empty.copy(), np.empty(0, dtype=np.float64)
+    if NUMBA_AVAILABLE:
+        scores = _rolling_scores_kernel(mat, window, bool(robust))
+    else:
+        scores = _rolling_scores_numpy(mat, window, bool(robust))
+    with np.errstate(invalid="ignore"):
+        hit = np.abs(scores) >= float(thr)
+    sku_idx, month_idx = np.nonzero(hit)
+    return (
+        sku_idx.astype(np.int32),
+        month_idx.astype(np.int32),
+        scores[sku_idx, month_idx],
+    )
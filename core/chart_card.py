@@ -116,7 +116,7 @@ def limit_products(
     codes = dfp["product_code"].unique()
     if len(codes) <= max_products:
         return dfp
-    snapshot = dfp.sort_values("month").groupby("product_code").tail(1)
+    snapshot = dfp.sort_values("month").groupby("product_code", observed=True).tail(1)
     top_codes = snapshot.nlargest(max_products, "year_sum")["product_code"]
     return dfp[dfp["product_code"].isin(top_codes)].copy()
 
@@ -461,7 +461,7 @@ def build_chart_card(
     config: dict | None = None,
 ):
     months = {"12ヶ月": 12, "24ヶ月": 24, "36ヶ月": 36}[tb["period"]]
-    dfp = df_long.sort_values("month").groupby("product_code").tail(months)
+    dfp = df_long.sort_values("month").groupby("product_code", observed=True).tail(months)
     if selected_codes:
         dfp = dfp[dfp["product_code"].isin(selected_codes)].copy()
     if dfp["product_code"].nunique() > MAX_DISPLAY_PRODUCTS:
@@ -488,7 +488,7 @@ def build_chart_card(
         )
         codes_by_slope = set(snap.loc[mask, "product_code"])
         if sc.get("quick") and sc["quick"] != "なし":
-            snapshot = dfp.sort_values("month").groupby("product_code").tail(1)
+            snapshot = dfp.sort_values("month").groupby("product_code", observed=True).tail(1)
             if sc["quick"] == "Top5":
                 quick_codes = snapshot.nlargest(5, "year_sum")["product_code"]
             elif sc["quick"] == "Top10":
@@ -7,6 +7,13 @@ from typing import Dict, Iterable, List
 import numpy as np
 import pandas as pd
 
+try:  # numba は任意依存（未インストール環境では NumPy 実装にフォールバック）
+    from numba import njit
+except ImportError:  # pragma: no cover - optional dependency
+    njit = None
+
+NUMBA_AVAILABLE = njit is not None
+
 
 def fisher_ci(r: float, n: int, zcrit: float = 1.96) -> tuple[float, float]:
     """Return the Fisher z confidence interval for a correlation coefficient."""
@@ -22,6 +29,147 @@ def fisher_ci(r: float, n: int, zcrit: float = 1.96) -> tuple[float, float]:
     return float(lo), float(hi)
 
 
+def _pairwise_pearson_numpy(x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Masked pairwise Pearson via matrix products (NumPy implementation)."""
+
+    mask = ~np.isnan(x)
+    m = mask.astype(np.float64)
+    # Centre on the column means first so the one-pass sums keep precision.
+    present = np.maximum(m.sum(axis=0), 1.0)
+    x0 = np.where(mask, x - np.where(mask, x, 0.0).sum(axis=0) / present, 0.0)
+    n = m.T @ m
+    sx = x0.T @ m  # sx[i, j]: sum of column i over rows where j is present
+    sxx = (x0 * x0).T @ m
+    sxy = x0.T @ x0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        var_j = var_i.T
+        r = cov / np.sqrt(var_i * var_j)
+    r[~((var_i > 0) & (var_j > 0))] = np.nan
+    return r, n.astype(np.int64)
+
+
+def _pairwise_pearson_kernel(x):  # pragma: no cover - compiled by numba
+    n_rows, n_cols = x.shape
+    r = np.full((n_cols, n_cols), np.nan)
+    counts = np.zeros((n_cols, n_cols), dtype=np.int64)
+    for i in range(n_cols):
+        for j in range(i, n_cols):
+            n = 0
+            mx = 0.0
+            my = 0.0
+            for k in range(n_rows):
+                a = x[k, i]
+                b = x[k, j]
+                if not (np.isnan(a) or np.isnan(b)):
+                    n += 1
+                    mx += a
+                    my += b
+            counts[i, j] = n
+            counts[j, i] = n
+            if n < 2:
+                continue
+            mx /= n
+            my /= n
+            sxx = 0.0
+            syy = 0.0
+            sxy = 0.0
+            for k in range(n_rows):
+                a = x[k, i]
+                b = x[k, j]
+                if not (np.isnan(a) or np.isnan(b)):
+                    sxx += (a - mx) * (a - mx)
+                    syy += (b - my) * (b - my)
+                    sxy += (a - mx) * (b - my)
+            if sxx > 0 and syy > 0:
+                v = sxy / np.sqrt(sxx * syy)
+                r[i, j] = v
+                r[j, i] = v
+    return r, counts
+
+
+if NUMBA_AVAILABLE:
+    # Called from Streamlit's script thread, so keep it serial: a parallel kernel
+    # launched off the main thread can hang interpreter shutdown under TBB.
+    _pairwise_pearson_kernel = njit(cache=True)(_pairwise_pearson_kernel)
+
+
+def pairwise_pearson(
+    x: np.ndarray, min_periods: int = 1
+) -> tuple[np.ndarray, np.ndarray]:
+    """Pearson correlation over pairwise-complete rows of a matrix with NaNs.
+
+    Returns ``(r, n)`` where ``n[i, j]`` is the number of rows in which both
+    columns are present; pairs below *min_periods* get ``NaN``.
+    """
+
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    if NUMBA_AVAILABLE:
+        r, n = _pairwise_pearson_kernel(x)
+    else:
+        r, n = _pairwise_pearson_numpy(x)
+    r = np.clip(r, -1.0, 1.0)
+    r[n < max(int(min_periods), 1)] = np.nan
+    return r, n
+
+
+def corr_matrix(
+    df: pd.DataFrame,
+    cols: Iterable[str],
+    method: str = "pearson",
+    *,
+    min_periods: int = 1,
+) -> pd.DataFrame:
+    """Return the correlation matrix of *cols*.
+
+    Complete data is centred and scaled to unit norm in float64 (so yen-sized
+    values keep their precision) and the cross products run as a float32
+    matrix product; Spearman uses column ranks. Pearson on frames with
+    missing values uses :func:`pairwise_pearson`; Spearman with missing
+    values falls back to pandas' pairwise ``corr``.
+    """
+
+    cols = list(cols)
+    sub = df[cols]
+    arr = sub.to_numpy(dtype=np.float64)
+    if method == "pearson" and np.isnan(arr).any():
+        r, _ = pairwise_pearson(arr, min_periods=max(int(min_periods), 1))
+        return pd.DataFrame(r, index=sub.columns, columns=sub.columns)
+    if (
+        method not in ("pearson", "spearman")
+        or len(arr) < max(int(min_periods), 2)
+        or np.isnan(arr).any()
+    ):
+        return sub.corr(method=method, min_periods=min_periods)
+    if method == "spearman":
+        # scipy.stats は取込が重いので、順位相関を計算するときだけ読み込む
+        from scipy.stats import rankdata
+
+        arr = rankdata(arr, axis=0)
+    arr = arr - arr.mean(axis=0)
+    norms = np.sqrt(np.einsum("ij,ij->j", arr, arr))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (arr / norms).astype(np.float32)
+    c = (z.T @ z).astype(np.float64)
+    np.clip(c, -1.0, 1.0, out=c)
+    np.fill_diagonal(c, np.where(norms > 0, 1.0, np.nan))
+    return pd.DataFrame(c, index=sub.columns, columns=sub.columns)
+
+
+def _fisher_ci_arrays(
+    r: np.ndarray, n: np.ndarray, zcrit: float = 1.96
+) -> tuple[np.ndarray, np.ndarray]:
+    """Vectorised :func:`fisher_ci` over arrays of coefficients and sample sizes."""
+
+    r = np.clip(np.asarray(r, dtype=float), -0.999999, 0.999999)
+    n = np.asarray(n, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        se = np.where(n > 3, 1 / np.sqrt(n - 3), np.nan)
+    z = np.arctanh(r)
+    return np.tanh(z - zcrit * se), np.tanh(z + zcrit * se)
+
+
 def corr_table(
     df: pd.DataFrame,
     cols: Iterable[str],
@@ -29,73 +177,67 @@ def corr_table(
     *,
     pairwise: bool = False,
     min_periods: int = 3,
+    matrix: pd.DataFrame | None = None,
 ) -> pd.DataFrame:
-    """Build tidy correlation table for selected columns."""
+    """Build tidy correlation table for selected columns.
+
+    Only the upper triangle of the correlation matrix is read, one row per
+    unordered pair. *matrix* may carry a precomputed matrix for *cols*
+    (listwise, or pairwise with the same *min_periods* in pairwise mode) so
+    the heatmap and the table share one computation, including the
+    Spearman ranking.
+    """
 
     cols = list(cols)
-    rows: List[Dict[str, float | int | str]] = []
+    columns = ["pair", "r", "n", "ci_low", "ci_high", "sig"]
 
     if not cols:
-        return pd.DataFrame(rows)
+        return pd.DataFrame()
 
     if not pairwise:
         sub = df[cols].dropna()
         n = len(sub)
         if n == 0:
-            return pd.DataFrame(rows)
-        c = sub.corr(method=method)
-        for i, a in enumerate(cols):
-            for b in cols[i + 1 :]:
-                r = c.loc[a, b]
-                lo, hi = fisher_ci(r, n)
-                sig = "有意(95%)" if (lo > 0 or hi < 0) else "n.s."
-                rows.append(
-                    {
-                        "pair": f"{a}×{b}",
-                        "r": float(r),
-                        "n": n,
-                        "ci_low": lo,
-                        "ci_high": hi,
-                        "sig": sig,
-                    }
-                )
-        return pd.DataFrame(rows).sort_values("r", ascending=False)
-
-    # Pairwise mode keeps the available observations for each pair individually.
-    min_periods = max(int(min_periods), 2)
-    for i, a in enumerate(cols):
-        for b in cols[i + 1 :]:
-            sub = df[[a, b]].dropna()
-            n = len(sub)
-            if n < min_periods:
-                rows.append(
-                    {
-                        "pair": f"{a}×{b}",
-                        "r": np.nan,
-                        "n": n,
-                        "ci_low": np.nan,
-                        "ci_high": np.nan,
-                        "sig": "データ不足",
-                    }
-                )
-                continue
-            r = sub[a].corr(sub[b], method=method)
-            lo, hi = fisher_ci(r, n)
-            sig = "有意(95%)" if (lo > 0 or hi < 0) else "n.s."
-            rows.append(
-                {
-                    "pair": f"{a}×{b}",
-                    "r": float(r) if not pd.isna(r) else np.nan,
-                    "n": n,
-                    "ci_low": lo,
-                    "ci_high": hi,
-                    "sig": sig,
-                }
-            )
-
-    if not rows:
-        return pd.DataFrame(rows)
-    return pd.DataFrame(rows).sort_values("r", ascending=False, na_position="last")
+            return pd.DataFrame()
+        c = matrix if matrix is not None else corr_matrix(sub, cols, method=method)
+        counts = None
+    else:
+        # Pairwise mode keeps the available observations for each pair individually.
+        min_periods = max(int(min_periods), 2)
+        sub = df[cols]
+        if matrix is not None:
+            c = matrix
+        else:
+            c = corr_matrix(sub, cols, method=method, min_periods=min_periods)
+        mask = sub.notna().to_numpy(dtype=np.int64)
+        counts = mask.T @ mask
+
+    i, j = np.triu_indices(len(cols), k=1)
+    if len(i) == 0:
+        return pd.DataFrame()
+    r = c.loc[cols, cols].to_numpy(dtype=float)[i, j]
+    n_pair = counts[i, j] if counts is not None else np.full(len(i), n)
+    lo, hi = _fisher_ci_arrays(r, n_pair)
+    sig = np.where((lo > 0) | (hi < 0), "有意(95%)", "n.s.")
+    if counts is not None:
+        short = n_pair < min_periods
+        r = np.where(short, np.nan, r)
+        lo = np.where(short, np.nan, lo)
+        hi = np.where(short, np.nan, hi)
+        sig = np.where(short, "データ不足", sig)
+    names = np.asarray(cols, dtype=object)
+    tbl = pd.DataFrame(
+        {
+            "pair": names[i] + "×" + names[j],
+            "r": r,
+            "n": n_pair,
+            "ci_low": lo,
+            "ci_high": hi,
+            "sig": sig,
+        },
+        columns=columns,
+    )
+    return tbl.sort_values("r", ascending=False, na_position="last")
 
 
 def winsorize_frame(df: pd.DataFrame, cols: Iterable[str], p: float = 0.01) -> pd.DataFrame:
@@ -121,40 +263,77 @@ def maybe_log1p(df: pd.DataFrame, cols: Iterable[str], enable: bool) -> pd.DataF
     return out
 
 
+def _top_positions(score: np.ndarray, mask: np.ndarray, k: int) -> np.ndarray:
+    """Return positions of the *k* highest ``score`` entries under ``mask``, best first."""
+
+    cand = np.flatnonzero(mask)
+    if k <= 0 or len(cand) == 0:
+        return np.empty(0, dtype=np.intp)
+    if len(cand) > k:
+        vals = score[cand]
+        cutoff = np.partition(vals, len(vals) - k)[len(vals) - k]
+        above = np.flatnonzero(vals > cutoff)
+        # Ties at the cutoff are taken in row order, like ``nlargest(keep="first")``.
+        tied = np.flatnonzero(vals == cutoff)[: k - len(above)]
+        cand = cand[np.sort(np.concatenate([above, tied]))]
+    return cand[np.argsort(-score[cand], kind="stable")]
+
+
 def narrate_top_insights(tbl: pd.DataFrame, name_map: Dict[str, str], k: int = 3) -> List[str]:
     """Return human-readable highlights from correlation table."""
 
     if tbl.empty or "r" not in tbl:
         return []
 
-    pos = tbl[tbl["r"] > 0].nlargest(k, "r")
-    neg = tbl[tbl["r"] < 0].nsmallest(k, "r")
+    r = tbl["r"].to_numpy(dtype=float)
+    pos = tbl.iloc[_top_positions(r, r > 0, k)]
+    neg = tbl.iloc[_top_positions(-r, r < 0, k)]
     lines: List[str] = []
 
     def jp(pair: str) -> str:
         a, b = pair.split("×")
         return f"「{name_map.get(a, a)}」と「{name_map.get(b, b)}」"
 
-    for _, r in pos.iterrows():
+    for _, row in pos.iterrows():
         lines.append(
-            f"{jp(r['pair'])} は **正の相関** (r={r['r']:.2f}, 95%CI [{r['ci_low']:.2f},{r['ci_high']:.2f}], n={int(r['n'])})."
+            f"{jp(row['pair'])} は **正の相関** (r={row['r']:.2f}, 95%CI [{row['ci_low']:.2f},{row['ci_high']:.2f}], n={int(row['n'])})."
         )
-    for _, r in neg.iterrows():
+    for _, row in neg.iterrows():
         lines.append(
-            f"{jp(r['pair'])} は **負の相関** (r={r['r']:.2f}, 95%CI [{r['ci_low']:.2f},{r['ci_high']:.2f}], n={int(r['n'])})."
+            f"{jp(row['pair'])} は **負の相関** (r={row['r']:.2f}, 95%CI [{row['ci_low']:.2f},{row['ci_high']:.2f}], n={int(row['n'])})."
         )
     return lines
 
 
 def fit_line(x: pd.Series, y: pd.Series) -> tuple[float, float, float]:
-    """Return slope, intercept and R² from a simple linear regression."""
-
-    x = x.values.astype(float)
-    y = y.values.astype(float)
-    m, b = np.polyfit(x, y, 1)
-    yhat = m * x + b
-    ss_res = np.sum((y - yhat) ** 2)
-    ss_tot = np.sum((y - y.mean()) ** 2)
-    r2 = 1 - ss_res / ss_tot if ss_tot > 0 else np.nan
+    """Return slope, intercept and R² from a simple linear regression.
+
+    Uses the closed-form moments (slope = Sxy/Sxx, R² = r²) instead of a
+    least-squares solve.
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    dx = x - x.mean()
+    dy = y - y.mean()
+    sxx, syy, sxy = float(dx @ dx), float(dy @ dy), float(dx @ dy)
+    if sxx <= 0:
+        return np.nan, np.nan, np.nan
+    m = sxy / sxx
+    b = float(y.mean()) - m * float(x.mean())
+    r2 = sxy * sxy / (sxx * syy) if syy > 0 else np.nan
     return float(m), float(b), float(r2)
 
+
+def largest_residuals(
+    x: pd.Series, y: pd.Series, m: float, b: float, k: int = 3
+) -> np.ndarray:
+    """Return row positions of the *k* points farthest from ``y = m·x + b``."""
+
+    resid = np.abs(np.asarray(y, dtype=float) - (m * np.asarray(x, dtype=float) + b))
+    finite = np.isfinite(resid)
+    k = min(k, int(finite.sum()))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    resid = np.where(finite, resid, -np.inf)
+    return np.argpartition(-resid, k - 1)[:k]
@@ -1,6 +1,7 @@
 """Utilities for loading and working with design tokens defined in YAML."""
 from __future__ import annotations
 
+from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Sequence
@@ -107,8 +108,13 @@ def get_layout_token(*path: str) -> Any:
     return _resolve_section(["layout", *path])
 
 
+@lru_cache(maxsize=256)
 def hex_to_rgb_tuple(color: str) -> tuple[int, int, int]:
-    """Convert a hex colour to an ``(r, g, b)`` tuple."""
+    """Convert a hex colour to an ``(r, g, b)`` tuple.
+
+    Cached because ``rgba``/``lighten`` are called with the same palette
+    colours from rerun-scoped code in ``app.py``.
+    """
 
     color = _normalise_hex(color)
     r = int(color[1:3], 16)
@@ -171,3 +177,108 @@ def spacing_scale() -> List[int]:
         return []
     return [int(val) for val in scale]
 
+
+_DEFAULT_CARD_SHADOW = "0 12px 24px rgba(11,31,59,0.08)"
+
+
+@dataclass(frozen=True)
+class DesignSnapshot:
+    """Resolved colours, fonts and layout values used by the app's CSS."""
+
+    primary_color: str
+    primary_rgb: str
+    primary_dark: str
+    primary_deep: str
+    primary_deep_rgb: str
+    primary_light: str
+    secondary_color: str
+    secondary_rgb: str
+    secondary_soft: str
+    accent_color: str
+    accent_rgb: str
+    accent_soft: str
+    accent_soft_rgb: str
+    accent_emphasis: str
+    background_color: str
+    background_muted: str
+    surface_color: str
+    surface_alt_color: str
+    text_color: str
+    muted_color: str
+    border_color: str
+    border_strong: str
+    success_color: str
+    success_rgb: str
+    warning_color: str
+    warning_rgb: str
+    error_color: str
+    body_font_size: Any
+    body_line_height: Any
+    heading_line_height: Any
+    font_body: str
+    font_heading: str
+    font_numeric: str
+    card_radius: Any
+    card_shadow: str
+    spacing_unit: Any
+    plotly_palette: tuple[str, ...]
+
+
+@lru_cache(maxsize=1)
+def design_snapshot() -> DesignSnapshot:
+    """Return every derived design value, resolved from the token tree once."""
+
+    primary = get_color("primary")
+    primary_deep = darken(primary, 0.4)
+    background = get_color("background")
+    body = get_typography("body")
+    heading = get_typography("heading")
+    card = get_layout_token("card")
+    card_radius = card.get("radius_px", {}) if isinstance(card, dict) else {}
+    card_shadow = (
+        card.get("shadow", _DEFAULT_CARD_SHADOW)
+        if isinstance(card, dict)
+        else _DEFAULT_CARD_SHADOW
+    )
+    primary_rgb = get_color_rgb("primary")
+    if "rgba(" in card_shadow:
+        card_shadow = card_shadow.replace("rgba(11,31,59", f"rgba({primary_rgb}")
+    return DesignSnapshot(
+        primary_color=primary,
+        primary_rgb=primary_rgb,
+        primary_dark=darken(primary, 0.25),
+        primary_deep=primary_deep,
+        primary_deep_rgb=",".join(str(c) for c in hex_to_rgb_tuple(primary_deep)),
+        primary_light=lighten(primary, 0.25),
+        secondary_color=get_color("secondary"),
+        secondary_rgb=get_color_rgb("secondary"),
+        secondary_soft=lighten(get_color("secondary"), 0.35),
+        accent_color=get_color("accent"),
+        accent_rgb=get_color_rgb("accent"),
+        accent_soft=get_color("accent", "soft"),
+        accent_soft_rgb=get_color_rgb("accent", "soft"),
+        accent_emphasis=get_color("accent", "emphasis"),
+        background_color=background,
+        background_muted=mix(background, get_color("surface_alt"), 0.45),
+        surface_color=get_color("surface"),
+        surface_alt_color=get_color("surface_alt"),
+        text_color=get_color("text"),
+        muted_color=get_color("muted"),
+        border_color=get_color("border"),
+        border_strong=get_color("border", "strong"),
+        success_color=get_color("success"),
+        success_rgb=get_color_rgb("success"),
+        warning_color=get_color("warning"),
+        warning_rgb=get_color_rgb("warning"),
+        error_color=get_color("error"),
+        body_font_size=body.get("size_px", {}).get("base", 15),
+        body_line_height=body.get("line_height", 1.5),
+        heading_line_height=heading.get("line_height", 1.35),
+        font_body=get_font_stack("body"),
+        font_heading=get_font_stack("heading"),
+        font_numeric=get_font_stack("numeric"),
+        card_radius=card_radius.get("base", card_radius.get("min", 10)),
+        card_shadow=card_shadow,
+        spacing_unit=get_layout_token("spacing", "unit_px"),
+        plotly_palette=tuple(get_plotly_palette()),
+    )
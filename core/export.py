@@ -8,6 +8,32 @@ from typing import Dict
 
 import pandas as pd
 
+CSV_CHUNK_ROWS = 50_000
+
+
+def to_csv_bytes(df: pd.DataFrame, *, index: bool = False) -> bytes:
+    """データフレームを BOM 付き UTF-8 の CSV バイト列に変換する。
+
+    文字列全体を作ってから ``encode`` せず、``BytesIO`` へ行チャンク単位で
+    直接書き込むため、出力サイズ分の中間文字列を持たない。
+    """
+
+    buff = io.BytesIO()
+    df.to_csv(buff, index=index, encoding="utf-8-sig", chunksize=CSV_CHUNK_ROWS)
+    return buff.getvalue()
+
+
+def to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    """データフレームを zstd 圧縮の Parquet バイト列に変換する。
+
+    Excel で開く必要のない再取込用のスナップショット向け。型を保ったまま
+    CSV/xlsx より小さく速く書き出せる。
+    """
+
+    buff = io.BytesIO()
+    df.to_parquet(buff, engine="pyarrow", compression="zstd", index=False)
+    return buff.getvalue()
+
 
 def to_zip(tables: Dict[str, pd.DataFrame]) -> bytes:
     """複数のデータフレームを ZIP (CSV) にまとめる。"""
@@ -0,0 +1,323 @@
+"""カードやラベルなど、画面に埋め込む HTML 断片の組み立て。
+
+どれも入力文字列だけで決まる純粋関数なので ``lru_cache`` で結果を保持する。
+``app.py`` は再実行のたびに評価し直されるため、キャッシュはこのモジュールに置く。
+"""
+
+from __future__ import annotations
+
+import html
+import re
+import textwrap
+from functools import lru_cache
+from string import Template
+from typing import Optional
+
+try:  # rcssmin は任意依存（未インストール時は CSS を整形したまま送る）
+    from rcssmin import cssmin
+except ImportError:  # pragma: no cover - optional dependency
+    cssmin = None
+
+_STYLE_BLOCK = re.compile(r"(<style>)(.*?)(</style>)", re.S)
+
+# data-tooltip 属性用: ``html.escape(quote=True)`` と改行の ``&#10;`` 化を1回の走査で行う
+_TOOLTIP_TABLE = str.maketrans(
+    {
+        "&": "&amp;",
+        "<": "&lt;",
+        ">": "&gt;",
+        '"': "&quot;",
+        "'": "&#x27;",
+        "\n": "&#10;",
+    }
+)
+
+# テンプレートは取込時に一度だけ解析し、描画時は ``substitute`` で埋めるだけにする
+# ツールチップ無しのカードが大半なので、有無で別テンプレートにして空の差し込みを持たない
+_METRIC_CARD_PLAIN_TEMPLATE = Template(
+    textwrap.dedent(
+        """
+        <div class="mck-metric-card mck-animated" role="group">
+          <div class="mck-metric-card__header">
+            $icon
+            <div class="mck-metric-card__title-group">
+              <div class="mck-metric-card__title">$title</div>
+              $subtitle
+            </div>
+          </div>
+          <div class="mck-metric-card__value">$value</div>
+          $footnote
+        </div>
+        """
+    )
+)
+
+_METRIC_CARD_TOOLTIP_TEMPLATE = Template(
+    textwrap.dedent(
+        """
+        <div class="mck-metric-card mck-animated has-tooltip" role="group" data-tooltip="$tooltip" tabindex="0" aria-label="$aria">
+          <div class="mck-metric-card__header">
+            $icon
+            <div class="mck-metric-card__title-group">
+              <div class="mck-metric-card__title">$title</div>
+              $subtitle
+            </div>
+            <span class='mck-metric-card__info' aria-hidden='true'>$info_symbol</span>
+          </div>
+          <div class="mck-metric-card__value">$value</div>
+          $footnote
+        </div>
+        """
+    )
+)
+
+_SECTION_HEADER_TEMPLATE = Template(
+    """
+        <div class="mck-section-header">
+            $icon
+            <div>
+                <h2>$title</h2>
+                $subtitle
+            </div>
+        </div>
+        """
+)
+
+_TOUR_PROGRESS_TEMPLATE = Template(
+    """
+<div class='tour-progress'>
+  <div class='tour-progress__meta'>
+    <span>$label</span>
+    <span>STEP $step / $total</span>
+  </div>
+  <div class='tour-progress__track' role='progressbar' aria-valuemin='1' aria-valuemax='$total' aria-valuenow='$step'>
+    <div class='tour-progress__bar' style='width: $percent%;'></div>
+  </div>
+</div>
+"""
+)
+
+_INLINE_LABEL_TEMPLATE = Template(
+    """
+        <div class="mck-inline-label mck-animated">
+          $icon
+          <div class="mck-inline-label__texts">
+            <span class="mck-inline-label__primary">$primary</span>
+            $secondary
+          </div>
+          $help
+        </div>
+        """
+)
+
+_QUALITY_SUMMARY_TEMPLATE = Template(
+    """
+        <div class="mck-alert mck-alert--$level mck-animated">
+          $icon
+          <div class="mck-alert__content">
+            <strong>データ品質サマリー</strong>
+            <p>欠測セルと期間を自動チェックしました。下記を確認して次のステップへ進んでください。</p>
+            <div class="mck-progress">
+              <div class="mck-progress__bar" style="width:$width%;"></div>
+            </div>
+            <div class="mck-progress__meta">完全性 $width% ｜ 欠測 $missing / $total</div>
+            <ul class="mck-alert__meta">
+              <li>SKU数 $sku</li>
+              <li>期間 $start 〜 $end</li>
+            </ul>
+          </div>
+        </div>
+        """
+)
+
+
+def minify_css(css: str) -> str:
+    """CSS の空白・コメントを取り除く（rcssmin が無ければそのまま返す）。"""
+
+    return cssmin(css) if cssmin is not None else css
+
+
+def minify_style_blocks(markup: str) -> str:
+    """``<style>`` 要素の中身だけを ``minify_css`` で詰める。"""
+
+    if cssmin is None:
+        return markup
+    return _STYLE_BLOCK.sub(lambda m: m.group(1) + cssmin(m.group(2)) + m.group(3), markup)
+
+
+def _escape_tooltip(text: str) -> str:
+    """ツールチップ文字列を属性値として安全な形に変換する。"""
+
+    return text.translate(_TOOLTIP_TABLE)
+
+
+@lru_cache(maxsize=1024)
+def metric_card_html(
+    title: str,
+    value: str,
+    subtitle: str = "",
+    footnote: str = "",
+    tooltip: str = "",
+    icon_html: str = "",
+    info_symbol: str = "ℹ",
+) -> str:
+    """指標カード1枚分の HTML を返す（同じ入力なら組み立て済みの文字列を再利用）。"""
+
+    icon_block = (
+        f"<span class='mck-metric-card__icon' aria-hidden='true'>{icon_html}</span>"
+        if icon_html
+        else ""
+    )
+    subtitle_html = (
+        f"<span class='mck-metric-card__subtitle'>{html.escape(subtitle)}</span>"
+        if subtitle
+        else ""
+    )
+    footnote_html = (
+        f"<div class='mck-metric-card__footnote'>{html.escape(footnote)}</div>"
+        if footnote
+        else ""
+    )
+    if not tooltip.strip():
+        return _METRIC_CARD_PLAIN_TEMPLATE.substitute(
+            icon=icon_block,
+            title=html.escape(title),
+            subtitle=subtitle_html,
+            value=html.escape(value),
+            footnote=footnote_html,
+        ).strip()
+    aria_label = f"{title}: {tooltip.replace(chr(10), ' ')}".strip()
+    return _METRIC_CARD_TOOLTIP_TEMPLATE.substitute(
+        tooltip=_escape_tooltip(tooltip),
+        aria=html.escape(aria_label, quote=True),
+        icon=icon_block,
+        title=html.escape(title),
+        subtitle=subtitle_html,
+        info_symbol=info_symbol,
+        value=html.escape(value),
+        footnote=footnote_html,
+    ).strip()
+
+
+@lru_cache(maxsize=256)
+def section_header_html(
+    title: str, subtitle: Optional[str] = None, icon: Optional[str] = None
+) -> str:
+    """セクション見出しの HTML を返す（見出し文字列は呼び出し側で用意した HTML のまま埋め込む）。"""
+
+    return _SECTION_HEADER_TEMPLATE.substitute(
+        icon=f"<span class='mck-section-icon'>{icon}</span>" if icon else "",
+        title=title,
+        subtitle=f"<p class='mck-section-subtitle'>{subtitle}</p>" if subtitle else "",
+    )
+
+
+@lru_cache(maxsize=128)
+def tour_banner_html(
+    *,
+    muted: bool,
+    section: str = "",
+    section_index: int = 0,
+    section_total: int = 0,
+    eyebrow: str = "",
+    title: str = "",
+    description: str = "",
+    details: str = "",
+    step: int = 0,
+    total: int = 0,
+) -> str:
+    """ツアーバナー（見出し・説明・進捗バー）を1つの HTML 断片にまとめて返す。
+
+    ``step`` と ``total`` がどちらも正のときだけ進捗バーを付ける。
+    """
+
+    parts = []
+    if section:
+        parts.append(
+            f"<div class='tour-banner__section'>{html.escape(section)}"
+            f"<span>{section_index} / {section_total}</span></div>"
+        )
+    if eyebrow:
+        parts.append(f"<p class='tour-banner__progress'>{html.escape(eyebrow)}</p>")
+    if title:
+        parts.append(f"<div class='tour-banner__title'>{html.escape(title)}</div>")
+    if description:
+        parts.append(f"<p class='tour-banner__desc'>{html.escape(description)}</p>")
+    if details:
+        parts.append(f"<p class='tour-banner__details'>{html.escape(details)}</p>")
+    if step > 0 and total > 0:
+        label = f"{section} {section_index} / {section_total}" if section else f"STEP {step} / {total}"
+        parts.append(
+            _TOUR_PROGRESS_TEMPLATE.substitute(
+                label=html.escape(label),
+                step=step,
+                total=total,
+                percent=f"{step / total * 100:.2f}",
+            )
+        )
+    banner_class = "tour-banner tour-banner--muted" if muted else "tour-banner"
+    return f"<div class='{banner_class}'>" + "".join(parts) + "</div>"
+
+
+@lru_cache(maxsize=256)
+def inline_label_html(
+    primary: str,
+    secondary: Optional[str] = None,
+    help_text: Optional[str] = None,
+    icon_html: str = "",
+) -> str:
+    """アイコン付きインラインラベルの HTML を返す。"""
+
+    icon_block = (
+        f"<span class='mck-inline-label__icon' aria-hidden='true'>{icon_html}</span>"
+        if icon_html
+        else ""
+    )
+    secondary_html = (
+        f"<span class='mck-inline-label__secondary'>{html.escape(secondary)}</span>"
+        if secondary
+        else ""
+    )
+    help_html = ""
+    if help_text:
+        tooltip = _escape_tooltip(help_text)
+        help_html = (
+            "<span class='mck-inline-label__help' tabindex='0' aria-label='ヘルプ' "
+            f"data-tooltip='{tooltip}'>?</span>"
+        )
+    return _INLINE_LABEL_TEMPLATE.substitute(
+        icon=icon_block,
+        primary=html.escape(primary),
+        secondary=secondary_html,
+        help=help_html,
+    )
+
+
+@lru_cache(maxsize=64)
+def quality_summary_html(
+    level: str,
+    icon_text: str,
+    completeness_pct: float,
+    missing: int,
+    total: int,
+    sku_count: int,
+    period_start: str,
+    period_end: str,
+) -> str:
+    """データ品質サマリー（完全性バー付きアラート）の HTML を返す。"""
+
+    icon_block = (
+        f"<div class='mck-alert__icon' aria-hidden='true'>{html.escape(icon_text)}</div>"
+        if icon_text
+        else ""
+    )
+    return _QUALITY_SUMMARY_TEMPLATE.substitute(
+        level=level,
+        icon=icon_block,
+        width=f"{completeness_pct:.1f}",
+        missing=f"{missing:,}",
+        total=f"{total:,}",
+        sku=f"{sku_count:,}",
+        start=html.escape(period_start),
+        end=html.escape(period_end),
+    )
@@ -3,10 +3,19 @@ from typing import Any
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+import plotly.io as pio
 import streamlit as st
 
 from core.design_tokens import get_color, get_font_stack, rgba
 
+try:  # orjson is optional; Plotly falls back to its pure-Python JSON encoder
+    import orjson  # noqa: F401
+except ImportError:  # pragma: no cover - optional dependency
+    pass
+else:
+    # st.plotly_chart serialises every figure via plotly.io.to_json
+    pio.json.config.default_engine = "orjson"
+
 
 PRIMARY = get_color("primary")
 PRIMARY_TEXT = get_color("text")
@@ -21,12 +30,17 @@ DARK_AXIS = rgba(ACCENT_SOFT, 0.35)
 
 
 def apply_elegant_theme(fig: go.Figure, theme: str = "light") -> go.Figure:
-    """Apply subdued, elegant styling to Plotly figures when enabled."""
+    """Apply subdued, elegant styling to Plotly figures when enabled.
+
+    Layout colours and the styling of every x/y axis (including subplot axes)
+    are merged into one ``update_layout`` call so the layout tree is validated
+    once instead of once per ``update_*`` helper.
+    """
     if not st.session_state.get("elegant_on", True):
         return fig
     if theme == "dark":
         dark_bg = "#0F1A2C"
-        fig.update_layout(
+        layout = dict(
             template="plotly_dark",
             paper_bgcolor=dark_bg,
             plot_bgcolor=dark_bg,
@@ -50,7 +64,7 @@ def apply_elegant_theme(fig: go.Figure, theme: str = "light") -> go.Figure:
         axisline = DARK_AXIS
         marker_border = rgba(ACCENT_SOFT, 0.45)
     else:
-        fig.update_layout(
+        layout = dict(
             template="plotly_white",
             paper_bgcolor=get_color("surface"),
             plot_bgcolor=get_color("surface"),
@@ -73,7 +87,7 @@ def apply_elegant_theme(fig: go.Figure, theme: str = "light") -> go.Figure:
         grid = LIGHT_GRID
         axisline = LIGHT_AXIS
         marker_border = rgba(PRIMARY, 0.24)
-    fig.update_xaxes(
+    axis_style = dict(
         showgrid=True,
         gridcolor=grid,
         linecolor=axisline,
@@ -82,19 +96,12 @@ def apply_elegant_theme(fig: go.Figure, theme: str = "light") -> go.Figure:
         tickcolor=axisline,
         showline=True,
         linewidth=1,
-        title_standoff=14,
-    )
-    fig.update_yaxes(
-        showgrid=True,
-        gridcolor=grid,
-        linecolor=axisline,
-        ticks="outside",
-        ticklen=4,
-        tickcolor=axisline,
-        showline=True,
-        linewidth=1,
-        title_standoff=16,
     )
+    for axis in fig.select_xaxes():
+        layout[axis.plotly_name] = dict(axis_style, title_standoff=14)
+    for axis in fig.select_yaxes():
+        layout[axis.plotly_name] = dict(axis_style, title_standoff=16)
+    fig.update_layout(**layout)
     fig.update_traces(
         selector=lambda t: "markers" in getattr(t, "mode", ""),
         marker=dict(size=6, line=dict(width=1.2, color=marker_border)),
@@ -164,6 +171,31 @@ def add_latest_labels_no_overlap(
         )
 
 
+def corr_heatmap(corr: pd.DataFrame, text_max: int = 15) -> go.Figure:
+    """Build a correlation heatmap from a single ``go.Heatmap`` trace.
+
+    Values are rounded to two decimals and cell text is only drawn while the
+    matrix side is at most *text_max*, keeping the figure JSON small.
+    """
+
+    labels = [str(c) for c in corr.columns]
+    heat = dict(
+        z=np.round(corr.to_numpy(dtype=float), 2),
+        x=labels,
+        y=[str(i) for i in corr.index],
+        zmin=-1,
+        zmax=1,
+        colorscale="RdBu_r",
+        hovertemplate="%{y} × %{x}<br>r=%{z:.2f}<extra></extra>",
+    )
+    if len(labels) <= text_max:
+        heat["texttemplate"] = "%{z:.2f}"
+    fig = go.Figure(go.Heatmap(**heat))
+    fig.update_xaxes(constrain="domain")
+    fig.update_yaxes(autorange="reversed", scaleanchor="x", constrain="domain")
+    return fig
+
+
 def render_plotly_with_spinner(
     fig: go.Figure,
     *,
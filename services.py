@@ -1,7 +1,7 @@
 
 import re
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Dict
+from typing import List, Optional, Tuple, Dict, NamedTuple, Union
 import pandas as pd
 import numpy as np
 from datetime import datetime
@@ -17,6 +17,21 @@ class FactRecord:
     is_missing: bool = False
 
 
+class YearSumMatrix(NamedTuple):
+    """SKU × month matrix of year_sum (rows follow codes, columns follow months)."""
+    codes: np.ndarray
+    months: np.ndarray
+    values: np.ndarray
+
+
+class SnapshotArrays(NamedTuple):
+    """Column arrays of a year-sum snapshot for mask-based band filtering."""
+    codes: np.ndarray
+    year_sum: np.ndarray
+    rank: np.ndarray
+    yoy: np.ndarray
+
+
 # ---------- Utilities ----------
 def normalize_month_key(value: str) -> str:
     """Normalize a variety of month formats to 'YYYY-MM'."""
@@ -220,7 +235,7 @@ def compute_slopes(year_df: pd.DataFrame, last_n: int = 12) -> pd.DataFrame:
     """Add slope_beta column per product/month, computed over last_n year_sum values."""
     year_df = year_df.sort_values(["product_code","month"])
     out = []
-    for code, g in year_df.groupby("product_code"):
+    for code, g in year_df.groupby("product_code", observed=True):
         ys = g["year_sum"].tolist()
         months = g["month"].tolist()
         slopes = [np.nan]*len(ys)
@@ -444,12 +459,13 @@ def latest_yearsum_snapshot(df_year: pd.DataFrame, end_month: str) -> pd.DataFra
     ----------
     pd.DataFrame
         product_code, product_name, year_sum, rank, yoy, delta の列を持つ
-        スナップショット。slope_beta 列が存在する場合は併せて含める。
+        スナップショット。slope_beta / display_name 列が存在する場合は併せて含める。
     """
     snap = df_year[df_year["month"] == end_month].copy()
+    extra = ["display_name"] if "display_name" in df_year.columns else []
     if snap.empty:
         return pd.DataFrame(
-            columns=["product_code", "product_name", "year_sum", "rank", "yoy", "delta", "slope_beta"]
+            columns=["product_code", "product_name", "year_sum", "rank", "yoy", "delta", "slope_beta"] + extra
         )
     snap = snap.dropna(subset=["year_sum"])
     snap = snap.sort_values("year_sum", ascending=False)
@@ -457,10 +473,30 @@ def latest_yearsum_snapshot(df_year: pd.DataFrame, end_month: str) -> pd.DataFra
     cols = ["product_code", "product_name", "year_sum", "rank", "yoy", "delta"]
     if "slope_beta" in snap.columns:
         cols.append("slope_beta")
-    return snap[cols]
+    return snap[cols + extra]
+
 
+def snapshot_arrays(snapshot: pd.DataFrame) -> SnapshotArrays:
+    """スナップショットをバンド判定用の NumPy 配列に変換する。"""
+    if "yoy" in snapshot.columns:
+        yoy = snapshot["yoy"].to_numpy(dtype=float)
+    else:
+        yoy = np.full(len(snapshot), np.nan)
+    return SnapshotArrays(
+        codes=snapshot["product_code"].to_numpy(dtype=object),
+        year_sum=snapshot["year_sum"].to_numpy(dtype=float),
+        rank=snapshot["rank"].to_numpy(dtype=float),
+        yoy=yoy,
+    )
 
-def resolve_band(snapshot: pd.DataFrame, mode: str, params: Dict) -> Tuple[float, float]:
+
+def _as_snapshot_arrays(snapshot: Union[pd.DataFrame, SnapshotArrays]) -> SnapshotArrays:
+    if isinstance(snapshot, SnapshotArrays):
+        return snapshot
+    return snapshot_arrays(snapshot)
+
+
+def resolve_band(snapshot: Union[pd.DataFrame, SnapshotArrays], mode: str, params: Dict) -> Tuple[float, float]:
     """UIで指定されたモードとパラメータからバンド下限・上限を計算する。
 
     mode は以下をサポートする:
@@ -469,33 +505,40 @@ def resolve_band(snapshot: pd.DataFrame, mode: str, params: Dict) -> Tuple[float
         - 'percentile': 百分位
         - 'rank': 順位帯
         - 'target_near': 基準商品近傍
+
+    snapshot には DataFrame のほか、`snapshot_arrays` で変換済みの配列も渡せる。
     """
-    if snapshot.empty:
+    arrs = _as_snapshot_arrays(snapshot)
+    ys = arrs.year_sum
+    if len(ys) == 0:
         return (np.nan, np.nan)
 
     if mode == "amount":
         low = params.get("low_amount", -np.inf)
         high = params.get("high_amount", np.inf)
     elif mode == "two_products":
-        a = snapshot[snapshot["product_code"] == params.get("prod_a")]["year_sum"].iloc[0]
-        b = snapshot[snapshot["product_code"] == params.get("prod_b")]["year_sum"].iloc[0]
+        a = ys[np.flatnonzero(arrs.codes == params.get("prod_a"))[0]]
+        b = ys[np.flatnonzero(arrs.codes == params.get("prod_b"))[0]]
         low, high = sorted([float(a), float(b)])
     elif mode == "percentile":
         p_low = params.get("p_low", 0) / 100.0
         p_high = params.get("p_high", 100) / 100.0
-        low = float(snapshot["year_sum"].quantile(p_low))
-        high = float(snapshot["year_sum"].quantile(p_high))
+        valid = ys[~np.isnan(ys)]
+        if len(valid) == 0:
+            return (np.nan, np.nan)
+        # np.quantile は内部で部分ソート（introselect）を使うため全件ソートが不要
+        low, high = (float(v) for v in np.quantile(valid, [p_low, p_high]))
     elif mode == "rank":
         r_low = params.get("r_low", 1)
-        r_high = params.get("r_high", len(snapshot))
-        subset = snapshot[(snapshot["rank"] >= r_low) & (snapshot["rank"] <= r_high)]
-        low = float(subset["year_sum"].min())
-        high = float(subset["year_sum"].max())
+        r_high = params.get("r_high", len(ys))
+        subset = ys[(arrs.rank >= r_low) & (arrs.rank <= r_high)]
+        low = float(np.nanmin(subset)) if len(subset) else np.nan
+        high = float(np.nanmax(subset)) if len(subset) else np.nan
     else:  # target_near
-        row = snapshot[snapshot["product_code"] == params.get("target_code")]
-        if row.empty:
+        hit = np.flatnonzero(arrs.codes == params.get("target_code"))
+        if len(hit) == 0:
             return (np.nan, np.nan)
-        base = float(row["year_sum"].iloc[0])
+        base = float(ys[hit[0]])
         if params.get("by", "pct") == "amt":
             width = float(params.get("width", 0.0))
             low = base - width
@@ -507,12 +550,27 @@ def resolve_band(snapshot: pd.DataFrame, mode: str, params: Dict) -> Tuple[float
     return (low, high)
 
 
-def filter_products_by_band(snapshot: pd.DataFrame, low: float, high: float) -> List[str]:
+def filter_products_by_band(snapshot: Union[pd.DataFrame, SnapshotArrays], low: float, high: float) -> List[str]:
     """年計値が指定バンドに含まれる商品コードを返す。"""
-    if snapshot.empty:
+    arrs = _as_snapshot_arrays(snapshot)
+    if len(arrs.codes) == 0:
         return []
-    cond = (snapshot["year_sum"] >= low) & (snapshot["year_sum"] <= high)
-    return snapshot[cond]["product_code"].tolist()
+    ys = arrs.year_sum
+    return arrs.codes[(ys >= low) & (ys <= high)].tolist()
+
+
+def top_k_codes(snapshot: Union[pd.DataFrame, SnapshotArrays], col: str, k: int) -> List[str]:
+    """指定列の上位k件の商品コードを値の降順で返す（NaN は除外）。"""
+    arrs = _as_snapshot_arrays(snapshot)
+    values = getattr(arrs, col)
+    idx = np.flatnonzero(~np.isnan(values))
+    if k <= 0 or len(idx) == 0:
+        return []
+    if len(idx) > k:
+        # 上位k件だけが必要なので全件ソートではなく部分選択で絞り込む
+        idx = idx[np.argpartition(-values[idx], k - 1)[:k]]
+    idx = idx[np.argsort(-values[idx], kind="stable")]
+    return arrs.codes[idx].tolist()
 
 
 def get_yearly_series(df_year: pd.DataFrame,
@@ -551,23 +609,81 @@ def get_yearly_series(df_year: pd.DataFrame,
         columns="product_code",
         values=metric,
         aggfunc="sum",
+        observed=True,
     ).sort_index()
     return df, pivot
 
 
-def top_growth_codes(df_year: pd.DataFrame, end_month: str, window: int = 6, top: int = 10) -> List[str]:
-    """直近windowカ月の伸長上位商品コードを返す。"""
+def year_sum_matrix(df_year: pd.DataFrame) -> YearSumMatrix:
+    """年計ロングデータを SKU×月 の行列に変換する。"""
     if df_year.empty:
+        return YearSumMatrix(np.empty(0, dtype=object), np.empty(0, dtype=object), np.empty((0, 0)))
+    wide = df_year.pivot(index="product_code", columns="month", values="year_sum").sort_index(axis=1)
+    return YearSumMatrix(
+        codes=wide.index.to_numpy(dtype=object),
+        months=wide.columns.astype(str).to_numpy(dtype=object),
+        values=wide.to_numpy(dtype=float),
+    )
+
+
+def sku_metric_block(df_year: pd.DataFrame, metric: str, months: List[str],
+                     codes: List[str]) -> pd.DataFrame:
+    """指定した月×SKUだけの指標行列（行=月, 列=SKU）を作る。
+
+    全SKUをピボットしてから列を絞るのではなく、行・列位置を引いて
+    必要な大きさの配列に直接書き込む。該当がないセルは NaN。
+    """
+    out = np.full((len(months), len(codes)), np.nan)
+    if len(months) and len(codes) and not df_year.empty:
+        code_index = pd.Index(codes)
+        col = df_year["product_code"]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            # カテゴリ型ならカテゴリ一覧だけを引き、行ごとの文字列照合を避ける
+            cat_pos = code_index.get_indexer(col.cat.categories)
+            cat_codes = col.cat.codes.to_numpy()
+            code_pos = np.where(cat_codes >= 0, cat_pos[cat_codes], -1)
+        else:
+            code_pos = code_index.get_indexer(col)
+        month_pos = pd.Index(months).get_indexer(df_year["month"])
+        hit = (month_pos >= 0) & (code_pos >= 0)
+        out[month_pos[hit], code_pos[hit]] = df_year[metric].to_numpy(dtype=float)[hit]
+    return pd.DataFrame(
+        out,
+        index=pd.Index(months, name="month"),
+        columns=pd.Index(codes, name="product_code"),
+    )
+
+
+def top_growth_codes(df_year: pd.DataFrame, end_month: str, window: int = 6, top: int = 10,
+                     matrix: Optional[YearSumMatrix] = None) -> List[str]:
+    """直近windowカ月の伸長上位商品コードを返す。
+
+    matrix に `year_sum_matrix` の結果を渡すと、ロングデータのピボットを省略できる。
+    """
+    if matrix is None:
+        if df_year.empty:
+            return []
+        matrix = year_sum_matrix(df_year)
+    if matrix.values.size == 0:
         return []
     end_dt = pd.to_datetime(end_month)
-    start_dt = end_dt - pd.DateOffset(months=window)
-    sub = df_year[(pd.to_datetime(df_year["month"]) >= start_dt) & (pd.to_datetime(df_year["month"]) <= end_dt)]
-    pivot = sub.pivot_table(index="month", columns="product_code", values="year_sum").sort_index()
-    if pivot.empty or len(pivot) < 2:
+    start_key = (end_dt - pd.DateOffset(months=window)).strftime("%Y-%m")
+    end_key = end_dt.strftime("%Y-%m")
+    j0 = int(np.searchsorted(matrix.months, start_key, side="left"))
+    j1 = int(np.searchsorted(matrix.months, end_key, side="right"))
+    sub = matrix.values[:, j0:j1]
+    # 全SKUが欠損の月は比較の起点・終点にしない
+    cols = np.flatnonzero(~np.isnan(sub).all(axis=0))
+    if len(cols) < 2:
+        return []
+    diff = sub[:, cols[-1]] - sub[:, cols[0]]
+    idx = np.flatnonzero(~np.isnan(diff))
+    if top <= 0 or len(idx) == 0:
         return []
-    diff = pivot.iloc[-1] - pivot.iloc[0]
-    diff = diff.dropna().sort_values(ascending=False)
-    return diff.head(top).index.tolist()
+    if len(idx) > top:
+        idx = idx[np.argpartition(-diff[idx], top - 1)[:top]]
+    idx = idx[np.argsort(-diff[idx], kind="stable")]
+    return matrix.codes[idx].tolist()
 
 
 def trend_last6(series: pd.Series) -> dict:
@@ -617,7 +733,7 @@ def slope_last_n(y: pd.Series, n: int = 6):
 def slopes_snapshot(df_long: pd.DataFrame, x_col="month", y_col="year_sum",
                     key_col="product_code", n=6):
     """商品ごと末尾n点の傾きを一括算出。"""
-    g = df_long.sort_values(x_col).groupby(key_col, as_index=False)
+    g = df_long.sort_values(x_col).groupby(key_col, as_index=False, observed=True)
     rows = []
     for k, d in g:
         m, r = slope_last_n(d[y_col], n=n)
@@ -640,7 +756,7 @@ def shape_flags(df_long: pd.DataFrame, key_col="product_code",
     αは平均値×alpha_ratio（月あたり）、振幅は系列平均に対する比。
     """
     out = []
-    for code, d in df_long.sort_values(x_col).groupby(key_col):
+    for code, d in df_long.sort_values(x_col).groupby(key_col, observed=True):
         s = d[y_col].dropna().tail(window)
         if len(s) < max(6, window//2):
             out.append({key_col: code, "is_mountain": False, "is_valley": False})
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.anomaly import rolling_anomaly
+from services import detect_linear_anomalies
+
+
+@pytest.mark.parametrize("robust", [False, True])
+def test_rolling_anomaly_matches_per_series_detection(robust):
+    rng = np.random.default_rng(3)
+    mat = rng.normal(100, 10, (8, 36)).cumsum(axis=1)
+    mat[:, :11] = np.nan
+    mat[2, 20] = np.nan
+    mat[4, 28] += 400
+
+    sku_idx, month_idx, scores = rolling_anomaly(mat, window=12, thr=2.5, robust=robust)
+    got = {(int(r), int(c)): s for r, c, s in zip(sku_idx, month_idx, scores)}
+
+    expected = {}
+    for r in range(mat.shape[0]):
+        res = detect_linear_anomalies(pd.Series(mat[r]), window=12, threshold=2.5, robust=robust)
+        for _, row in res.iterrows():
+            expected[(r, int(row["month"]))] = row["score"]
+
+    assert got.keys() == expected.keys()
+    for key, score in expected.items():
+        assert got[key] == pytest.approx(score, rel=1e-6)
+
+
+def test_rolling_anomaly_short_rows_are_skipped():
+    mat = np.array([[1.0, 2.0, np.nan], [np.nan, np.nan, np.nan]])
+    sku_idx, month_idx, scores = rolling_anomaly(mat, window=3, thr=2.5)
+    assert len(sku_idx) == len(month_idx) == len(scores) == 0
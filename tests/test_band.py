@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import (
+    filter_products_by_band,
+    latest_yearsum_snapshot,
+    resolve_band,
+    sku_metric_block,
+    snapshot_arrays,
+    top_growth_codes,
+    top_k_codes,
+    year_sum_matrix,
+)
+
+
+@pytest.fixture
+def snapshot():
+    df = pd.DataFrame(
+        {
+            "product_code": [f"P{i}" for i in range(6)],
+            "product_name": [f"商品{i}" for i in range(6)],
+            "month": "2024-03",
+            "year_sum": [100.0, 600.0, 300.0, 500.0, 200.0, 400.0],
+            "yoy": [0.1, np.nan, -0.2, 0.3, 0.0, 0.05],
+            "delta": 0.0,
+        }
+    )
+    return latest_yearsum_snapshot(df, "2024-03")
+
+
+def test_percentile_band_matches_pandas_quantile(snapshot):
+    low, high = resolve_band(snapshot_arrays(snapshot), "percentile", {"p_low": 10, "p_high": 75})
+    assert low == pytest.approx(snapshot["year_sum"].quantile(0.10))
+    assert high == pytest.approx(snapshot["year_sum"].quantile(0.75))
+
+
+def test_rank_and_two_products_bands(snapshot):
+    arrs = snapshot_arrays(snapshot)
+    assert resolve_band(arrs, "rank", {"r_low": 2, "r_high": 3}) == (400.0, 500.0)
+    assert resolve_band(arrs, "two_products", {"prod_a": "P0", "prod_b": "P2"}) == (100.0, 300.0)
+    assert sorted(filter_products_by_band(arrs, 300.0, 500.0)) == ["P2", "P3", "P5"]
+
+
+def test_top_k_codes_orders_and_skips_nan(snapshot):
+    arrs = snapshot_arrays(snapshot)
+    assert top_k_codes(arrs, "year_sum", 2) == ["P1", "P3"]
+    assert top_k_codes(arrs, "yoy", 3) == ["P3", "P0", "P5"]
+    assert top_k_codes(snapshot, "yoy", 10) == snapshot.dropna(subset=["yoy"]).sort_values(
+        "yoy", ascending=False
+    )["product_code"].tolist()
+
+
+def test_top_growth_codes_with_matrix_matches_long_path():
+    months = [f"2024-{m:02d}" for m in range(1, 9)]
+    rows = []
+    for i, code in enumerate(["A", "B", "C", "D"]):
+        for j, month in enumerate(months):
+            rows.append(
+                {
+                    "product_code": code,
+                    "month": month,
+                    "year_sum": np.nan if j < 2 else 100.0 + j * (i - 1) * 10,
+                }
+            )
+    df = pd.DataFrame(rows)
+    expected = top_growth_codes(df, "2024-08", window=6, top=2)
+    assert expected == ["D", "C"]
+    assert top_growth_codes(df, "2024-08", window=6, top=2, matrix=year_sum_matrix(df)) == expected
+
+
+@pytest.mark.parametrize("categorical", [False, True])
+def test_sku_metric_block_matches_pivot(categorical):
+    df = pd.DataFrame(
+        {
+            "product_code": ["A", "A", "B", "B", "C", "C"],
+            "month": ["2024-01", "2024-02"] * 3,
+            "yoy": [0.1, 0.2, np.nan, 0.4, 0.5, 0.6],
+        }
+    )
+    if categorical:
+        df["product_code"] = df["product_code"].astype("category")
+    months, codes = ["2024-01", "2024-02"], ["C", "A", "Z"]
+
+    block = sku_metric_block(df, "yoy", months, codes)
+
+    expected = df.pivot(index="month", columns="product_code", values="yoy")
+    expected = expected.reindex(columns=codes)
+    np.testing.assert_array_equal(block.to_numpy(), expected.to_numpy())
+    assert list(block.columns) == codes
@@ -1,8 +1,18 @@
 import math
 
+import numpy as np
 import pandas as pd
+import pytest
 
-from core.correlation import corr_table
+from core import correlation
+from core.correlation import (
+    corr_matrix,
+    corr_table,
+    fit_line,
+    largest_residuals,
+    narrate_top_insights,
+    pairwise_pearson,
+)
 
 
 def test_corr_table_pairwise_counts_and_significance():
@@ -39,3 +49,134 @@ def test_corr_table_pairwise_insufficient_data():
     assert row["n"] == 0 or row["n"] < 3
     assert row["sig"] == "データ不足"
     assert math.isnan(row["r"])
+
+
+def test_corr_matrix_matches_pandas_corr():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(size=(40, 4)), columns=list("ABCD"))
+    df["D"] = df["A"] * 2 + rng.normal(scale=0.1, size=40)
+    df["E"] = 1e9 + df["B"] * 1e3  # yen-sized values must not lose precision
+
+    for method in ("pearson", "spearman"):
+        expected = df.corr(method=method)
+        result = corr_matrix(df, list("ABCDE"), method=method)
+        # float32 cross products: agreement to well below the 2 decimals shown
+        np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), atol=1e-6)
+
+    df["F"] = 5.0
+    flat = corr_matrix(df, ["A", "F"])
+    assert np.isnan(flat.loc["A", "F"]) and np.isnan(flat.loc["F", "F"])
+
+    df.loc[3, "B"] = np.nan
+    pd.testing.assert_frame_equal(
+        corr_matrix(df, list("ABCD"), min_periods=3), df[list("ABCD")].corr(min_periods=3)
+    )
+
+
+def test_corr_table_reuses_precomputed_matrix():
+    df = pd.DataFrame({"A": [1.0, 2.0, 4.0, 8.0], "B": [2.0, 1.0, 3.0, 5.0], "C": [4.0, 3.0, 2.0, 1.0]})
+    matrix = corr_matrix(df, ["A", "B", "C"])
+
+    tbl = corr_table(df, ["A", "B", "C"], matrix=matrix)
+
+    assert sorted(tbl["pair"]) == ["A×B", "A×C", "B×C"]
+    pd.testing.assert_frame_equal(tbl, corr_table(df, ["A", "B", "C"]))
+
+
+def test_fit_line_matches_polyfit():
+    x = pd.Series([1.0, 2.0, 4.0, 7.0, 11.0])
+    y = pd.Series([2.0, 3.5, 4.0, 9.0, 12.5])
+
+    m, b, r2 = fit_line(x, y)
+
+    m_ref, b_ref = np.polyfit(x, y, 1)
+    assert m == pytest.approx(m_ref)
+    assert b == pytest.approx(b_ref)
+    assert r2 == pytest.approx(x.corr(y) ** 2)
+
+
+def test_largest_residuals_matches_nlargest():
+    x = pd.Series(np.arange(10.0))
+    y = pd.Series([0.0, 1.2, 1.9, 9.0, 4.1, 5.0, -3.0, 7.0, 8.5, 9.0])
+
+    pos = largest_residuals(x, y, 1.0, 0.0, k=3)
+
+    expected = (y - x).abs().nlargest(3).index
+    assert sorted(x.index[pos]) == sorted(expected)
+    assert largest_residuals(x, y, np.nan, np.nan).size == 0
+
+
+def test_pairwise_pearson_matches_pandas(monkeypatch):
+    rng = np.random.default_rng(3)
+    x = rng.normal(size=(24, 8)) * 1e6 + 1e8
+    x[rng.random(x.shape) < 0.25] = np.nan
+    x[:, 2] = 4.0
+    x[:, 5] = np.nan
+    expected = pd.DataFrame(x).corr(min_periods=3).to_numpy()
+
+    r, n = pairwise_pearson(x, min_periods=3)
+    np.testing.assert_allclose(r, expected, atol=1e-10)
+    assert n[0, 0] == np.count_nonzero(~np.isnan(x[:, 0]))
+
+    monkeypatch.setattr(correlation, "NUMBA_AVAILABLE", False)
+    r_np, _ = pairwise_pearson(x, min_periods=3)
+    np.testing.assert_allclose(r_np, expected, atol=1e-10)
+
+
+def test_corr_table_pairwise_accepts_matrix():
+    df = pd.DataFrame(
+        {
+            "A": [1.0, 2.0, 3.0, None, 5.0],
+            "B": [1.0, 3.0, 2.0, 4.0, 6.0],
+            "C": [5.0, 3.0, 4.0, 1.0, None],
+        }
+    )
+    cols = ["A", "B", "C"]
+    matrix = corr_matrix(df, cols, method="spearman", min_periods=3)
+
+    shared = corr_table(df, cols, method="spearman", pairwise=True, matrix=matrix)
+
+    pd.testing.assert_frame_equal(
+        shared, corr_table(df, cols, method="spearman", pairwise=True)
+    )
+
+
+def test_narrate_top_insights_picks_strongest_by_sign():
+    r = [0.2, 0.9, np.nan, -0.8, 0.5, -0.1, 0.7, -0.95]
+    tbl = pd.DataFrame(
+        {
+            "pair": [f"a{i}×b{i}" for i in range(len(r))],
+            "r": r,
+            "ci_low": r,
+            "ci_high": r,
+            "n": 12,
+        }
+    )
+
+    lines = narrate_top_insights(tbl, {"a1": "A1"}, k=2)
+
+    assert [line.split("」")[0].lstrip("「") for line in lines] == ["A1", "a6", "a7", "a3"]
+    assert "正の相関" in lines[0] and "負の相関" in lines[-1]
+
+
+def test_narrate_top_insights_breaks_ties_in_row_order():
+    rng = np.random.default_rng(3)
+    r = rng.choice([0.5, 0.7, -0.5, -0.7, 0.9], size=40)
+    tbl = pd.DataFrame(
+        {
+            "pair": [f"a{i}×b{i}" for i in range(len(r))],
+            "r": r,
+            "ci_low": r,
+            "ci_high": r,
+            "n": 12,
+        }
+    )
+
+    expected = pd.concat(
+        [tbl[tbl["r"] > 0].nlargest(3, "r"), tbl[tbl["r"] < 0].nsmallest(3, "r")]
+    )
+    lines = narrate_top_insights(tbl, {}, k=3)
+
+    assert [line.split("」")[0].lstrip("「") for line in lines] == [
+        pair.split("×")[0] for pair in expected["pair"]
+    ]
@@ -0,0 +1,19 @@
+from core.design_tokens import (
+    darken,
+    design_snapshot,
+    get_color,
+    get_font_stack,
+    get_plotly_palette,
+)
+
+
+def test_design_snapshot_matches_token_getters():
+    tokens = design_snapshot()
+
+    assert tokens is design_snapshot()
+    assert tokens.primary_color == get_color("primary")
+    assert tokens.primary_deep == darken(get_color("primary"), 0.4)
+    assert tokens.accent_soft == get_color("accent", "soft")
+    assert tokens.font_heading == get_font_stack("heading")
+    assert list(tokens.plotly_palette) == get_plotly_palette()
+    assert "rgba(11,31,59" not in tokens.card_shadow or tokens.primary_rgb == "11,31,59"
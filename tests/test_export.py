@@ -0,0 +1,34 @@
+import io
+
+import pandas as pd
+import pytest
+
+from core import export
+from core.export import to_csv_bytes, to_parquet_bytes
+
+
+def test_to_csv_bytes_matches_encoded_string(monkeypatch):
+    monkeypatch.setattr(export, "CSV_CHUNK_ROWS", 3)
+    df = pd.DataFrame(
+        {
+            "product_code": [f"P{i}" for i in range(10)],
+            "product_name": ["商品" + str(i) for i in range(10)],
+            "year_sum": [i * 1000.5 for i in range(10)],
+        }
+    )
+    data = to_csv_bytes(df)
+    assert data.startswith(b"\xef\xbb\xbf")
+    assert data == df.to_csv(index=False).encode("utf-8-sig")
+
+
+def test_to_parquet_bytes_round_trips():
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame(
+        {
+            "product_code": ["P1", "P2"],
+            "month": ["2024-01", "2024-02"],
+            "year_sum": [1200.0, 3400.5],
+        }
+    )
+    restored = pd.read_parquet(io.BytesIO(to_parquet_bytes(df)))
+    pd.testing.assert_frame_equal(restored, df)
@@ -0,0 +1,90 @@
+import html
+
+import pytest
+
+from core.html_blocks import (
+    _escape_tooltip,
+    inline_label_html,
+    metric_card_html,
+    minify_style_blocks,
+    quality_summary_html,
+    section_header_html,
+    tour_banner_html,
+)
+
+
+def test_metric_card_html_escapes_and_adds_tooltip():
+    card = metric_card_html(
+        "年計<総額>", "1,234", subtitle="前年比", tooltip='計算式: "合計"\n意味'
+    )
+
+    assert "年計&lt;総額&gt;" in card
+    assert 'data-tooltip="計算式: &quot;合計&quot;&#10;意味"' in card
+    assert "has-tooltip" in card and 'tabindex="0"' in card
+    assert "mck-metric-card__footnote" not in card
+
+
+def test_metric_card_html_reuses_built_string():
+    first = metric_card_html("粗利", "10%")
+
+    assert metric_card_html("粗利", "10%") is first
+    assert "has-tooltip" not in first
+
+
+def test_quality_summary_html_formats_counts():
+    panel = quality_summary_html(
+        "warning", "!", 87.654, 1234, 10000, 42, "2023-01", "<2024-12>"
+    )
+
+    assert "mck-alert--warning" in panel
+    assert "width:87.7%;" in panel
+    assert "欠測 1,234 / 10,000" in panel
+    assert "〜 &lt;2024-12&gt;" in panel
+
+
+def test_inline_label_html_omits_empty_parts():
+    label = inline_label_html("期間", None, "開始\n終了")
+
+    assert "mck-inline-label__secondary" not in label
+    assert "data-tooltip='開始&#10;終了'" in label
+
+
+def test_section_header_html_omits_empty_parts():
+    header = section_header_html("ランキング", None, None)
+
+    assert "<h2>ランキング</h2>" in header
+    assert "mck-section-icon" not in header
+    assert "mck-section-subtitle" not in header
+    assert section_header_html("ランキング", None, None) is header
+
+
+def test_tour_banner_html_wraps_escaped_parts_and_progress():
+    banner = tour_banner_html(
+        muted=False,
+        section="基礎編",
+        section_index=2,
+        section_total=4,
+        title="<ランキング>",
+        step=3,
+        total=12,
+    )
+
+    assert banner.startswith("<div class='tour-banner'>")
+    assert banner.endswith("</div>")
+    assert "&lt;ランキング&gt;" in banner
+    assert "<span>基礎編 2 / 4</span>" in banner
+    assert "width: 25.00%;" in banner
+    assert "tour-progress" not in tour_banner_html(muted=True, description="再開")
+
+
+def test_escape_tooltip_matches_escape_and_newline_replace():
+    text = "a & b < c > d \"e\" 'f'\n次行"
+
+    assert _escape_tooltip(text) == html.escape(text, quote=True).replace("\n", "&#10;")
+
+
+def test_minify_style_blocks_only_touches_style_contents():
+    pytest.importorskip("rcssmin")
+    markup = "\n<style>\n.a{\n  color: red;\n}\n</style>\n<link rel='x'>\n"
+
+    assert minify_style_blocks(markup) == "\n<style>.a{color:red}</style>\n<link rel='x'>\n"
@@ -37,3 +37,16 @@ def test_slopes_snapshot_handles_small_series():
     assert a_slope == pytest.approx(1.0)
     assert np.isnan(b_slope)
 
+
+
+def test_slopes_snapshot_skips_unobserved_categories():
+    codes = pd.CategoricalDtype(["A", "B", "C"])
+    df = pd.DataFrame(
+        {
+            "product_code": pd.Series(["A", "A", "B", "B"], dtype=codes),
+            "month": [1, 2, 1, 2],
+            "year_sum": [1, 2, 3, 5],
+        }
+    )
+    snap = slopes_snapshot(df, n=0)
+    assert sorted(snap["product_code"]) == ["A", "B"]